@@ -12,149 +12,315 @@ Author: Gemma McLean
 Date: August 2025
 """
 
-from digit_controller import DigitController
+import argparse
+import asyncio
+from bounded_context import BoundedContext
+from concurrent.futures import ThreadPoolExecutor
+from ensemble import Ensemble, parse_choices, true_label
 import os
-from openai import OpenAI
+from response_cache import ResponseCache
+from session_engine import SessionEngine
+from session_journal import resume_state, SessionJournal
+from session_trace import Tracer
 import shared_functions
+from tactile_index import format_shortlist, INDEX_NAME, MIN_ACCURACY, TactileIndex
+from upload_cache import UploadCache
 
 MODEL = "gpt-5-mini"
 PROMPT_TYPE = "multi-choice"  # Can be multi-choice or open-ended
+STREAM = True  # Print GPT output as it arrives rather than when it is complete
+SAVE_CAPTURES = True  # Save captured frames to the captures folder (in the background)
+IMAGE_MODE = "inline"  # Can be inline (base64 in the request) or file (Files API)
+CAPTURE_MODE = "manual"  # Can be manual (ESC in live view) or auto (on contact)
+# Capture preprocessing settings, e.g. {"crop": (0, 40, 240, 240), "scale": 0.5}
+PREPROCESS = None
+RESPONSE_CACHE = None  # Can be None (off), record or replay
+# Bounded context settings for long sessions, e.g.
+# {"max_images": 4, "restart_every": 6, "old_images": "low", "max_turns": 12}
+# (None chains every turn)
+CONTEXT = None
+MULTI_SENSOR = False  # Connect every DIGIT and capture a frame from each per probe
+# Local k-NN classification of the captures with the index built by tactile_index.py,
+# shared with GPT as a hint, e.g. {"confidence": 0.8, "shortlist": 3}. Only used if
+# the index was validated with at least tactile_index.MIN_ACCURACY and has examples
+# of every possible object
+LOCAL_INDEX = None
+LOCAL_NOTE = (
+    "Hint from a local tactile classifier ({:.0%} accurate in validation, so it may "
+    "be wrong), from all captures so far: {}"
+)
+# Ensemble asked for the final prediction (command f), e.g.
+# {"models": ["gpt-5-mini", "gpt-5"], "samples": 3, "aggregate": "vote"}
+ENSEMBLE = None
 
 
-def chat_loop():
-    """Main loop for handling user input and generating responses."""
+def load_initial(client, upload_cache, trace=None):
+    """
+    Load the initial prompt and build the axis image input (inline or uploaded).
 
-    # Initialise previous_response_id to None for the first interaction
-    current_response_id = None
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        trace (Turn, optional): Records the upload stage timing.
 
-    # Initialise variables
-    conversation_list = []
-    first_time = True
-    capture_response = False
-    frame_counter = 1
+    Returns:
+        tuple: The initial prompt and the input_image content item of the axis image.
+    """
 
-    # Run until user exits
-    while True:
-        # When running for the first time, send the initial prompt
-        if first_time:
-            # Determine the prompt file based on the prompt type
-            if PROMPT_TYPE == "open-ended":
-                prompt_file = f"{current_dir}/active/initial/prompt.txt"
-            else:
-                prompt_file = f"{current_dir}/active/initial/prompt_multi_choice.txt"
+    # Determine the prompt file based on the prompt type
+    if PROMPT_TYPE == "open-ended":
+        prompt_file = f"{current_dir}/active/initial/prompt.txt"
+    else:
+        prompt_file = f"{current_dir}/active/initial/prompt_multi_choice.txt"
 
-            # Get initial prompt as a string from the txt file
-            with open(prompt_file, "r") as f:
-                initial_prompt = f.read()
+    # Get initial prompt as a string from the txt file
+    with open(prompt_file, "r") as f:
+        initial_prompt = f.read()
+
+    # Create the initial image input (inline or uploaded)
+    axis_file_path = f"{current_dir}/active/initial/digit_axis.jpg"
+    image = shared_functions.image_input(
+        client,
+        axis_file_path,
+        inline=IMAGE_MODE == "inline",
+        cache=upload_cache,
+        trace=trace,
+    )
+    return initial_prompt, image
+
+
+def capture_images(frame_counter, turn):
+    """
+    Capture a frame with the DIGIT sensor (or a time-aligned frame from each sensor
+    if MULTI_SENSOR is set) and build the image inputs (inline or uploaded).
 
-            # Create the initial image file
-            axis_file_path = f"{current_dir}/active/initial/digit_axis.jpg"
-            file_id = shared_functions.create_file(client, axis_file_path)
+    Args:
+        frame_counter (int): The current frame counter.
+        turn (Turn): Records the stage timings of the turn.
 
-            # Instead of appending entire initial prompt, just append a summary
-            conversation_list.append(f"Initial {PROMPT_TYPE} prompt and axis image sent.")
-            print("Sending initial prompt...")
-            print("GPT is thinking...")
+    Returns:
+        tuple: The input_image content items, a line naming the captured files and
+            the bytes of the captured frames.
+    """
 
-            # Create the response
-            response = shared_functions.create_response(
-                client, MODEL, initial_prompt, current_response_id, image_id=file_id
+    save_dir = None
+    if SAVE_CAPTURES:
+        save_dir = f"{output_dir}/captures"
+    auto = CAPTURE_MODE == "auto"
+    # The session engine has already shown the live view on the main thread
+    if MULTI_SENSOR:
+        frames = shared_functions.capture_set(
+            dc, frame_counter, save_dir, auto=auto, view=False, trace=turn
+        )
+    else:
+        frames = [
+            shared_functions.capture(
+                dc, frame_counter, save_dir, auto=auto, view=False, trace=turn
             )
+        ]
 
-            # Set the first_time flag to False
-            first_time = False
-        else:
-            # Get user input
-            user_input = input("You: ")
-
-            # Respond to user input (including shortcuts)
-            match user_input.lower():
-                # Exit the loop and terminate and save the conversation
-                case "x":
-                    print("Conversation terminated.")
-                    save_dir = f"{current_dir}/active"
-                    shared_functions.save_log(conversation_list, save_dir)
-                    break
-                # MOVE action shortcut
-                case "m":
-                    user_prompt = "MOVE action successfully executed."
-                # ROTATE action shortcut
-                case "r":
-                    user_prompt = "ROTATE action successfully executed."
-                # RESET action shortcut
-                case "re":
-                    user_prompt = "RESET action successfully executed."
-                # CAPTURE action shortcut
-                case "c":
-                    # Capture an image with the DIGIT sensor
-                    save_dir = f"{current_dir}/active/captures"
-                    frame_path = shared_functions.capture(dc, frame_counter, save_dir)
-                    # Set file_id
-                    file_id = shared_functions.create_file(client, frame_path)
-                    # Extract filename from path
-                    frame_filename = os.path.basename(frame_path)
-                    # Append frame filename to user prompt
-                    user_prompt = (
-                        f"CAPTURE action successfully executed.\n"
-                        f"captures/{frame_filename} attached."
-                    )
-                    # Increment frame counter and set capture flag
-                    frame_counter += 1
-                    capture_response = True
-                # Any other input is used as a normal prompt
-                # Example if an action can't be executed, user will explain why.
-                case _:
-                    user_prompt = user_input
-
-            # Append user prompt to conversation list
-            conversation_list.append(user_prompt)
-
-            print("GPT is thinking...")
-
-            # If it was a capture action
-            if capture_response:
-                # Create the response with the image file
-                response = shared_functions.create_response(
-                    client, MODEL, user_prompt, current_response_id, image_id=file_id
-                )
-                # Reset the flag
-                capture_response = False
-            # If it was any other input
-            else:
-                # Create the response with just text
-                response = shared_functions.create_response(
-                    client, MODEL, user_prompt, current_response_id
+    images = []
+    for frame_path, frame_bytes in frames:
+        # Shrink the frame to reduce image tokens
+        if PREPROCESS is not None:
+            with turn.span("encode"):
+                frame_bytes = shared_functions.preprocess_image(
+                    frame_bytes, **PREPROCESS
                 )
+        # Build the image input (inline or uploaded)
+        images.append(
+            shared_functions.image_input(
+                client,
+                frame_bytes,
+                inline=IMAGE_MODE == "inline",
+                cache=upload_cache,
+                filename=os.path.basename(frame_path),
+                trace=turn,
+            )
+        )
+
+    # Name the captured files (e.g. captures/frame_1.jpg attached.)
+    names = ", ".join(f"captures/{os.path.basename(p)}" for p, _ in frames)
+    return images, f"{names} attached.", [b for _, b in frames]
+
+
+def local_shortlist(frames, turn):
+    """
+    Classify captures with the local tactile index.
+
+    Args:
+        frames (list): The bytes of the captured frames.
+        turn (Turn): Records the local stage timing.
+
+    Returns:
+        str: The shortlist line added to the user prompt.
+    """
+
+    with turn.span("local"):
+        prediction = local_index.predict(frames)
+    label, confidence = prediction[0]
+    if confidence >= LOCAL_INDEX["confidence"]:
+        print(f"Local prediction: {label} (confidence {confidence:.2f})")
+    shortlist = format_shortlist(prediction, LOCAL_INDEX["shortlist"])
+    return LOCAL_NOTE.format(local_index.accuracy, shortlist)
+
+
+def chat_loop(resume=None, initial=None):
+    """
+    Run the session on the session engine until the user exits.
+
+    Args:
+        resume (dict, optional): The state of a previous session to continue
+            (see session_journal.resume_state).
+        initial (tuple, optional): The initial prompt and axis image input, if
+            already loaded (see load_initial).
+    """
 
-        # Update the current_response_id
-        current_response_id = response.id
+    # The frames of every capture so far, for the local classifier
+    probe_frames = []
 
-        # Print the response
-        print("GPT: ", response.output_text)
-        # Append the response to the conversation list
-        conversation_list.append(response.output_text)
+    def initial_turn(frame_counter, turn):
+        # Load the initial prompt and axis image unless done during startup
+        initial_prompt, image = initial or load_initial(client, upload_cache, turn)
+        # Instead of logging the entire initial prompt, just log a summary
+        summary = f"Initial {PROMPT_TYPE} prompt and axis image sent."
+        return initial_prompt, [image], summary, False
 
+    def capture_turn(user_input, frame_counter, turn):
+        # Capture an image with the DIGIT sensor
+        images, attached, frames = capture_images(frame_counter, turn)
+        user_prompt = "CAPTURE action successfully executed.\n"
+        # Share the local classifier's shortlist of every capture so far
+        if local_index is not None:
+            probe_frames.extend(frames)
+            user_prompt += local_shortlist(probe_frames, turn) + "\n"
+        return user_prompt + attached, images
 
-# Setup DIGIT sensor
-dc = DigitController()
+    # Optionally keep the context the model processes bounded
+    context = None
+    # The images of resumed turns are not kept, so a resumed session chains every turn
+    if CONTEXT is not None and resume is None:
+        context = BoundedContext(**CONTEXT)
 
-# If the DIGIT sensor is connected
-if dc.digit is not None:
-    # Set the stream to QVGA 30fps
-    dc.set_qvga_30fps()
+    engine = SessionEngine(
+        client,
+        MODEL,
+        tracer,
+        journal,
+        output_dir,
+        initial_turn,
+        capture_turn,
+        # In auto capture mode, capture straight away when GPT asks for it
+        auto_capture=CAPTURE_MODE == "auto",
+        stream=STREAM,
+        response_cache=response_cache,
+        context=context,
+        # Shown on the main thread before each capture in manual capture mode
+        live_view=None if CAPTURE_MODE == "auto" else dc.show_view_async,
+        settings={"image_mode": IMAGE_MODE, "preprocess": PREPROCESS},
+        ensemble=ensemble,
+        truth=truth,
+        read_input=input,
+    )
+    asyncio.run(engine.run(resume))
 
-    # Initialise OpenAI client
-    client = OpenAI()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Active exploration with GPT.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous session from its journal",
+    )
+    parser.add_argument(
+        "--object",
+        help="The object being explored, to score the final predictions",
+    )
+    args = parser.parse_args()
 
     # Get current directory of this script
     current_dir = os.path.dirname(os.path.abspath(__file__))
+    # Captures, the conversation log, usage and trace are saved here
+    output_dir = f"{current_dir}/active"
+
+    # Each turn is journalled as it happens, so a crashed session can be resumed
+    journal_path = f"{output_dir}/journal.jsonl"
+    resume = resume_state(journal_path) if args.resume else None
+    if args.resume and resume is None:
+        print("No previous session to resume. Starting a new session.")
+
+    # Start up in parallel: connect the sensor while the OpenAI client is created,
+    # its connection warmed up and the initial prompt and axis image prepared
+    with ThreadPoolExecutor() as executor:
+        sensor = executor.submit(shared_functions.connect_sensor, MULTI_SENSOR)
+        openai_client = executor.submit(shared_functions.create_client)
+
+        # Load the upload cache so identical images are not uploaded again
+        upload_cache = UploadCache(f"{current_dir}/upload_cache.json")
+
+        # A resumed session has already sent the initial prompt
+        initial = None
+        if resume is None:
+            initial = executor.submit(
+                lambda: load_initial(openai_client.result(), upload_cache)
+            )
+        dc = sensor.result()
+        client = openai_client.result()
+
+    # If the DIGIT sensor is connected
+    if dc.digit is not None:
+        # Optionally classify captures locally as well
+        local_index = None
+        if LOCAL_INDEX is not None:
+            local_index = TactileIndex.load(f"{current_dir}/{INDEX_NAME}")
+            prompt_file = f"{current_dir}/active/initial/prompt_multi_choice.txt"
+            with open(prompt_file, "r") as f:
+                missing = local_index.missing_choices(parse_choices(f.read()))
+            # A shortlist that cannot include the right object would mislead GPT
+            if not local_index.validated():
+                print(f"Local index not used: not validated to {MIN_ACCURACY:.0%}.")
+                local_index = None
+            elif missing:
+                print(f"Local index not used: no examples of {', '.join(missing)}.")
+                local_index = None
+
+        # The stage timings of each turn are appended to trace.jsonl
+        tracer = Tracer(f"{output_dir}/trace.jsonl", script="active")
+
+        # Optionally reuse responses to identical requests from previous sessions
+        response_cache = None
+        if RESPONSE_CACHE is not None:
+            response_cache = ResponseCache(
+                f"{current_dir}/response_cache.sqlite",
+                mode=RESPONSE_CACHE,
+                upload_cache=upload_cache,
+            )
 
-    # Create captures folder if it doesn't exist
-    if not os.path.exists(f"{current_dir}/active/captures"):
-        os.makedirs(f"{current_dir}/active/captures")
+        # Create captures folder if it doesn't exist
+        if SAVE_CAPTURES and not os.path.exists(f"{output_dir}/captures"):
+            os.makedirs(f"{output_dir}/captures")
+
+        # Optionally ask an ensemble for the final prediction, reading the possible
+        # objects from the multi-choice prompt
+        ensemble, truth = None, None
+        if ENSEMBLE is not None:
+            prompt_file = f"{current_dir}/active/initial/prompt_multi_choice.txt"
+            with open(prompt_file, "r") as f:
+                choices = parse_choices(f.read())
+            ensemble = Ensemble(
+                **ENSEMBLE, choices=choices, log_path=f"{output_dir}/ensemble.csv"
+            )
+            if args.object is not None:
+                truth = true_label(args.object, choices)
 
-    # Enter main loop
-    chat_loop()
+        # Start the journal (appending to it if resuming)
+        journal = SessionJournal(journal_path, resume=resume is not None)
 
-    # Disconnect the DIGIT sensor
-    dc.disconnect()
+        try:
+            # Enter main loop
+            chat_loop(resume, initial.result() if initial is not None else None)
+        finally:
+            # Make sure the journal is on disk, even after a crash
+            journal.close()
+            # Disconnect the DIGIT sensor
+            dc.disconnect()
@@ -0,0 +1,153 @@
+"""
+A collection of functions for running many OpenAI requests as a single Batch API job.
+The requests are written to a JSONL file, uploaded with the Files API and submitted
+as a batch. The batch is then polled with exponential backoff until it finishes and
+its output file is parsed back into the text output of each request.
+"""
+
+import json
+import time
+
+POLL_INITIAL = 5  # Seconds before the first status check
+POLL_FACTOR = 1.5  # Multiplier applied to the wait after each status check
+POLL_MAX = 300  # Maximum seconds between status checks
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def build_batch_jsonl(requests, endpoint):
+    """
+    Build the JSONL input of a batch job.
+
+    Args:
+        requests (list): A list of (custom_id, body) tuples, one per request.
+        endpoint (str): The API endpoint of every request, e.g. /v1/responses.
+
+    Returns:
+        bytes: The JSONL file content.
+    """
+
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": endpoint,
+                "body": body,
+            }
+        )
+        for custom_id, body in requests
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def submit_batch(client, requests, endpoint="/v1/responses"):
+    """
+    Upload the requests and submit them as a batch job.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        requests (list): A list of (custom_id, body) tuples, one per request.
+        endpoint (str): The API endpoint of every request.
+
+    Returns:
+        Batch: The created batch object.
+    """
+
+    # Upload the JSONL input file
+    input_file = client.files.create(
+        file=("batch_input.jsonl", build_batch_jsonl(requests, endpoint)),
+        purpose="batch",
+    )
+    # Create the batch job
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=endpoint,
+        completion_window="24h",
+    )
+
+
+def wait_for_batch(
+    client,
+    batch_id,
+    poll_initial=POLL_INITIAL,
+    poll_factor=POLL_FACTOR,
+    poll_max=POLL_MAX,
+):
+    """
+    Poll a batch job with exponential backoff until it finishes.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        batch_id (str): The ID of the batch job.
+        poll_initial (float): Seconds before the first status check.
+        poll_factor (float): Multiplier applied to the wait after each status check.
+        poll_max (float): Maximum seconds between status checks.
+
+    Returns:
+        Batch: The finished batch object.
+    """
+
+    wait = poll_initial
+    while True:
+        time.sleep(wait)
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(
+                f"Batch {batch_id} {batch.status}: "
+                f"{counts.completed}/{counts.total} completed, {counts.failed} failed."
+            )
+        else:
+            print(f"Batch {batch_id} {batch.status}.")
+        if batch.status in FINISHED_STATUSES:
+            return batch
+        wait = min(wait * poll_factor, poll_max)
+
+
+def get_output_text(body):
+    """
+    Extract the output text from the JSON body of a Responses API response.
+
+    Args:
+        body (dict): The response body.
+
+    Returns:
+        str: The concatenated output text.
+    """
+
+    texts = []
+    for item in body.get("output", []):
+        if item.get("type") == "message":
+            for part in item.get("content", []):
+                if part.get("type") == "output_text":
+                    texts.append(part["text"])
+    return "".join(texts)
+
+
+def get_batch_results(client, batch):
+    """
+    Download and parse the results of a finished batch job.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        batch (Batch): The finished batch object.
+
+    Returns:
+        dict: The output text (or an error message) of each request, keyed by custom_id.
+    """
+
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or response.get("body", {}).get("error")
+                results[record["custom_id"]] = f"ERROR: {error}"
+            else:
+                results[record["custom_id"]] = get_output_text(response["body"])
+    return results
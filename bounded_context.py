@@ -0,0 +1,179 @@
+"""
+Bounded context management for long exploration sessions.
+Chaining every turn with previous_response_id makes the model process (and bill) the
+whole session on every turn, including every capture at full detail, so later turns
+get slower and more expensive. BoundedContext caps this by restarting the chain every
+few turns from a compact summary of the session:
+    - The initial prompt turn is kept in full.
+    - The text of the most recent turns is kept. Older turns are folded into a short
+      text summary (the first words of each message), and the oldest of those are
+      eventually dropped, so a restart does not grow with the length of the session.
+    - Only the most recent images are kept at full detail. Older images are sent at
+      low detail or replaced by a short text note.
+"""
+
+from collections import deque
+
+DEFAULT_MAX_IMAGES = 4  # Most recent images kept at full detail
+DEFAULT_RESTART_EVERY = 6  # Turns chained with previous_response_id between restarts
+DEFAULT_MAX_TURNS = 12  # Most recent turns kept after the initial prompt
+SUMMARY_CHARS = 160  # Characters of each message kept in the summary of a turn
+OLD_IMAGE_NOTE = "[Earlier tactile image removed to save context.]"
+SUMMARY_NOTE = "Summary of earlier turns (images removed to save context):\n{}"
+
+
+class BoundedContext:
+    """
+    Rewrites create_response requests so the context of a session stays bounded.
+    """
+
+    def __init__(
+        self,
+        max_images=DEFAULT_MAX_IMAGES,
+        restart_every=DEFAULT_RESTART_EVERY,
+        old_images="low",
+        max_turns=DEFAULT_MAX_TURNS,
+    ):
+        """
+        Initialise the context.
+
+        Args:
+            max_images (int): The most recent images kept at full detail.
+            restart_every (int): Turns chained with previous_response_id before the
+                chain is restarted from a summary.
+            old_images (str): What happens to older images, either low (sent at low
+                detail) or text (replaced by a note).
+            max_turns (int): The most recent turns kept after the initial prompt.
+                Older turns are folded into the summary, which keeps as many.
+        """
+
+        self.max_images = max_images
+        self.restart_every = restart_every
+        self.old_images = old_images
+        self.max_turns = max_turns
+        self.turns = []
+        self.summary = deque(maxlen=max_turns)
+        self._chain_length = 0
+        self._pending = None
+        # Whether the last prepared request restarts the chain
+        self._restarting = False
+
+    # --- Private helpers ---
+    def _downgrade(self, item):
+        """
+        Downgrade an older image content item.
+
+        Args:
+            item (dict): The input_image content item.
+
+        Returns:
+            dict: The low detail image or the text note that replaces it.
+        """
+
+        if self.old_images == "text":
+            return {"type": "input_text", "text": OLD_IMAGE_NOTE}
+        return {**item, "detail": "low"}
+
+    def _fold(self, turn):
+        """
+        Summarise a turn in a line of text.
+
+        Args:
+            turn (tuple): The content of the user message and the output text.
+
+        Returns:
+            str: The summary of the turn.
+        """
+
+        content, output_text = turn
+        text = " ".join(
+            item["text"] for item in content if item.get("type") == "input_text"
+        )
+        user = " ".join(text.split())[:SUMMARY_CHARS]
+        gpt = " ".join((output_text or "").split())[:SUMMARY_CHARS]
+        return f"- User: {user} GPT: {gpt}"
+
+    def _summary_input(self, content):
+        """
+        Build the input that restarts the chain: the initial prompt, the summary of
+        older turns and the most recent turns, with older images downgraded,
+        followed by the new user message.
+
+        Args:
+            content (list): The content of the new user message.
+
+        Returns:
+            list: The input list for the Responses API.
+        """
+
+        anchor, anchor_output = self.turns[0]
+        history = self.turns[1:] + [(content, None)]
+
+        # Count images from the newest so only the most recent stay at full detail
+        newest_first = []
+        remaining = self.max_images
+        for turn_content, output_text in reversed(history):
+            kept = []
+            for item in reversed(turn_content):
+                if item.get("type") == "input_image":
+                    if remaining > 0:
+                        remaining -= 1
+                    else:
+                        item = self._downgrade(item)
+                kept.append(item)
+            newest_first.append((kept[::-1], output_text))
+
+        messages = [
+            {"role": "user", "content": anchor},
+            {"role": "assistant", "content": anchor_output},
+        ]
+        if self.summary:
+            note = SUMMARY_NOTE.format("\n".join(self.summary))
+            messages.append({"role": "user", "content": note})
+        for turn_content, output_text in reversed(newest_first):
+            messages.append({"role": "user", "content": turn_content})
+            if output_text is not None:
+                messages.append({"role": "assistant", "content": output_text})
+        return messages
+
+    # --- Public methods ---
+    def prepare(self, request):
+        """
+        Rewrite a request, restarting the chain from a summary when it is due. The
+        chain only counts as restarted once the response arrives (see update), so a
+        restart that is cancelled or fails is tried again on the next request.
+
+        Args:
+            request (dict): The keyword arguments of responses.create.
+
+        Returns:
+            dict: The request to send.
+        """
+
+        content = request["input"][0]["content"]
+        self._pending = content
+        self._restarting = bool(self.turns) and self._chain_length >= self.restart_every
+        if not self._restarting:
+            return request
+
+        return {
+            **request,
+            "input": self._summary_input(content),
+            "previous_response_id": None,
+        }
+
+    def update(self, response):
+        """
+        Record the response to the last prepared request.
+
+        Args:
+            response (Response): The response.
+        """
+
+        self.turns.append((self._pending, response.output_text))
+        # A restart starts a new chain with this response
+        self._chain_length = 1 if self._restarting else self._chain_length + 1
+        self._restarting = False
+        # Fold the turns beyond the most recent into the summary
+        while len(self.turns) - 1 > self.max_turns:
+            self.summary.append(self._fold(self.turns.pop(1)))
@@ -0,0 +1,341 @@
+"""
+A microbenchmark suite for the per-capture hot path, runnable without a sensor.
+The DIGIT is simulated by a FakeDigitController playing back recorded frames (or
+synthetic frames with --synthetic), unpaced so that the frame rate does not limit
+the benchmark. Each stage of a capture is benchmarked on its own:
+    - grab: reading a frame from the device.
+    - encode: encoding a frame as a JPEG (DigitController.get_frame_bytes).
+    - save_frame: grabbing, encoding and writing a frame to disk
+      (DigitController.save_frame).
+    - read: reading a saved frame back for upload (as create_file does).
+    - payload: building the request for an inline frame and serialising it to JSON
+      (as create_response does).
+    - chain: the whole capture -> create_file -> create_response chain against the
+      local mock server, which runs in its own process so that its work is not
+      measured.
+
+For each stage it reports operations per second, the memory blocks allocated per
+operation (still alive when it returns, including its result), and the peak memory
+allocated during an operation. Results can be saved and compared with a baseline, so
+a regression fails the run:
+    python3 capture_bench.py --save bench.json
+    python3 capture_bench.py --baseline bench.json
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import cv2
+from fake_digit import FakeDigitController, find_frames
+import json
+import multiprocessing
+import numpy as np
+import os
+import resource
+import shared_functions
+import sys
+import tempfile
+import time
+import tracemalloc
+
+MODEL = "gpt-5-mini"
+BENCH_SECONDS = 1.0  # Seconds each stage is timed for
+ROUNDS = 5  # Timing rounds per stage, the fastest of which is reported
+WARMUP_OPS = 3  # Operations run before timing each stage
+MEMORY_OPS = 5  # Operations traced to measure the memory of each stage
+SYNTHETIC_FRAMES = 8  # Number of synthetic frames to play back
+REGRESSION_THRESHOLD = 0.2  # Relative change from the baseline that fails the run
+DEFAULT_CAPTURES = "active/results/banana/captures"
+
+
+def synthetic_frames(directory, count=SYNTHETIC_FRAMES, seed=0):
+    """
+    Write synthetic tactile frames: a QVGA background with a soft contact blob and
+    sensor noise, so that they compress like real frames.
+
+    Args:
+        directory (str): The directory to write the frames to.
+        count (int): The number of frames.
+        seed (int): The random seed.
+
+    Returns:
+        list: The paths of the frames.
+    """
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:320, 0:240]
+    paths = []
+    for i in range(count):
+        cy, cx = rng.uniform(80, 240), rng.uniform(60, 180)
+        blob = np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * rng.uniform(20, 50) ** 2))
+        background = np.array([120, 140, 160]) + 30 * (y / 320)[..., None]
+        frame = background + 80 * blob[..., None] + rng.normal(0, 4, (320, 240, 3))
+        path = os.path.join(directory, f"frame_{i + 1}.jpg")
+        cv2.imwrite(path, np.clip(frame, 0, 255).astype(np.uint8))
+        paths.append(path)
+    return paths
+
+
+def _serve_mock(ports):
+    """
+    Run the mock OpenAI server (in its own process).
+
+    Args:
+        ports (multiprocessing.Queue): Receives the port the server listens on.
+    """
+
+    import mock_openai_server
+
+    server = mock_openai_server.make_server(port=0)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def start_mock():
+    """
+    Start the mock OpenAI server in a separate process.
+
+    Returns:
+        tuple: The server process and its base URL.
+    """
+
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_mock, args=(ports,), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ports.get(timeout=10)}/v1"
+
+
+def get_stages(dc, client, work_dir):
+    """
+    Build the benchmarked stages.
+
+    Args:
+        dc (FakeDigitController): The fake DIGIT controller.
+        client (OpenAI): The OpenAI client of the mock server.
+        work_dir (str): A directory for saved frames.
+
+    Returns:
+        dict: A function running one operation of each stage, by stage name.
+    """
+
+    frame = dc.digit.get_frame()
+    frame_bytes = dc.get_frame_bytes(".jpg", frame=frame)
+    frame_path = os.path.join(work_dir, "frame_0.jpg")
+    with open(frame_path, "wb") as f:
+        f.write(frame_bytes)
+    counter = iter(range(1, sys.maxsize))
+
+    def payload():
+        image = shared_functions.image_input(
+            client, frame_bytes, inline=True, filename="frame_0.jpg"
+        )
+        request = shared_functions._build_request(
+            MODEL, "CAPTURE action successfully executed.", None, None, [image]
+        )
+        return json.dumps(request)
+
+    def chain():
+        n = next(counter)
+        _, image_bytes = shared_functions.capture(dc, n)
+        file_id = shared_functions.create_file(
+            client, image_bytes, filename=f"frame_{n}.jpg"
+        )
+        return shared_functions.create_response(
+            client,
+            MODEL,
+            f"CAPTURE action successfully executed.\nframe_{n}.jpg attached.",
+            None,
+            image_id=file_id,
+        )
+
+    return {
+        "grab": dc.digit.get_frame,
+        "encode": lambda: dc.get_frame_bytes(".jpg", frame=frame),
+        "save_frame": lambda: dc.save_frame(work_dir, next(counter) % 100),
+        "read": lambda: shared_functions._read_file(frame_path),
+        "payload": payload,
+        "chain": chain,
+    }
+
+
+def bench(function, seconds=BENCH_SECONDS):
+    """
+    Time a stage and measure its memory use.
+
+    Args:
+        function (callable): Runs one operation of the stage.
+        seconds (float): The time to run the stage for.
+
+    Returns:
+        dict: The operations per second and mean seconds per operation (of the
+            fastest round), memory blocks allocated per operation and peak bytes
+            allocated during an operation.
+    """
+
+    for _ in range(WARMUP_OPS):
+        function()
+
+    # Time as many operations as fit in each round, keeping the fastest round (the
+    # slower ones were held up by something else running)
+    best = 0.0
+    for _ in range(ROUNDS):
+        ops = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < seconds / ROUNDS:
+            function()
+            ops += 1
+        best = max(best, ops / elapsed)
+
+    # Trace a few operations, keeping each result until its blocks are counted
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    blocks, peak = [], 0
+    tracemalloc.start()
+    try:
+        for _ in range(MEMORY_OPS):
+            before = tracemalloc.take_snapshot().filter_traces(ignore)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            result = function()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+            after = tracemalloc.take_snapshot().filter_traces(ignore)
+            blocks.append(sum(s.count_diff for s in after.compare_to(before, "lineno")))
+            del result
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": best,
+        "mean": 1 / best,
+        "blocks": float(np.median(blocks)),
+        "peak": peak,
+    }
+
+
+def run_benchmarks(frame_paths, stages=None, seconds=BENCH_SECONDS):
+    """
+    Benchmark the capture path with a fake DIGIT and the mock server.
+
+    Args:
+        frame_paths (list): The paths of the frames the fake DIGIT plays back.
+        stages (list, optional): The stages to run (defaults to all of them).
+        seconds (float): The time to run each stage for.
+
+    Returns:
+        dict: The results of each stage (see bench).
+    """
+
+    process, base_url = start_mock()
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+    results = {}
+    # Hide the scripts' console output (e.g. Saved frame_N.jpg)
+    with tempfile.TemporaryDirectory() as work_dir, open(os.devnull, "w") as devnull:
+        with redirect_stdout(devnull):
+            client = shared_functions.create_client(warm_up=False)
+            # Unpaced, so frames are returned as fast as they are asked for
+            dc = FakeDigitController(frame_paths, fps=1e9)
+        try:
+            for name, function in get_stages(dc, client, work_dir).items():
+                if stages and name not in stages:
+                    continue
+                with redirect_stdout(devnull):
+                    results[name] = bench(function, seconds)
+                print_result(name, results[name])
+        finally:
+            client.close()
+            process.terminate()
+    return results
+
+
+def print_result(name, result, baseline=None):
+    """
+    Print the results of a stage, and the change from a baseline.
+
+    Args:
+        name (str): The stage.
+        result (dict): The results of the stage (see bench).
+        baseline (dict, optional): The baseline results of the stage.
+    """
+
+    line = (
+        f"{name:<12}{result['ops_per_sec']:>12.1f}{result['mean'] * 1e6:>12.1f}"
+        f"{result['blocks']:>10.0f}{result['peak'] / 1024:>11.1f}"
+    )
+    if baseline is not None:
+        change = result["ops_per_sec"] / baseline["ops_per_sec"] - 1
+        line += f"{change * 100:>+9.1f}%"
+    print(line)
+
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare results with a baseline.
+
+    Args:
+        results (dict): The results of each stage.
+        baseline (dict): The baseline results of each stage.
+        threshold (float): The relative change that counts as a regression.
+
+    Returns:
+        list: A description of each regression.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: ops/sec fell from {base['ops_per_sec']:.1f}")
+        if result["blocks"] > base["blocks"] * (1 + threshold) + 1:
+            regressions.append(f"{name}: blocks/op rose from {base['blocks']:.0f}")
+        if result["peak"] > base["peak"] * (1 + threshold) + 1024:
+            regressions.append(f"{name}: peak memory rose from {base['peak']} bytes")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the capture path.")
+    parser.add_argument(
+        "--captures",
+        default=DEFAULT_CAPTURES,
+        help="Folder of recorded frames to play back",
+    )
+    parser.add_argument(
+        "--synthetic", action="store_true", help="Play back synthetic frames instead"
+    )
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--seconds", type=float, default=BENCH_SECONDS)
+    parser.add_argument("--save", help="Save the results to a JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved by --save")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as frames_dir:
+        if args.synthetic:
+            frame_paths = synthetic_frames(frames_dir)
+        else:
+            frame_paths = find_frames(args.captures)
+        if not frame_paths:
+            sys.exit(f"No frames found in {args.captures}.")
+
+        header = f"{'stage':<12}{'ops/sec':>12}{'mean µs':>12}{'blocks':>10}"
+        print(header + f"{'peak KiB':>11}")
+        results = run_benchmarks(frame_paths, args.stages, args.seconds)
+    # On Linux ru_maxrss is in KiB
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nPeak resident memory: {peak_rss:.1f} MiB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        print("\nChange from baseline:")
+        for name, result in results.items():
+            print_result(name, result, baseline.get(name))
+        regressions = find_regressions(results, baseline)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
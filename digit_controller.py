@@ -1,5 +1,40 @@
+import asyncio
+import cv2
 from digit_interface.digit import Digit
 from digit_interface.digit_handler import DigitHandler
+import numpy as np
+import threading
+import time
+
+GRABBER_BUFFER_SIZE = 30  # Number of recent frames kept by the background grabber
+GRAB_RETRY_DELAY = 0.05  # Seconds the grabber waits after a failed grab, doubled
+GRAB_RETRY_MAX = 1.0  # Longest wait after a failed grab in seconds
+GRAB_MAX_FAILURES = 10  # Failed grabs in a row that stop the grabber (e.g. unplugged)
+CONTACT_DOWNSAMPLE = 4  # Stride used to downsample frames for contact detection
+CONTACT_THRESHOLD = 10.0  # Mean abs difference from the reference that means contact
+CONTACT_STABILITY = 2.0  # Max mean abs frame-to-frame change of a stable contact
+CONTACT_STABLE_FRAMES = 5  # Consecutive stable contact frames needed to capture
+VIEW_INTERVAL = 0.01  # Seconds between refreshes of a live view run on an event loop
+
+
+async def show_window_async(window, read_frame, interval=VIEW_INTERVAL):
+    """
+    Show a live view until ESC is pressed, refreshing it between the other work of
+    the event loop. OpenCV windows must be driven from the main thread, which runs
+    the event loop, so this keeps the view there without holding up the loop.
+
+    Args:
+        window (str): The name of the window.
+        read_frame (callable): Returns the frame to show.
+        interval (float): Seconds between refreshes of the view.
+    """
+
+    while True:
+        cv2.imshow(window, read_frame())
+        if cv2.waitKey(1) == 27:
+            break
+        await asyncio.sleep(interval)
+    cv2.destroyWindow(window)
 
 
 class DigitController:
@@ -10,15 +45,35 @@ class DigitController:
     Date: August 2025
     """
 
-    def __init__(self):
+    def __init__(self, serial=None):
         """
         Initialise the DigitController to manage DIGIT connections and streams.
         Auto connects to the first available DIGIT device.
+
+        Args:
+            serial (str, optional): The serial number of the DIGIT device to connect
+                to instead of the first available one.
         """
 
         # Connect and store the instance and serial number
+        self._serial = serial
         self.digit = self._connect_to_digit()
 
+        # Background grabber state (see start_grabber)
+        self._grabber = None
+        self._grabbing = threading.Event()
+        self._lock = threading.Lock()
+        self._frames = None
+        self._timestamps = None
+        self._frame_count = 0
+        # Why the grabber stopped by itself (None while it is healthy)
+        self._grab_error = None
+
+        # Contact detection state (see set_reference_frame)
+        self._reference = None
+        self._contact_armed = True
+        self._contact_checked = -1
+
     # --- Private helpers ---
     def _check_for_digits(self):
         """
@@ -36,7 +91,8 @@ class DigitController:
 
     def _connect_to_digit(self):
         """
-        Connect to the first available DIGIT device.
+        Connect to the first available DIGIT device (or the one with the requested
+        serial number).
 
         Returns:
             tuple: A tuple containing the DIGIT instance and its serial number.
@@ -46,8 +102,8 @@ class DigitController:
         digits = self._check_for_digits()
         if digits:
             try:
-                # Get the first digit's serial number
-                serial = digits[0]["serial"]
+                # Get the first digit's serial number (unless one was requested)
+                serial = self._serial or digits[0]["serial"]
                 # Create a Digit instance with the serial number
                 digit = Digit(serial, "Single_Digit")
                 # Connect to the DIGIT device
@@ -62,16 +118,114 @@ class DigitController:
             print("No DIGIT devices found.")
             return None
 
+    def _grab_loop(self):
+        """
+        Grab frames into the ring buffer until the grabber is stopped, or until
+        GRAB_MAX_FAILURES grabs in a row fail (e.g. the sensor was unplugged).
+        """
+
+        failures = 0
+        while self._grabbing.is_set():
+            try:
+                # Blocks until the next frame is available at the stream fps
+                frame = self.digit.get_frame()
+            except Exception as e:
+                failures += 1
+                if failures >= GRAB_MAX_FAILURES:
+                    # Stop, so frames are not read from a stale buffer (see
+                    # _check_grabber)
+                    print(f"Frame grabber stopped after {failures} failed grabs: {e}")
+                    self._grab_error = e
+                    self._grabbing.clear()
+                    return
+                print(f"Failed to grab frame: {e}")
+                time.sleep(min(GRAB_RETRY_MAX, GRAB_RETRY_DELAY * 2 ** (failures - 1)))
+                continue
+            failures = 0
+            timestamp = time.monotonic()
+            with self._lock:
+                index = self._frame_count % len(self._frames)
+                np.copyto(self._frames[index], frame)
+                self._timestamps[index] = timestamp
+                self._frame_count += 1
+
+    def _check_grabber(self):
+        """
+        Raise the error that stopped the grabber, if it stopped by itself.
+
+        Raises:
+            RuntimeError: If the grabber stopped after repeated failed grabs.
+        """
+
+        if self._grab_error is not None:
+            raise RuntimeError(f"Frame grabber stopped: {self._grab_error}")
+
+    @staticmethod
+    def _downsample(frames):
+        """
+        Downsample frames to small greyscale images for cheap comparisons.
+
+        Args:
+            frames (np.ndarray): The frames, shaped (..., height, width, channels).
+
+        Returns:
+            np.ndarray: The downsampled greyscale frames as float32.
+        """
+
+        step = CONTACT_DOWNSAMPLE
+        return frames[..., ::step, ::step, :].mean(axis=-1, dtype=np.float32)
+
+    @staticmethod
+    def _score_frames(frames):
+        """
+        Score frames by sharpness, penalising frames captured mid-motion.
+
+        Sharpness is the variance of the Laplacian of each greyscale frame. Motion is
+        the mean absolute difference between each frame and the previous one.
+
+        Args:
+            frames (np.ndarray): The frames, shaped (n, height, width, channels).
+
+        Returns:
+            np.ndarray: The score of each frame (higher is better).
+        """
+
+        grey = frames.mean(axis=3, dtype=np.float32)
+        laplacian = (
+            4 * grey[:, 1:-1, 1:-1]
+            - grey[:, :-2, 1:-1]
+            - grey[:, 2:, 1:-1]
+            - grey[:, 1:-1, :-2]
+            - grey[:, 1:-1, 2:]
+        )
+        sharpness = laplacian.var(axis=(1, 2))
+        # The first frame has no predecessor, so reuse the next frame's motion
+        motion = np.abs(np.diff(grey, axis=0)).mean(axis=(1, 2))
+        motion = np.concatenate((motion[:1], motion)) if len(motion) else np.zeros(1)
+        return sharpness / (1.0 + motion)
+
+    # --- Public methods ---
     def set_qvga_30fps(self):
         """Set the DIGIT device stream to QVGA resolution at 30 FPS."""
 
+        self.set_stream("QVGA", "30fps")
+
+    def set_stream(self, resolution, fps):
+        """
+        Set the DIGIT device stream to one of the presets in Digit.STREAMS.
+
+        Args:
+            resolution (str): The resolution, QVGA (320x240) or VGA (640x480).
+            fps (str): The frame rate, 60fps or 30fps for QVGA and 30fps or 15fps
+                for VGA.
+        """
+
         if self.digit:
             # Set stream resolution and fps
-            # QVGA resolution
-            self.digit.set_resolution({"resolution": {"width": 320, "height": 240}})
-            # 30 FPS
-            self.digit.set_fps(Digit.STREAMS["QVGA"]["fps"]["30fps"])
-            print("Set stream to QVGA 30fps.")
+            stream = Digit.STREAMS[resolution]
+            self.digit.set_resolution(stream)
+            self.digit.set_fps(stream["fps"][fps])
+            print(f"Set stream to {resolution} {fps}.")
         else:
             print("No DIGIT device connected. Cannot set stream.")
 
@@ -85,14 +239,299 @@ class DigitController:
         """
 
         if self.digit:
-            self.digit.save_frame(f"{save_dir}/frame_{frame_num}.jpg")
+            if self.is_grabbing():
+                # Avoid reading the device from two threads at once
+                cv2.imwrite(f"{save_dir}/frame_{frame_num}.jpg", self.latest_frame())
+            else:
+                self.digit.save_frame(f"{save_dir}/frame_{frame_num}.jpg")
             print(f"Saved {save_dir}/frame_{frame_num}.jpg")
         else:
             print("No DIGIT device connected. Cannot save frame.")
 
+    def start_grabber(self, buffer_size=GRABBER_BUFFER_SIZE):
+        """
+        Start a background thread that keeps the most recent frames in a ring buffer.
+        The buffer is preallocated so memory use stays constant.
+
+        Args:
+            buffer_size (int): The number of recent frames to keep.
+        """
+
+        if not self.digit:
+            print("No DIGIT device connected. Cannot start grabber.")
+            return
+        if self._grabber is not None:
+            return
+
+        # Use the first frame to size the buffer
+        frame = self.digit.get_frame()
+        # The sensor is not touching anything yet, so use it as the contact reference
+        self.set_reference_frame(frame)
+        self._frames = np.empty((buffer_size,) + frame.shape, dtype=frame.dtype)
+        self._timestamps = np.zeros(buffer_size)
+        self._frames[0] = frame
+        self._timestamps[0] = time.monotonic()
+        self._frame_count = 1
+
+        # Start grabbing
+        self._grab_error = None
+        self._grabbing.set()
+        self._grabber = threading.Thread(target=self._grab_loop, daemon=True)
+        self._grabber.start()
+        print(f"Started frame grabber with a {buffer_size} frame buffer.")
+
+    def stop_grabber(self):
+        """Stop the background grabber thread."""
+
+        if self._grabber is not None:
+            self._grabbing.clear()
+            self._grabber.join()
+            self._grabber = None
+
+    def is_grabbing(self):
+        """
+        Check whether the background grabber is running.
+
+        Returns:
+            bool: True if the grabber is running.
+        """
+
+        return self._grabber is not None
+
+    def recent_frames(self, n):
+        """
+        Return copies of the most recent frames from the ring buffer.
+
+        Args:
+            n (int): The maximum number of frames to return.
+
+        Returns:
+            tuple: The frames (oldest first) and their monotonic timestamps.
+
+        Raises:
+            RuntimeError: If the grabber stopped after repeated failed grabs.
+        """
+
+        self._check_grabber()
+        with self._lock:
+            size = len(self._frames)
+            n = min(n, size, self._frame_count)
+            indices = np.arange(self._frame_count - n, self._frame_count) % size
+            # Fancy indexing copies, so the grabber can keep writing
+            return self._frames[indices], self._timestamps[indices]
+
+    def latest_frame(self):
+        """
+        Return a copy of the most recent frame from the ring buffer.
+
+        Returns:
+            np.ndarray: The most recent frame.
+        """
+
+        frames, _ = self.recent_frames(1)
+        return frames[0]
+
+    def best_frame(self, n):
+        """
+        Pick the best of the most recent frames by sharpness and lack of motion.
+
+        Args:
+            n (int): The number of recent frames to choose from.
+
+        Returns:
+            np.ndarray: The best frame.
+
+        Raises:
+            RuntimeError: If the grabber stopped after repeated failed grabs.
+        """
+
+        frames, _ = self.recent_frames(n)
+        return frames[int(np.argmax(self._score_frames(frames)))]
+
+    def set_reference_frame(self, frame=None):
+        """
+        Record a no-contact reference frame for contact detection.
+
+        Args:
+            frame (np.ndarray, optional): The reference frame (defaults to the current
+                frame). The sensor must not be touching anything.
+        """
+
+        if frame is None:
+            if self.is_grabbing():
+                frame = self.latest_frame()
+            else:
+                frame = self.digit.get_frame()
+        self._reference = self._downsample(frame)
+
+    def contact_scores(self, frames):
+        """
+        Score how much each frame differs from the no-contact reference frame.
+
+        Args:
+            frames (np.ndarray): The frames, shaped (n, height, width, channels).
+
+        Returns:
+            np.ndarray: The mean absolute difference of each frame from the reference.
+        """
+
+        return np.abs(self._downsample(frames) - self._reference).mean(axis=(1, 2))
+
+    def poll_contact(
+        self,
+        threshold=CONTACT_THRESHOLD,
+        stability=CONTACT_STABILITY,
+        stable_frames=CONTACT_STABLE_FRAMES,
+    ):
+        """
+        Check the newest frames once for a stable contact (see wait_for_contact).
+
+        Args:
+            threshold (float): Mean abs difference from the reference meaning contact.
+            stability (float): Max mean abs frame-to-frame change of a stable contact.
+            stable_frames (int): Consecutive stable contact frames needed to capture.
+
+        Returns:
+            tuple: The best frame of the stable contact and its monotonic timestamp.
+            None: If there is no stable contact (or no new frame since the last
+                check).
+
+        Raises:
+            RuntimeError: If the grabber stopped after repeated failed grabs.
+        """
+
+        self._check_grabber()
+        # Only check again once a new frame has arrived
+        if self._frame_count == self._contact_checked:
+            return None
+        self._contact_checked = self._frame_count
+
+        frames, timestamps = self.recent_frames(stable_frames)
+        contact = self.contact_scores(frames)
+        if not self._contact_armed:
+            # Wait for the sensor to be lifted off after the previous capture
+            self._contact_armed = contact[-1] < threshold
+            return None
+        if len(frames) < stable_frames or not (contact > threshold).all():
+            return None
+        small = self._downsample(frames)
+        change = np.abs(np.diff(small, axis=0)).mean(axis=(1, 2))
+        if not (change < stability).all():
+            return None
+        self._contact_armed = False
+        best = int(np.argmax(self._score_frames(frames)))
+        return frames[best], timestamps[best]
+
+    def disarm_contact(self):
+        """Require the sensor to be lifted off before it detects contact again."""
+
+        self._contact_armed = False
+
+    def wait_for_contact(
+        self,
+        threshold=CONTACT_THRESHOLD,
+        stability=CONTACT_STABILITY,
+        stable_frames=CONTACT_STABLE_FRAMES,
+        timeout=None,
+    ):
+        """
+        Block until contact begins and stabilises, then return the best contact frame.
+
+        Contact is when a frame differs from the reference frame by more than the
+        threshold. It is stable once stable_frames consecutive frames are in contact
+        and change by less than the stability threshold between frames. After a
+        capture, the sensor must be lifted off (no contact) before the next capture,
+        so one touch only triggers one capture.
+
+        Args:
+            threshold (float): Mean abs difference from the reference meaning contact.
+            stability (float): Max mean abs frame-to-frame change of a stable contact.
+            stable_frames (int): Consecutive stable contact frames needed to capture.
+            timeout (float, optional): Seconds to wait before giving up.
+
+        Returns:
+            np.ndarray: The best frame of the stable contact.
+            None: If the grabber is not running or the timeout passed.
+
+        Raises:
+            RuntimeError: If the grabber stopped after repeated failed grabs.
+        """
+
+        if not self.is_grabbing():
+            print("Frame grabber not running. Cannot detect contact.")
+            return None
+
+        start = time.monotonic()
+        while timeout is None or time.monotonic() - start < timeout:
+            contact = self.poll_contact(threshold, stability, stable_frames)
+            if contact is not None:
+                return contact[0]
+            time.sleep(0.005)
+        return None
+
+    def show_view(self):
+        """
+        Show the live view until ESC is pressed.
+        Reads from the ring buffer if the grabber is running, otherwise from the device.
+        """
+
+        if not self.is_grabbing():
+            self.digit.show_view()
+            return
+
+        window = f"Digit View {self.digit.serial}"
+        while True:
+            cv2.imshow(window, self.latest_frame())
+            if cv2.waitKey(1) == 27:
+                break
+        cv2.destroyWindow(window)
+
+    async def show_view_async(self):
+        """
+        Show the live view until ESC is pressed, from an event loop on the main thread
+        (see show_window_async). Without the grabber, the device's own blocking live
+        view is shown instead.
+        """
+
+        if not self.is_grabbing():
+            self.digit.show_view()
+            return
+        await show_window_async(f"Digit View {self.digit.serial}", self.latest_frame)
+
+    def get_frame_bytes(self, ext=".jpg", frame=None):
+        """
+        Encode a video frame from the DIGIT device in memory.
+
+        Args:
+            ext (str): The image format extension to encode to (.jpg or .png).
+            frame (np.ndarray, optional): The frame to encode (defaults to the current
+                frame, taken from the ring buffer if the grabber is running).
+
+        Returns:
+            bytes: The encoded image.
+            None: If no DIGIT device is connected or encoding failed.
+        """
+
+        if self.digit:
+            if frame is None:
+                if self.is_grabbing():
+                    frame = self.latest_frame()
+                else:
+                    frame = self.digit.get_frame()
+            success, buffer = cv2.imencode(ext, frame)
+            if success:
+                return buffer.tobytes()
+            print(f"Failed to encode frame as {ext}.")
+        else:
+            print("No DIGIT device connected. Cannot grab frame.")
+        return None
+
     def disconnect(self):
         """Disconnect the DIGIT device."""
 
+        # Stop grabbing before the device goes away
+        self.stop_grabber()
+
         if self.digit:
             try:
                 self.digit.disconnect()
@@ -0,0 +1,202 @@
+"""
+A pool of DIGIT sensors (e.g. the fingers of a gripper) used as one.
+Every detected sensor is connected in parallel and runs its own background frame
+grabber, so one probe can capture a time-aligned set of frames (one per sensor) and
+send them to GPT as a single multi-image turn.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from digit_controller import DigitController, GRABBER_BUFFER_SIZE, show_window_async
+from digit_interface.digit_handler import DigitHandler
+import numpy as np
+import time
+
+ALIGN_WINDOW = 5  # Recent frames of each device searched for time-aligned frames
+
+
+class DigitPool:
+    """
+    Manages several DIGIT devices, each with its own DigitController.
+    """
+
+    def __init__(self, serials=None):
+        """
+        Connect to every available DIGIT device in parallel.
+
+        Args:
+            serials (list, optional): The serial numbers of the devices to connect to
+                (defaults to every detected device).
+        """
+
+        if serials is None:
+            serials = [d["serial"] for d in DigitHandler.list_digits() or []]
+
+        with ThreadPoolExecutor(max(len(serials), 1)) as executor:
+            controllers = list(executor.map(self._make_controller, serials))
+        # Keep only the devices that connected
+        self.controllers = [dc for dc in controllers if dc.digit is not None]
+        print(f"Connected to {len(self.controllers)} of {len(serials)} DIGITs.")
+
+    # --- Private helpers ---
+    def _make_controller(self, serial):
+        """
+        Create the controller of one device.
+
+        Args:
+            serial (str): The serial number of the device.
+
+        Returns:
+            DigitController: The controller.
+        """
+
+        return DigitController(serial)
+
+    def _each(self, method, *args):
+        """
+        Call a method of every controller in parallel.
+
+        Args:
+            method (str): The name of the DigitController method.
+            *args: The arguments to pass.
+
+        Returns:
+            list: The result of each call, in controller order.
+        """
+
+        if not self.controllers:
+            return []
+        with ThreadPoolExecutor(len(self.controllers)) as executor:
+            return list(
+                executor.map(lambda dc: getattr(dc, method)(*args), self.controllers)
+            )
+
+    # --- Public methods ---
+    @property
+    def digit(self):
+        """
+        The primary (first) DIGIT device, so a pool can be checked for a connection
+        like a DigitController.
+
+        Returns:
+            Digit: The primary device.
+            None: If no devices are connected.
+        """
+
+        return self.controllers[0].digit if self.controllers else None
+
+    def serials(self):
+        """
+        Return the serial numbers of the connected devices.
+
+        Returns:
+            list: The serial numbers, in controller order.
+        """
+
+        return [dc.digit.serial for dc in self.controllers]
+
+    def set_qvga_30fps(self):
+        """Set every DIGIT device stream to QVGA resolution at 30 FPS."""
+
+        self._each("set_qvga_30fps")
+
+    def set_stream(self, resolution, fps):
+        """
+        Set every DIGIT device stream to one of the presets in Digit.STREAMS.
+
+        Args:
+            resolution (str): The resolution, QVGA or VGA.
+            fps (str): The frame rate, e.g. 60fps.
+        """
+
+        self._each("set_stream", resolution, fps)
+
+    def start_grabbers(self, buffer_size=GRABBER_BUFFER_SIZE):
+        """
+        Start the background frame grabber of every device.
+
+        Args:
+            buffer_size (int): The number of recent frames each grabber keeps.
+        """
+
+        self._each("start_grabber", buffer_size)
+
+    def aligned_frames(self, target=None):
+        """
+        Return one frame per device, all taken as close to the same time as possible.
+
+        The target time defaults to the newest time every grabber has reached. From
+        each ring buffer, the frame closest to that time is taken.
+
+        Args:
+            target (float, optional): The monotonic time to align the frames at (e.g.
+                the timestamp of a contact frame), searched for in the whole buffer.
+
+        Returns:
+            tuple: The frames (in controller order) and the largest difference
+                between their timestamps, in seconds.
+        """
+
+        window = ALIGN_WINDOW if target is None else GRABBER_BUFFER_SIZE
+        recent = [dc.recent_frames(window) for dc in self.controllers]
+        if target is None:
+            target = min(timestamps[-1] for _, timestamps in recent)
+        frames, times = [], []
+        for buffer, timestamps in recent:
+            index = int(np.argmin(np.abs(timestamps - target)))
+            frames.append(buffer[index])
+            times.append(timestamps[index])
+        return frames, max(times) - min(times)
+
+    def wait_for_contact(self, timeout=None):
+        """
+        Block until any device makes stable contact. Every device must then be
+        lifted off before the next contact is detected.
+
+        Args:
+            timeout (float, optional): Seconds to wait before giving up.
+
+        Returns:
+            tuple: The index of the device in contact, its best contact frame and
+                the monotonic timestamp of that frame.
+            None: If the timeout passed.
+        """
+
+        start = time.monotonic()
+        while timeout is None or time.monotonic() - start < timeout:
+            for sensor, dc in enumerate(self.controllers):
+                contact = dc.poll_contact()
+                if contact is not None:
+                    # One touch only triggers one capture, whichever device sees it
+                    for other in self.controllers:
+                        other.disarm_contact()
+                    return (sensor,) + contact
+            time.sleep(0.005)
+        return None
+
+    def show_view(self):
+        """Show the live views of every device side by side until ESC is pressed."""
+
+        window = "Digit View " + ", ".join(self.serials())
+        while True:
+            frames = [dc.latest_frame() for dc in self.controllers]
+            cv2.imshow(window, np.hstack(frames))
+            if cv2.waitKey(1) == 27:
+                break
+        cv2.destroyWindow(window)
+
+    async def show_view_async(self):
+        """
+        Show the live views of every device side by side until ESC is pressed, from
+        an event loop on the main thread (see show_window_async).
+        """
+
+        window = "Digit View " + ", ".join(self.serials())
+        await show_window_async(
+            window, lambda: np.hstack([dc.latest_frame() for dc in self.controllers])
+        )
+
+    def disconnect(self):
+        """Disconnect every DIGIT device."""
+
+        self._each("disconnect")
@@ -0,0 +1,393 @@
+"""
+Ensembles of several models and/or several samples of the same request.
+Each member of an ensemble (a model and a sample number) gets the same request, and
+all members run concurrently, so an ensemble costs roughly the wall-clock time of its
+slowest call. The object each member predicts is read from its output text, and the
+predictions are aggregated either by vote (each member counts once) or by confidence
+(each member counts with the confidence it states).
+
+Every member's prediction, confidence and latency (and whether it was correct, when
+the true object is known) is appended to a CSV log. It can be summarised per model
+with:
+    python3 ensemble.py ensemble.csv active/ensemble.csv
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import numpy as np
+import os
+import re
+import time
+
+DEFAULT_CONFIDENCE = 0.5  # Confidence of a member that does not state one
+# Confidence words a member may use instead of a number, most specific first
+CONFIDENCE_WORDS = [
+    ("very high", 0.95),
+    ("medium-high", 0.75),
+    ("high", 0.85),
+    ("medium", 0.6),
+    ("moderate", 0.6),
+    ("low", 0.3),
+]
+# Other names of the possible objects, e.g. their object folder names
+OBJECT_ALIASES = {
+    "tennis ball": ["ball"],
+    "tin of beans": ["beans", "tin"],
+    "pringles tube": ["pringles"],
+    "human fingertip": ["fingertip", "finger"],
+}
+# Words before an object that mean it is ruled out (e.g. "not a banana")
+NEGATION = re.compile(r"(?:\bnot|n't|\bno)\s+(?:an?\s+|the\s+)?$", re.IGNORECASE)
+FINAL_PROMPT = (
+    "Please give your final prediction now, in the format:\n"
+    "PREDICTION: object, CONFIDENCE: confidence_level"
+)
+
+
+def parse_choices(prompt):
+    """
+    Read the list of possible objects from a multi-choice prompt.
+
+    Args:
+        prompt (str): The prompt text.
+
+    Returns:
+        list: The possible objects (empty if the prompt does not list them).
+    """
+
+    match = re.search(r"possible objects are:\s*(.+)", prompt, re.IGNORECASE)
+    if match is None:
+        return []
+    return [c.strip() for c in match.group(1).rstrip(". ").split(",") if c.strip()]
+
+
+def extract_label(text, choices):
+    """
+    Read the predicted object from an output text: the choice mentioned first (by
+    its full name, its longest word or an alias, e.g. "ball" for "tennis ball"),
+    ignoring mentions that rule it out (e.g. "not a banana").
+
+    Args:
+        text (str): The output text.
+        choices (list): The possible objects.
+
+    Returns:
+        str: The predicted object.
+        None: If no possible object is mentioned.
+    """
+
+    # Prefer an explicit PREDICTION line (the active prompt's format)
+    prediction = re.search(r"PREDICTION:\s*([^,\n]+)", text)
+    if prediction is not None:
+        text = prediction.group(1)
+
+    earliest = None
+    for choice in choices:
+        names = [choice, max(choice.split(), key=len)]
+        names += OBJECT_ALIASES.get(choice.lower(), [])
+        for name in names:
+            for match in re.finditer(rf"\b{re.escape(name)}\b", text, re.IGNORECASE):
+                if NEGATION.search(text[: match.start()]):
+                    continue
+                if earliest is None or match.start() < earliest[0]:
+                    earliest = (match.start(), choice)
+                break
+    return earliest[1] if earliest else None
+
+
+def extract_confidence(text):
+    """
+    Read the confidence stated in an output text.
+
+    Args:
+        text (str): The output text.
+
+    Returns:
+        float: The confidence between 0 and 1.
+        None: If no confidence is stated.
+    """
+
+    number = re.search(r"CONFIDENCE:\s*([0-9.]+)\s*(%?)", text, re.IGNORECASE)
+    if number is not None:
+        try:
+            value = float(number.group(1))
+        except ValueError:
+            value = None
+        if value is not None:
+            # A percentage, with or without the sign (e.g. 85% or 85)
+            if number.group(2) or value > 1:
+                value /= 100
+            return min(value, 1.0)
+    percent = re.search(r"(\d{1,3})\s*%", text)
+    if percent is not None:
+        return min(int(percent.group(1)), 100) / 100
+    lower = text.lower()
+    for word, confidence in CONFIDENCE_WORDS:
+        if f"{word} confidence" in lower or f"confidence: {word}" in lower:
+            return confidence
+    return None
+
+
+def true_label(name, choices):
+    """
+    Match an object folder name (e.g. beans) to its choice (e.g. tin of beans).
+
+    Args:
+        name (str): The object folder name.
+        choices (list): The possible objects.
+
+    Returns:
+        str: The matching choice (or the name itself if none matches).
+    """
+
+    for choice in choices:
+        if re.search(rf"\b{re.escape(name)}\b", choice, re.IGNORECASE):
+            return choice
+    return name
+
+
+class Ensemble:
+    """
+    Sends the same request to several models and/or samples at once and aggregates
+    their predictions.
+    """
+
+    def __init__(self, models, samples=1, aggregate="vote", choices=(), log_path=None):
+        """
+        Initialise the ensemble.
+
+        Args:
+            models (list): The models of the ensemble.
+            samples (int): The number of samples of each model.
+            aggregate (str): How predictions are combined, either vote (one vote
+                per member) or confidence (votes weighted by stated confidence).
+            choices (list): The possible objects, used to read predictions.
+            log_path (str, optional): The CSV log of every member's prediction.
+        """
+
+        self.models = list(models)
+        self.samples = samples
+        self.aggregate = aggregate
+        self.choices = list(choices)
+        self.log_path = log_path
+
+    # --- Private helpers ---
+    def _member_result(self, model, sample, response, latency):
+        """
+        Read the prediction of a member from its response.
+
+        Args:
+            model (str): The model of the member.
+            sample (int): The sample number of the member.
+            response (Response): The response of the member.
+            latency (float): The seconds taken to get the response.
+
+        Returns:
+            dict: The member's model, sample, response, latency, label and confidence.
+        """
+
+        return {
+            "model": model,
+            "sample": sample,
+            "response": response,
+            "latency": latency,
+            "label": extract_label(response.output_text, self.choices),
+            "confidence": extract_confidence(response.output_text),
+        }
+
+    # --- Public methods ---
+    def members(self):
+        """
+        Return the members of the ensemble.
+
+        Returns:
+            list: The (model, sample) of each member.
+        """
+
+        return [
+            (model, sample)
+            for model in self.models
+            for sample in range(1, self.samples + 1)
+        ]
+
+    def run(self, client, request):
+        """
+        Send a request to every member at once, using threads.
+
+        Args:
+            client (OpenAI): The OpenAI client instance.
+            request (dict): The keyword arguments of responses.create (the model is
+                set per member).
+
+        Returns:
+            list: The result of each member (see _member_result), in member order.
+        """
+
+        def call(member):
+            model, sample = member
+            start = time.perf_counter()
+            response = client.responses.create(**{**request, "model": model})
+            latency = time.perf_counter() - start
+            return self._member_result(model, sample, response, latency)
+
+        with ThreadPoolExecutor(len(self.members())) as executor:
+            return list(executor.map(call, self.members()))
+
+    async def run_async(self, client, request):
+        """
+        Send a request to every member at once, using an async client.
+
+        Args:
+            client (AsyncOpenAI): The async OpenAI client instance.
+            request (dict): The keyword arguments of responses.create (the model is
+                set per member).
+
+        Returns:
+            list: The result of each member (see _member_result), in member order.
+        """
+
+        async def call(model, sample):
+            start = time.perf_counter()
+            response = await client.responses.create(**{**request, "model": model})
+            latency = time.perf_counter() - start
+            return self._member_result(model, sample, response, latency)
+
+        return await asyncio.gather(*(call(m, s) for m, s in self.members()))
+
+    def combine(self, results):
+        """
+        Aggregate the predictions of the members.
+
+        Args:
+            results (list): The member results.
+
+        Returns:
+            tuple: The winning object (None if no member predicted one) and its
+                share of the votes (or of the confidence).
+        """
+
+        totals = {}
+        for result in results:
+            if result["label"] is None:
+                continue
+            if self.aggregate == "confidence":
+                weight = result["confidence"]
+                weight = DEFAULT_CONFIDENCE if weight is None else weight
+            else:
+                weight = 1.0
+            totals[result["label"]] = totals.get(result["label"], 0.0) + weight
+        if not totals:
+            return None, 0.0
+        # Ties go to the object predicted first in member order
+        label = max(totals, key=totals.get)
+        return label, totals[label] / max(sum(totals.values()), 1e-8)
+
+    def format(self, results):
+        """
+        Describe the aggregated prediction and every member's answer.
+
+        Args:
+            results (list): The member results.
+
+        Returns:
+            str: The ensemble output text.
+        """
+
+        label, score = self.combine(results)
+        text = f"ENSEMBLE: {label} ({self.aggregate} {score:.2f})\n"
+        for result in results:
+            text += f"[{result['model']} #{result['sample']}] "
+            text += f"{result['response'].output_text}\n"
+        return text
+
+    def record(self, results, wall_time, truth=None, **fields):
+        """
+        Append every member's prediction and the aggregated one to the CSV log.
+
+        Args:
+            results (list): The member results.
+            wall_time (float): The seconds taken by the whole ensemble.
+            truth (str, optional): The true object, to record which were correct.
+            **fields: Details recorded with every row (e.g. the object and prompt).
+        """
+
+        if self.log_path is None:
+            return
+        label, score = self.combine(results)
+        rows = [
+            (r["model"], r["sample"], r["label"], r["confidence"], r["latency"])
+            for r in results
+        ]
+        rows.append(("ensemble", "", label, score, wall_time))
+
+        # Write the header if the log is new
+        write_header = not os.path.exists(self.log_path)
+        with open(self.log_path, "a", newline="") as f:
+            writer = None
+            for model, sample, label, confidence, latency in rows:
+                row = {
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    **fields,
+                    "aggregate": self.aggregate,
+                    "model": model,
+                    "sample": sample,
+                    "label": label or "",
+                    "confidence": "" if confidence is None else f"{confidence:.2f}",
+                    "latency": f"{latency:.3f}",
+                    "truth": truth or "",
+                    "correct": "" if truth is None else int(label == truth),
+                }
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    if write_header:
+                        writer.writeheader()
+                writer.writerow(row)
+
+
+def summarize(path):
+    """
+    Summarise an ensemble log per model.
+
+    Args:
+        path (str): The path of the CSV log.
+
+    Returns:
+        dict: The number of predictions, accuracy (where the truth is known) and
+            p50/p95 latency of each model (and of the ensemble).
+    """
+
+    with open(path, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    summary = {}
+    for model in dict.fromkeys(r["model"] for r in rows):
+        model_rows = [r for r in rows if r["model"] == model]
+        correct = [int(r["correct"]) for r in model_rows if r["correct"] != ""]
+        latency = np.array([float(r["latency"]) for r in model_rows])
+        summary[model] = {
+            "predictions": len(model_rows),
+            "accuracy": np.mean(correct) if correct else None,
+            "p50": np.percentile(latency, 50),
+            "p95": np.percentile(latency, 95),
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise ensemble logs.")
+    parser.add_argument("logs", nargs="+", help="Ensemble CSV log paths")
+    args = parser.parse_args()
+
+    for log_path in args.logs:
+        print(f"{log_path}:")
+        print(f"    {'model':<14}{'n':>5}{'accuracy':>10}{'p50':>10}{'p95':>10}")
+        for model, stats in summarize(log_path).items():
+            accuracy = stats["accuracy"]
+            accuracy = "-" if accuracy is None else f"{accuracy:.2f}"
+            p50, p95 = stats["p50"] * 1000, stats["p95"] * 1000
+            print(
+                f"    {model:<14}{stats['predictions']:>5}{accuracy:>10}"
+                f"{p50:>8.0f}ms{p95:>8.0f}ms"
+            )
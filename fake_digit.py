@@ -0,0 +1,200 @@
+"""
+A simulated DIGIT sensor that plays back previously recorded frames.
+It allows the exploration scripts and benchmarks to run without a physical sensor,
+for example using the frames in active/results/*/captures.
+"""
+
+import asyncio
+import cv2
+from digit_controller import DigitController
+from digit_pool import DigitPool
+import glob
+import os
+import re
+import shared_functions
+import time
+
+
+def find_frames(captures_dir):
+    """
+    Return the paths of the recorded frames in a captures folder, in capture order.
+
+    Args:
+        captures_dir (str): The captures folder (containing frame_N.jpg files).
+
+    Returns:
+        list: The frame paths sorted by frame number.
+    """
+
+    paths = glob.glob(os.path.join(captures_dir, "frame_*.jpg"))
+    return sorted(paths, key=lambda p: int(re.findall(r"\d+", os.path.basename(p))[0]))
+
+
+class FakeDigit:
+    """
+    A stand-in for digit_interface.Digit that plays back recorded frames.
+    """
+
+    def __init__(self, frame_paths, fps=30, serial="FAKE0001"):
+        """
+        Load the recorded frames.
+
+        Args:
+            frame_paths (list): The paths of the recorded frames.
+            fps (int): The rate at which get_frame returns frames.
+            serial (str): The serial number to report.
+        """
+
+        self.serial = serial
+        self.fps = fps
+        self.frames = [cv2.imread(p) for p in frame_paths]
+        self.index = 0
+        self._next_time = time.monotonic()
+
+    def connect(self):
+        """Pretend to connect to the device."""
+
+    def disconnect(self):
+        """Pretend to disconnect from the device."""
+
+    def set_resolution(self, resolution):
+        """
+        Ignore the requested resolution (frames are played back as recorded).
+
+        Args:
+            resolution (dict): The requested resolution.
+        """
+
+    def set_fps(self, fps):
+        """
+        Set the playback frame rate.
+
+        Args:
+            fps (int): The frame rate.
+        """
+
+        self.fps = fps
+
+    def get_frame(self):
+        """
+        Return the current recorded frame, paced at the playback frame rate.
+
+        Returns:
+            np.ndarray: A copy of the current frame.
+        """
+
+        # Block until the next frame is due, like a real camera
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic()) + 1 / self.fps
+        return self.frames[self.index].copy()
+
+    def save_frame(self, path):
+        """
+        Save the current frame.
+
+        Args:
+            path (str): The path to save the frame to.
+        """
+
+        cv2.imwrite(path, self.get_frame())
+
+    def show_view(self):
+        """Do nothing (there is no live view to show)."""
+
+
+class FakeDigitController(DigitController):
+    """
+    A DigitController connected to a FakeDigit.
+    Each live view moves on to the next recorded frame, as if the operator had
+    repositioned the sensor, so the Nth capture returns the Nth recorded frame.
+    """
+
+    def __init__(self, frame_paths, fps=30, serial="FAKE0001"):
+        """
+        Initialise the controller with a FakeDigit playing back the given frames.
+
+        Args:
+            frame_paths (list): The paths of the recorded frames.
+            fps (int): The playback frame rate.
+            serial (str): The serial number the fake DIGIT reports.
+        """
+
+        self._frame_paths = frame_paths
+        self._fps = fps
+        self._views = 0
+        super().__init__(serial)
+
+    def _connect_to_digit(self):
+        """
+        Connect to the fake DIGIT device.
+
+        Returns:
+            FakeDigit: The fake device.
+        """
+
+        print("Connected to fake DIGIT playing back recorded frames.")
+        return FakeDigit(self._frame_paths, self._fps, self._serial)
+
+    def show_view(self):
+        """
+        Move on to the next recorded frame and, if the grabber is running, wait until
+        the ring buffer holds enough copies of it to pick the capture from.
+        """
+
+        self.digit.index = self._views % len(self.digit.frames)
+        self._views += 1
+        if self.is_grabbing():
+            target = self._frame_count + shared_functions.CAPTURE_BEST_OF
+            while self._frame_count < target:
+                time.sleep(0.001)
+
+    async def show_view_async(self):
+        """Move on to the next recorded frame (see show_view) without a window."""
+
+        await asyncio.to_thread(self.show_view)
+
+
+class FakeDigitPool(DigitPool):
+    """
+    A DigitPool of FakeDigitControllers, each playing back its own recorded frames.
+    """
+
+    def __init__(self, frame_path_sets, fps=30):
+        """
+        Initialise the pool with one fake DIGIT per list of recorded frames.
+
+        Args:
+            frame_path_sets (list): The frame paths played back by each fake DIGIT.
+            fps (int): The playback frame rate.
+        """
+
+        self._frame_path_sets = frame_path_sets
+        self._fps = fps
+        serials = [f"FAKE{i:04d}" for i in range(1, len(frame_path_sets) + 1)]
+        super().__init__(serials)
+
+    def _make_controller(self, serial):
+        """
+        Create the fake controller of one device.
+
+        Args:
+            serial (str): The serial number of the device.
+
+        Returns:
+            FakeDigitController: The controller.
+        """
+
+        frame_paths = self._frame_path_sets[int(serial[4:]) - 1]
+        return FakeDigitController(frame_paths, self._fps, serial)
+
+    def show_view(self):
+        """Move every fake DIGIT on to its next recorded frame."""
+
+        self._each("show_view")
+
+    async def show_view_async(self):
+        """Move every fake DIGIT on to its next recorded frame, without a window."""
+
+        await asyncio.to_thread(self.show_view)
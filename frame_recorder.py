@@ -0,0 +1,251 @@
+"""
+High-rate recording of a DIGIT stream to a memory-mapped raw frame store.
+The exploration scripts save single captures as JPEGs. For offline analysis and
+dataset building, this records every frame of a stream preset (QVGA at 60 or 30 FPS,
+VGA at 30 or 15 FPS) instead:
+    - The frames are written raw into a preallocated, memory-mapped .npy file, so
+      there is no per-frame encoding, allocation or small-file overhead.
+    - The grab time of each frame is written to a matching timestamp index.
+
+A FrameStore reads a recording back without loading it: slicing frames by index or
+time returns views of the memory-mapped file (no copies), which can be passed
+straight to tactile_index.extract_features or encoded for the static classifier.
+
+Record with:
+    python3 frame_recorder.py recordings/banana --stream QVGA --fps 60fps --seconds 30
+"""
+
+import argparse
+import cv2
+import json
+import numpy as np
+import os
+import time
+
+RECORDING_MARGIN = 1.1  # Extra frames allocated beyond seconds * fps
+
+
+class FrameRecorder:
+    """
+    Records the frames of a DIGIT device into a preallocated frame store.
+    """
+
+    def __init__(self, dc, prefix, capacity):
+        """
+        Create the frame store, sized from the first frame of the device.
+
+        Args:
+            dc (DigitController): The controller of the device (its background
+                grabber must not be running, since the recorder reads the device).
+            prefix (str): The path of the store files without extension.
+            capacity (int): The maximum number of frames to record.
+        """
+
+        self.dc = dc
+        self.prefix = prefix
+        self.count = 0
+
+        frame = dc.digit.get_frame()
+        self.frames = np.lib.format.open_memmap(
+            f"{prefix}.frames.npy",
+            mode="w+",
+            dtype=frame.dtype,
+            shape=(capacity,) + frame.shape,
+        )
+        # Unwritten slots are NaN, so a store cut short by a crash can still be read
+        self.times = np.lib.format.open_memmap(
+            f"{prefix}.times.npy", mode="w+", dtype=np.float64, shape=(capacity,)
+        )
+        self.times[:] = np.nan
+
+    def record(self, seconds=None):
+        """
+        Record frames until the store is full, the time is up or Ctrl+C is pressed.
+
+        Args:
+            seconds (float, optional): The maximum recording time.
+
+        Returns:
+            int: The number of frames recorded.
+        """
+
+        start = time.monotonic()
+        started_at = time.time()
+        try:
+            while self.count < len(self.frames):
+                # Blocks until the next frame is available at the stream fps
+                frame = self.dc.digit.get_frame()
+                timestamp = time.monotonic() - start
+                if seconds is not None and timestamp >= seconds:
+                    break
+                self.frames[self.count] = frame
+                self.times[self.count] = timestamp
+                self.count += 1
+        except KeyboardInterrupt:
+            print("Recording stopped.")
+        self.close(started_at)
+        return self.count
+
+    def close(self, started_at=None):
+        """
+        Flush the store to disk and write its metadata.
+
+        Args:
+            started_at (float, optional): The wall-clock time the recording started.
+        """
+
+        self.frames.flush()
+        self.times.flush()
+        meta = {
+            "serial": self.dc.digit.serial,
+            "count": self.count,
+            "shape": list(self.frames.shape[1:]),
+            "started_at": started_at,
+        }
+        with open(f"{self.prefix}.json", "w") as f:
+            json.dump(meta, f)
+
+
+class FrameStore:
+    """
+    Reads a recording made by FrameRecorder without copying its frames.
+    """
+
+    def __init__(self, prefix):
+        """
+        Open a recording, memory-mapping its frames and timestamps.
+
+        Args:
+            prefix (str): The path of the store files without extension.
+        """
+
+        frames = np.load(f"{prefix}.frames.npy", mmap_mode="r")
+        times = np.load(f"{prefix}.times.npy", mmap_mode="r")
+        # Only the recorded frames (the rest of the preallocated store is unused)
+        count = int(np.count_nonzero(~np.isnan(times)))
+        self.frames = frames[:count]
+        self.times = times[:count]
+
+    def __len__(self):
+        """
+        Return the number of recorded frames.
+
+        Returns:
+            int: The number of frames.
+        """
+
+        return len(self.frames)
+
+    def fps(self):
+        """
+        Return the achieved frame rate of the recording.
+
+        Returns:
+            float: The mean frames per second.
+        """
+
+        if len(self) < 2:
+            return 0.0
+        return (len(self) - 1) / (self.times[-1] - self.times[0])
+
+    def slice(self, start=None, stop=None, step=None):
+        """
+        Return frames by index.
+
+        Args:
+            start (int, optional): The first frame.
+            stop (int, optional): The frame to stop before.
+            step (int, optional): The stride between frames.
+
+        Returns:
+            tuple: Views of the frames, shaped (n, height, width, 3), and their
+                timestamps in seconds from the start of the recording.
+        """
+
+        index = slice(start, stop, step)
+        return self.frames[index], self.times[index]
+
+    def between(self, start, stop, step=None):
+        """
+        Return the frames grabbed in a time window.
+
+        Args:
+            start (float): The start of the window, in seconds from the start of the
+                recording.
+            stop (float): The end of the window (exclusive).
+            step (int, optional): The stride between frames.
+
+        Returns:
+            tuple: Views of the frames and their timestamps (see slice).
+        """
+
+        first, last = np.searchsorted(self.times, [start, stop])
+        return self.slice(first, last, step)
+
+    def nearest(self, timestamp):
+        """
+        Return the index of the frame grabbed closest to a time.
+
+        Args:
+            timestamp (float): The time, in seconds from the start of the recording.
+
+        Returns:
+            int: The index of the frame.
+        """
+
+        index = int(np.searchsorted(self.times, timestamp))
+        if index > 0 and (
+            index == len(self)
+            or timestamp - self.times[index - 1] < self.times[index] - timestamp
+        ):
+            index -= 1
+        return index
+
+    def encode(self, index, ext=".jpg"):
+        """
+        Encode a frame, e.g. to send it to GPT.
+
+        Args:
+            index (int): The index of the frame.
+            ext (str): The image format extension to encode to (.jpg or .png).
+
+        Returns:
+            bytes: The encoded image.
+        """
+
+        success, buffer = cv2.imencode(ext, self.frames[index])
+        if not success:
+            raise ValueError(f"Failed to encode frame {index} as {ext}.")
+        return buffer.tobytes()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a DIGIT stream.")
+    parser.add_argument("prefix", help="Path of the recording files without extension")
+    parser.add_argument("--stream", choices=["QVGA", "VGA"], default="QVGA")
+    parser.add_argument("--fps", choices=["60fps", "30fps", "15fps"], default="60fps")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    args = parser.parse_args()
+
+    from digit_controller import DigitController
+    from digit_interface.digit import Digit
+
+    rates = Digit.STREAMS[args.stream]["fps"]
+    if args.fps not in rates:
+        parser.error(f"{args.stream} streams at {' or '.join(rates)}")
+
+    dc = DigitController()
+    if dc.digit is not None:
+        try:
+            dc.set_stream(args.stream, args.fps)
+            os.makedirs(os.path.dirname(os.path.abspath(args.prefix)), exist_ok=True)
+            # Preallocate the whole recording up front
+            capacity = int(args.seconds * rates[args.fps] * RECORDING_MARGIN) + 1
+            recorder = FrameRecorder(dc, args.prefix, capacity)
+            print(f"Recording {args.seconds:.0f}s to {args.prefix} (Ctrl+C to stop)...")
+            count = recorder.record(args.seconds)
+
+            store = FrameStore(args.prefix)
+            print(f"Recorded {count} frames at {store.fps():.1f} FPS.")
+        finally:
+            dc.disconnect()
@@ -0,0 +1,554 @@
+"""
+A local stand-in for the parts of the OpenAI API used by the scripts.
+It implements the Files, Batches and Responses (including streaming) endpoints in
+memory so that the scripts can be run end to end without a network connection or an
+API key. Responses can be given an artificial latency, and the bytes received by each
+endpoint are counted so that request payload sizes can be measured. It can also
+enforce a requests-per-minute rate limit (sending the API's rate-limit headers and
+429 errors) and fail a fraction of requests with 500 errors, to test retries.
+
+Usage:
+    python3 mock_openai_server.py --port 8000 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock \\
+        python3 static_classification.py
+"""
+
+import argparse
+from collections import Counter
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import random
+import threading
+import time
+
+BATCH_DELAY = 2  # Seconds before a submitted batch completes
+STREAM_CHUNK_WORDS = 3  # Words per streamed output text delta
+
+
+def default_responder(body):
+    """
+    Return the text of a mock response to a Responses API request body.
+
+    Args:
+        body (dict): The request body.
+
+    Returns:
+        str: The mock output text.
+    """
+
+    return f"Mock response from {body.get('model')}."
+
+
+def response_object(response_id, model, text, input_tokens=0):
+    """
+    Build the JSON body of a completed Responses API response.
+
+    Args:
+        response_id (str): The ID of the response.
+        model (str): The model name.
+        text (str): The output text.
+        input_tokens (int, optional): The number of input tokens to report.
+
+    Returns:
+        dict: The response body.
+    """
+
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{response_id}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": len(text.split()),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + len(text.split()),
+        },
+    }
+
+
+class MockOpenAIState:
+    """
+    The in-memory files and batches held by the mock server, and its statistics.
+    """
+
+    def __init__(
+        self,
+        batch_delay=BATCH_DELAY,
+        responder=default_responder,
+        latency=0.0,
+        file_latency=0.0,
+        rate_limit=None,
+        error_rate=0.0,
+    ):
+        """
+        Initialise an empty state.
+
+        Args:
+            batch_delay (float): Seconds before a submitted batch completes.
+            responder (callable): Returns the output text for a request body.
+            latency (float): Seconds before each response starts (time to first token).
+            file_latency (float): Seconds taken by each file upload.
+            rate_limit (int, optional): Requests allowed per minute (None for no
+                limit).
+            error_rate (float): Fraction of requests that fail with a 500 error.
+        """
+
+        self.batch_delay = batch_delay
+        self.responder = responder
+        self.latency = latency
+        self.file_latency = file_latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        # Requests left in the rate limit, refilled continuously
+        self.allowance = rate_limit
+        self.allowance_time = time.monotonic()
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+
+        # Statistics per endpoint (e.g. files, responses)
+        self.bytes_received = Counter()
+        self.request_counts = Counter()
+
+    def new_id(self, prefix):
+        """
+        Return a new unique object ID.
+
+        Args:
+            prefix (str): The ID prefix, e.g. file or batch.
+
+        Returns:
+            str: The new ID.
+        """
+
+        with self.lock:
+            return f"{prefix}-mock{next(self._ids)}"
+
+    def take_request(self):
+        """
+        Take a request from the rate limit.
+
+        Returns:
+            tuple: Whether the request is allowed, the requests remaining, the
+                seconds until the limit is full again and the seconds until the next
+                request is allowed.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            refill = (now - self.allowance_time) * self.rate_limit / 60
+            self.allowance = min(self.rate_limit, self.allowance + refill)
+            self.allowance_time = now
+            allowed = self.allowance >= 1
+            if allowed:
+                self.allowance -= 1
+            seconds_per_request = 60 / self.rate_limit
+            reset = (self.rate_limit - self.allowance) * seconds_per_request
+            wait = max(1 - self.allowance, 0) * seconds_per_request
+            return allowed, int(self.allowance), reset, wait
+
+    def add_file(self, filename, data, purpose):
+        """
+        Store a file and return its file object.
+
+        Args:
+            filename (str): The name of the file.
+            data (bytes): The file content.
+            purpose (str): The purpose of the file.
+
+        Returns:
+            dict: The file object.
+        """
+
+        file_id = self.new_id("file")
+        self.files[file_id] = {
+            "data": data,
+            "object": {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(data),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+            },
+        }
+        return self.files[file_id]["object"]
+
+    def run_batch(self, batch):
+        """
+        Process every request of a batch and attach the output file.
+
+        Args:
+            batch (dict): The batch object.
+        """
+
+        lines = self.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines()
+        outputs = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            text = self.responder(request["body"])
+            response_id = self.new_id("resp")
+            outputs.append(
+                json.dumps(
+                    {
+                        "id": self.new_id("batch_req"),
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "request_id": response_id,
+                            "body": response_object(
+                                response_id, request["body"].get("model"), text
+                            ),
+                        },
+                        "error": None,
+                    }
+                )
+            )
+        output_data = ("\n".join(outputs) + "\n").encode("utf-8")
+        output_file = self.add_file("batch_output.jsonl", output_data, "batch_output")
+        batch.update(
+            status="completed",
+            output_file_id=output_file["id"],
+            completed_at=int(time.time()),
+            request_counts={
+                "total": len(outputs),
+                "completed": len(outputs),
+                "failed": 0,
+            },
+        )
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Route requests to the in-memory Files, Batches and Responses endpoints.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep connections alive like the real API
+    # Send small responses straight away rather than waiting for the client's ACK
+    disable_nagle_algorithm = True
+    state = None  # Set by make_server
+
+    # --- Private helpers ---
+    def _admit(self):
+        """
+        Apply the rate limit and injected errors to a request, sending the error if
+        it is refused.
+
+        Returns:
+            bool: Whether the request should be handled.
+        """
+
+        state = self.state
+        self.limit_headers = {}
+        if state.rate_limit is not None:
+            allowed, remaining, reset, wait = state.take_request()
+            self.limit_headers = {
+                "x-ratelimit-limit-requests": str(state.rate_limit),
+                "x-ratelimit-remaining-requests": str(remaining),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+            if not allowed:
+                self.limit_headers["retry-after-ms"] = str(int(wait * 1000))
+                self._refuse(429, "Rate limit reached for requests.", "requests")
+                return False
+        if random.random() < state.error_rate:
+            self._refuse(500, "The server had an error.", "server_error")
+            return False
+        return True
+
+    def _refuse(self, status, message, error_type):
+        """
+        Send an error in the format of the OpenAI API, discarding the request body.
+
+        Args:
+            status (int): The HTTP status code.
+            message (str): The error message.
+            error_type (str): The error type.
+        """
+
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.state.lock:
+            self.state.request_counts[f"error_{status}"] += 1
+        error = {"message": message, "type": error_type, "param": None, "code": None}
+        self._send_json(status, {"error": error})
+
+    def end_headers(self):
+        """Add the rate-limit headers to every response."""
+
+        for name, value in getattr(self, "limit_headers", {}).items():
+            self.send_header(name, value)
+        super().end_headers()
+
+    def _send_json(self, status, obj):
+        """
+        Send a JSON response.
+
+        Args:
+            status (int): The HTTP status code.
+            obj (dict): The JSON body.
+        """
+
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, e.g. a cancelled request
+            return
+
+    def _not_found(self):
+        """Send a 404 error in the format of the OpenAI API."""
+
+        self._send_json(
+            404,
+            {
+                "error": {
+                    "message": f"No such object: {self.path}",
+                    "type": "invalid_request_error",
+                    "code": None,
+                    "param": None,
+                }
+            },
+        )
+
+    def _read_body(self):
+        """
+        Read the raw request body.
+
+        Returns:
+            bytes: The request body.
+        """
+
+        length = int(self.headers.get("Content-Length", 0))
+        # Count the bytes sent to each endpoint
+        endpoint = (self._path_parts() or [""])[0]
+        with self.state.lock:
+            self.state.bytes_received[endpoint] += length
+            self.state.request_counts[endpoint] += 1
+        return self.rfile.read(length)
+
+    def _send_stream(self, response):
+        """
+        Send a completed response as a stream of server-sent events.
+
+        Args:
+            response (dict): The completed response body.
+        """
+
+        # Split the output text into deltas
+        message = response["output"][0]
+        words = message["content"][0]["text"].split(" ")
+        deltas = [
+            " ".join(words[i : i + STREAM_CHUNK_WORDS])
+            + (" " if i + STREAM_CHUNK_WORDS < len(words) else "")
+            for i in range(0, len(words), STREAM_CHUNK_WORDS)
+        ]
+        events = [
+            {
+                "type": "response.created",
+                "response": dict(response, status="in_progress", output=[]),
+            }
+        ]
+        events += [
+            {
+                "type": "response.output_text.delta",
+                "item_id": message["id"],
+                "output_index": 0,
+                "content_index": 0,
+                "delta": delta,
+                "logprobs": [],
+            }
+            for delta in deltas
+        ]
+        events.append({"type": "response.completed", "response": response})
+
+        # The stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for sequence_number, event in enumerate(events):
+            event["sequence_number"] = sequence_number
+            data = json.dumps(event)
+            try:
+                self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream, e.g. a cancelled request
+                return
+
+    def _read_multipart(self):
+        """
+        Parse a multipart/form-data request body.
+
+        Returns:
+            dict: The form fields, as (filename, bytes) for files and str otherwise.
+        """
+
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser().parsebytes(header + self._read_body())
+        fields = {}
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            filename = part.get_filename()
+            data = part.get_payload(decode=True)
+            fields[name] = (filename, data) if filename else data.decode("utf-8")
+        return fields
+
+    def _path_parts(self):
+        """
+        Split the request path into its parts after the /v1 prefix.
+
+        Returns:
+            list: The path parts.
+        """
+
+        parts = self.path.split("?")[0].strip("/").split("/")
+        return parts[1:] if parts and parts[0] == "v1" else parts
+
+    # --- Request handlers ---
+    def do_POST(self):
+        """Handle file uploads, batch creation and responses."""
+
+        if not self._admit():
+            return
+        state = self.state
+        parts = self._path_parts()
+        if parts == ["responses"]:
+            raw = self._read_body()
+            body = json.loads(raw)
+            time.sleep(state.latency)
+            text = state.responder(body)
+            # Roughly one token per four bytes of request
+            response = response_object(
+                state.new_id("resp"), body.get("model"), text, len(raw) // 4
+            )
+            if body.get("stream"):
+                self._send_stream(response)
+            else:
+                self._send_json(200, response)
+        elif parts == ["files"]:
+            time.sleep(state.file_latency)
+            fields = self._read_multipart()
+            filename, data = fields["file"]
+            self._send_json(200, state.add_file(filename, data, fields.get("purpose")))
+        elif parts == ["batches"]:
+            body = json.loads(self._read_body())
+            batch_id = state.new_id("batch")
+            state.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self._send_json(200, state.batches[batch_id])
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        """Handle file and batch retrieval."""
+
+        if not self._admit():
+            return
+        state = self.state
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "files" and parts[1] in state.files:
+            self._send_json(200, state.files[parts[1]]["object"])
+        elif len(parts) == 3 and parts[0] == "files" and parts[2] == "content":
+            if parts[1] not in state.files:
+                self._not_found()
+                return
+            data = state.files[parts[1]]["data"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif len(parts) == 2 and parts[0] == "batches" and parts[1] in state.batches:
+            batch = state.batches[parts[1]]
+            # Complete the batch once its delay has passed
+            with state.lock:
+                ready = time.time() - batch["created_at"] >= state.batch_delay
+                if batch["status"] == "in_progress" and ready:
+                    state.run_batch(batch)
+            self._send_json(200, batch)
+        else:
+            self._not_found()
+
+    def log_message(self, format, *args):
+        """Silence the default per-request logging."""
+
+
+def make_server(host="127.0.0.1", port=8000, state=None):
+    """
+    Create a mock OpenAI server.
+
+    Args:
+        host (str): The host to bind to.
+        port (int): The port to bind to (0 picks a free port).
+        state (MockOpenAIState, optional): The server state.
+
+    Returns:
+        ThreadingHTTPServer: The server, ready to serve_forever.
+    """
+
+    handler = type(
+        "BoundMockOpenAIHandler",
+        (MockOpenAIHandler,),
+        {"state": state or MockOpenAIState()},
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--file-latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, help="Requests allowed per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = MockOpenAIState(
+        args.batch_delay,
+        latency=args.latency,
+        file_latency=args.file_latency,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+    )
+    server = make_server(args.host, args.port, state)
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
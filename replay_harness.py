@@ -0,0 +1,300 @@
+"""
+An offline replay and benchmark harness for the exploration scripts.
+It replays a recorded conversation (e.g. active/results/banana/banana_conversation.txt)
+through the script's chat_loop without a sensor, a human or the live API:
+    - The DIGIT sensor is simulated by a FakeDigitController playing back the
+      recorded captures from the same results folder.
+    - The OpenAI API is replaced by the local mock server, which answers each turn
+      with the recorded GPT reply after a configurable latency.
+    - The user's inputs are scripted from the recorded user turns.
+
+It reports per-stage latency percentiles, throughput and bytes sent, so that every
+performance change to shared_functions can be measured reproducibly.
+
+Usage:
+    python3 replay_harness.py active/results/banana/banana_conversation.txt \\
+        --latency 0.5 --image-mode file
+"""
+
+import argparse
+from contextlib import nullcontext, redirect_stdout
+from fake_digit import FakeDigitController, find_frames
+import functools
+import importlib
+import inspect
+import io
+import mock_openai_server
+import numpy as np
+from openai import OpenAI
+import os
+from session_journal import SessionJournal
+from session_trace import Tracer
+import shared_functions
+import tempfile
+import threading
+import time
+from upload_cache import UploadCache
+
+# Recorded user turns of the active script and the shortcuts that produce them
+ACTIVE_SHORTCUTS = {
+    "MOVE action successfully executed.": "m",
+    "ROTATE action successfully executed.": "r",
+    "RESET action successfully executed.": "re",
+}
+# Functions of shared_functions timed by the harness, and the stage they measure
+TIMED_STAGES = {
+    "capture": "capture",
+    "image_input": "image_upload",
+    "create_response_async": "model",
+}
+
+
+def parse_conversation(path):
+    """
+    Split a saved conversation log into its user and GPT turns.
+
+    Args:
+        path (str): The path of the conversation log (written by save_log).
+
+    Returns:
+        tuple: The list of user turns and the list of GPT turns. The first user turn
+            is the summary of the initial prompt.
+    """
+
+    with open(path, "r") as f:
+        entries = f.read().split("\n-----\n")
+    entries = [e for e in entries if e.strip()]
+    # Turns alternate, starting with the initial prompt
+    return entries[0::2], entries[1::2]
+
+
+def to_command(user_turn, script):
+    """
+    Convert a recorded user turn back into what the user typed.
+
+    Args:
+        user_turn (str): The recorded user turn.
+        script (str): Either active or simple_active.
+
+    Returns:
+        str: The user input.
+    """
+
+    lines = user_turn.splitlines()
+    capture = bool(lines) and lines[-1].endswith(" attached.")
+    if script == "active":
+        if capture:
+            return "c"
+        return ACTIVE_SHORTCUTS.get(user_turn, user_turn)
+    # Simple active captures on any input not starting with #
+    return "\n".join(lines[:-1]) if capture else user_turn
+
+
+def percentiles(values):
+    """
+    Summarise a list of durations.
+
+    Args:
+        values (list): The durations in seconds.
+
+    Returns:
+        dict: The count, mean, p50, p95 and p99 of the durations.
+    """
+
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    array = np.asarray(values)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": array.mean(),
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+    }
+
+
+def run_replay(
+    conversation_path,
+    latency=0.0,
+    file_latency=0.0,
+    image_mode=None,
+    stream=False,
+    fps=30,
+    quiet=True,
+):
+    """
+    Replay a recorded conversation through the matching script's chat_loop.
+
+    Args:
+        conversation_path (str): The path of the recorded conversation log.
+        latency (float): Seconds before each mock response starts.
+        file_latency (float): Seconds taken by each mock file upload.
+        image_mode (str, optional): Override the script's IMAGE_MODE.
+        stream (bool): Whether to stream responses.
+        fps (int): The frame rate of the fake DIGIT.
+        quiet (bool): Whether to hide the script's console output.
+
+    Returns:
+        dict: The stage timings, turn count, wall time and bytes sent.
+    """
+
+    results_dir = os.path.dirname(os.path.abspath(conversation_path))
+    script = "simple_active" if "simple_active" in results_dir else "active"
+    user_turns, gpt_turns = parse_conversation(conversation_path)
+    commands = iter([to_command(t, script) for t in user_turns[1:]] + ["x"])
+    replies = iter(gpt_turns)
+
+    # Start the mock server answering with the recorded replies
+    lock = threading.Lock()
+
+    def responder(body):
+        with lock:
+            return next(replies, "No more recorded replies.")
+
+    state = mock_openai_server.MockOpenAIState(
+        responder=responder, latency=latency, file_latency=file_latency
+    )
+    server = mock_openai_server.make_server(port=0, state=state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Configure the script for a non-interactive run
+    module = importlib.import_module(f"{script}_exploration")
+    module.CAPTURE_MODE = "manual"
+    module.SAVE_CAPTURES = False
+    module.RESPONSE_CACHE = None
+    module.STREAM = stream
+    if image_mode is not None:
+        module.IMAGE_MODE = image_mode
+
+    # Time each stage by wrapping the shared functions the script calls
+    timings = {stage: [] for stage in TIMED_STAGES.values()}
+    originals = {name: getattr(shared_functions, name) for name in TIMED_STAGES}
+
+    def timed(name, function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                result = await function(*args, **kwargs)
+                timings[TIMED_STAGES[name]].append(time.perf_counter() - start)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            timings[TIMED_STAGES[name]].append(time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    # The script's module globals stand in for the setup done in its main block
+    frames = find_frames(os.path.join(results_dir, "captures"))
+    with tempfile.TemporaryDirectory() as output_dir:
+        module.dc = FakeDigitController(frames, fps=fps)
+        module.dc.set_qvga_30fps()
+        module.dc.start_grabber()
+        module.client = OpenAI(
+            base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="mock"
+        )
+        module.current_dir = os.path.dirname(os.path.abspath(__file__))
+        module.output_dir = output_dir
+        module.upload_cache = UploadCache(f"{output_dir}/upload_cache.json")
+        module.response_cache = None
+        module.local_index = None
+        module.ensemble = None
+        module.truth = None
+        module.tracer = Tracer(f"{output_dir}/trace.jsonl", script=script)
+        module.journal = SessionJournal(f"{output_dir}/journal.jsonl")
+        # A module global named input shadows the builtin inside chat_loop
+        module.input = lambda prompt="": next(commands)
+
+        for name, function in originals.items():
+            setattr(shared_functions, name, timed(name, function))
+        start = time.perf_counter()
+        try:
+            with redirect_stdout(io.StringIO()) if quiet else nullcontext():
+                module.chat_loop()
+        finally:
+            wall_time = time.perf_counter() - start
+            for name, function in originals.items():
+                setattr(shared_functions, name, function)
+            del module.input
+            module.journal.close()
+            module.dc.disconnect()
+            server.shutdown()
+
+    return {
+        "conversation": conversation_path,
+        "timings": timings,
+        "turns": len(timings["model"]),
+        "wall_time": wall_time,
+        "bytes_sent": dict(state.bytes_received),
+    }
+
+
+def print_report(results):
+    """
+    Print per-stage latency percentiles, throughput and bytes sent for replays.
+
+    Args:
+        results (list): The results of run_replay.
+    """
+
+    # Combine the timings of every replay
+    stages = {}
+    for result in results:
+        for stage, values in result["timings"].items():
+            stages.setdefault(stage, []).extend(values)
+    turns = sum(r["turns"] for r in results)
+    wall_time = sum(r["wall_time"] for r in results)
+    bytes_sent = {}
+    for result in results:
+        for endpoint, count in result["bytes_sent"].items():
+            bytes_sent[endpoint] = bytes_sent.get(endpoint, 0) + count
+
+    print(f"{'stage':<14}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, values in stages.items():
+        s = percentiles(values)
+        columns = "".join(
+            f"{s[key] * 1000:>8.1f}ms" for key in ("mean", "p50", "p95", "p99")
+        )
+        print(f"{stage:<14}{s['count']:>7}{columns}")
+    print(f"\nReplays: {len(results)}, turns: {turns}, wall time: {wall_time:.2f}s")
+    print(f"Throughput: {turns / wall_time:.2f} turns/s")
+    total_bytes = sum(bytes_sent.values())
+    print(f"Bytes sent: {total_bytes} ({total_bytes / max(turns, 1):.0f} per turn)")
+    for endpoint, count in sorted(bytes_sent.items()):
+        print(f"    {endpoint}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded conversations.")
+    parser.add_argument("conversations", nargs="+", help="Conversation log paths")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--file-latency", type=float, default=0.0)
+    parser.add_argument("--image-mode", choices=["inline", "file"])
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    results = [
+        run_replay(
+            path,
+            latency=args.latency,
+            file_latency=args.file_latency,
+            image_mode=args.image_mode,
+            stream=args.stream,
+            fps=args.fps,
+            quiet=not args.verbose,
+        )
+        for _ in range(args.repeat)
+        for path in args.conversations
+    ]
+    print_report(results)
@@ -0,0 +1,567 @@
+"""
+A rate-limit-aware scheduler for every request the scripts make to the OpenAI API.
+It sits under the OpenAI clients as an httpx transport, so every call (uploads,
+responses, batches) goes through it, and the sync and async clients of a script
+share it:
+    - Connections are pooled and kept alive between requests.
+    - Requests are paced by a token bucket sized from the rate-limit headers of the
+      API's responses (x-ratelimit-limit-requests, x-ratelimit-remaining-requests and
+      x-ratelimit-reset-requests). When the token limit is nearly used up, new
+      requests wait for it to reset.
+    - Throttled (429), timed out and transient server errors (5xx) are retried with
+      jittered exponential backoff, honouring any retry-after header. Retries are
+      limited by a retry budget, earned as a fraction of the requests that succeed,
+      so an outage does not turn into a storm of retries.
+    - Interactive requests (responses) take priority over background ones (uploads
+      and everything else): background requests leave a reserve in the bucket and
+      give way while any interactive request is waiting.
+    - Processes sending requests side by side (e.g. the workers of sweep_runner.py)
+      each take a share of the rate limits, so together they stay within them.
+
+The clients are created with shared_functions.create_client and
+create_async_client, which turn off the SDK's own retries so the scheduler owns them.
+The transports are built on the HTTP library the OpenAI SDK ships with (see
+http_library), so the scheduler adds no dependency of its own.
+"""
+
+import asyncio
+from collections import Counter
+import importlib
+import random
+import re
+import threading
+import time
+
+MAX_ATTEMPTS = 6  # Attempts of a request before its error is returned
+BACKOFF_BASE = 0.5  # Seconds of the first backoff, doubled on every retry
+BACKOFF_MAX = 30.0  # Longest backoff in seconds
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}  # Statuses worth retrying
+RETRY_BUDGET = 20.0  # Most retries saved up (and the budget to start with)
+RETRY_RATIO = 0.2  # Retries earned per successful request
+INTERACTIVE_PATHS = ("/responses",)  # Requests that take priority
+INTERACTIVE_RESERVE = 2  # Requests of the bucket kept for interactive requests
+PRIORITY_WAIT = 0.05  # Seconds a background request waits for interactive ones
+TOKEN_HEADROOM = 0.02  # Fraction of the token limit at which new requests wait
+MAX_CONNECTIONS = 20  # Connections kept open to the API
+KEEPALIVE_EXPIRY = 120.0  # Seconds an idle connection is kept open
+
+# The scheduler shared by every client of this process
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def parse_duration(value):
+    """
+    Parse a rate-limit reset duration (e.g. 1s, 6m0s or 20ms).
+
+    Args:
+        value (str): The duration.
+
+    Returns:
+        float: The duration in seconds (0 if it cannot be parsed).
+    """
+
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"([0-9.]+)(ms|h|m|s)", value or "")
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def retry_after(response):
+    """
+    Read how long the API asked to wait before retrying.
+
+    Args:
+        response (httpx.Response): The response.
+
+    Returns:
+        float: The seconds to wait.
+        None: If the response does not say.
+    """
+
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        # e.g. an HTTP date rather than a number of seconds
+        pass
+    return None
+
+
+def http_library():
+    """
+    Return the HTTP library (httpx) the installed OpenAI SDK is built on, as the
+    SDK's default HTTP client is a subclass of its client.
+
+    Returns:
+        module: The HTTP library.
+    """
+
+    from openai import DefaultHttpxClient
+
+    client_class = DefaultHttpxClient.__mro__[1]
+    return importlib.import_module(client_class.__module__.partition(".")[0])
+
+
+def connection_limits():
+    """
+    Return the connection pool limits of the scheduled HTTP clients.
+
+    Returns:
+        httpx.Limits: The limits.
+    """
+
+    return http_library().Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+class TokenBucket:
+    """
+    A token bucket of requests, sized from the API's rate-limit headers. Until the
+    first headers arrive, it lets every request through.
+    """
+
+    def __init__(self, share=1.0):
+        """
+        Initialise an unsized bucket.
+
+        Args:
+            share (float): The fraction of the rate limit the bucket is sized to.
+        """
+
+        self.share = share
+        self.capacity = None
+        self.tokens = 0.0
+        self.rate = 0.0
+        self.updated = time.monotonic()
+
+    # --- Private helpers ---
+    def _refill(self):
+        """Add the tokens refilled since the last update."""
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # --- Public methods ---
+    def resize(self, limit, remaining, reset):
+        """
+        Size the bucket from the rate-limit headers of a response.
+
+        Args:
+            limit (int): The requests allowed per window.
+            remaining (int): The requests left in the window.
+            reset (float): The seconds until the window is full again.
+        """
+
+        # Only this bucket's share of the window (at least one request) is used
+        limit = max(limit * self.share, 1.0)
+        remaining = remaining * self.share
+        if self.capacity is None:
+            self.tokens = remaining
+        else:
+            self._refill()
+        self.capacity = limit
+        # The API refills the used requests by the time the window resets
+        used = limit - remaining
+        self.rate = used / reset if used > 0 and reset > 0 else limit / 60
+        # Requests sent after this one are not counted in remaining yet
+        self.tokens = min(self.tokens, remaining)
+
+    def take(self, reserve=0):
+        """
+        Take a token if one is available above the reserve.
+
+        Args:
+            reserve (int): Tokens to leave in the bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is
+                available.
+        """
+
+        if self.capacity is None:
+            return 0.0
+        self._refill()
+        needed = 1 + min(reserve, self.capacity - 1)
+        if self.tokens >= needed:
+            self.tokens -= 1
+            return 0.0
+        return (needed - self.tokens) / max(self.rate, 1e-6)
+
+
+class RequestScheduler:
+    """
+    Paces, prioritises and retries the requests of every client it is shared by.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, retry_budget=RETRY_BUDGET, share=1.0):
+        """
+        Initialise the scheduler.
+
+        Args:
+            max_attempts (int): Attempts of a request before its error is returned.
+            retry_budget (float): Most retries saved up.
+            share (float): The fraction of the API's rate limits this scheduler uses
+                (e.g. 1/N for each of N processes sending requests side by side).
+        """
+
+        self.http = http_library()
+        self.max_attempts = max_attempts
+        self.max_budget = retry_budget
+        self.budget = retry_budget
+        self.share = share
+        self.bucket = TokenBucket(share)
+        self.paused_until = 0.0
+        self.interactive_waiting = 0
+        self.lock = threading.Lock()
+        # Counts of requests, retries, rate-limited responses and seconds waited
+        self.stats = Counter()
+
+    # --- Private helpers ---
+    def _reserve(self, interactive, waiting):
+        """
+        Try to take a request from the bucket.
+
+        Args:
+            interactive (bool): Whether the request takes priority.
+            waiting (bool): Whether the request is already waiting.
+
+        Returns:
+            float: 0 if the request can be sent, otherwise the seconds to wait.
+        """
+
+        with self.lock:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                if interactive:
+                    delay = self.bucket.take()
+                elif self.interactive_waiting:
+                    # Give way to interactive requests
+                    delay = PRIORITY_WAIT
+                else:
+                    delay = self.bucket.take(INTERACTIVE_RESERVE)
+            # Count the waiting interactive requests
+            if interactive and (delay > 0) != waiting:
+                self.interactive_waiting += 1 if delay > 0 else -1
+            if delay > 0:
+                self.stats["waited"] += delay
+            return max(delay, 0.0)
+
+    def _observe(self, response):
+        """
+        Resize the bucket from the rate-limit headers of a response.
+
+        Args:
+            response (httpx.Response): The response.
+        """
+
+        headers = response.headers
+        with self.lock:
+            self.stats["requests"] += 1
+            if response.status_code < 400:
+                self.budget = min(self.max_budget, self.budget + RETRY_RATIO)
+            try:
+                if "x-ratelimit-limit-requests" in headers:
+                    self.bucket.resize(
+                        int(headers["x-ratelimit-limit-requests"]),
+                        int(headers["x-ratelimit-remaining-requests"]),
+                        parse_duration(headers.get("x-ratelimit-reset-requests")),
+                    )
+                if "x-ratelimit-limit-tokens" in headers:
+                    limit = int(headers["x-ratelimit-limit-tokens"])
+                    remaining = int(headers["x-ratelimit-remaining-tokens"])
+                    # Wait for the token limit to reset rather than be throttled
+                    if remaining <= limit * TOKEN_HEADROOM:
+                        reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+                        self._pause(reset)
+            except (KeyError, ValueError):
+                # Incomplete headers, keep the current sizing
+                pass
+
+    def _pause(self, seconds):
+        """
+        Hold back every new request (the lock must be held).
+
+        Args:
+            seconds (float): The seconds to hold requests back for.
+        """
+
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _retry_delay(self, response, attempt):
+        """
+        Decide whether to retry a request.
+
+        Args:
+            response (httpx.Response): The response (None if the request failed to
+                get one, e.g. a timeout).
+            attempt (int): The number of attempts so far.
+
+        Returns:
+            float: The seconds to wait before retrying.
+            None: If the request should not be retried.
+        """
+
+        if response is not None:
+            if response.status_code not in RETRY_STATUSES:
+                return None
+            # An exhausted quota does not recover by waiting
+            if b"insufficient_quota" in response.content:
+                return None
+        if attempt >= self.max_attempts:
+            return None
+
+        with self.lock:
+            if self.budget < 1:
+                self.stats["budget_exhausted"] += 1
+                return None
+            self.budget -= 1
+            self.stats["retries"] += 1
+
+            # Full jitter, unless the API says how long to wait
+            delay = retry_after(response) if response is not None else None
+            if delay is None:
+                cap = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                delay = random.uniform(0, cap)
+            # A throttled request holds back every request, not just its retry
+            if response is not None and response.status_code == 429:
+                self.stats["rate_limited"] += 1
+                self._pause(delay)
+            return delay
+
+    # --- Public methods ---
+    def send(self, request, send):
+        """
+        Send a request when the bucket allows, retrying it if needed.
+
+        Args:
+            request (httpx.Request): The request.
+            send (callable): Sends the request and returns the response.
+
+        Returns:
+            httpx.Response: The response.
+        """
+
+        # Buffer the body so the request can be sent again
+        request.read()
+        interactive = request.url.path.endswith(INTERACTIVE_PATHS)
+        attempt = 0
+        while True:
+            waiting = False
+            while delay := self._reserve(interactive, waiting):
+                waiting = True
+                time.sleep(delay)
+
+            attempt += 1
+            try:
+                response = send(request)
+            except self.http.TransportError:
+                # e.g. a timeout or a dropped connection
+                delay = self._retry_delay(None, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._observe(response)
+            if response.status_code in RETRY_STATUSES:
+                response.read()
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    async def send_async(self, request, send):
+        """
+        Send a request when the bucket allows, retrying it if needed (async).
+
+        Args:
+            request (httpx.Request): The request.
+            send (callable): Sends the request and returns the response (a
+                coroutine function).
+
+        Returns:
+            httpx.Response: The response.
+        """
+
+        # Buffer the body so the request can be sent again
+        await request.aread()
+        interactive = request.url.path.endswith(INTERACTIVE_PATHS)
+        attempt = 0
+        while True:
+            waiting = False
+            try:
+                while delay := self._reserve(interactive, waiting):
+                    waiting = True
+                    await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # A cancelled request is no longer waiting
+                if waiting:
+                    with self.lock:
+                        self.interactive_waiting -= int(interactive)
+                raise
+
+            attempt += 1
+            try:
+                response = await send(request)
+            except self.http.TransportError:
+                # e.g. a timeout or a dropped connection
+                delay = self._retry_delay(None, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._observe(response)
+            if response.status_code in RETRY_STATUSES:
+                await response.aread()
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+    def http_client(self):
+        """
+        Create a pooled, keep-alive HTTP client whose requests go through the
+        scheduler, for an OpenAI client.
+
+        Returns:
+            httpx.Client: The HTTP client.
+        """
+
+        from openai import DefaultHttpxClient
+
+        transport = self.http.HTTPTransport(limits=connection_limits())
+        return DefaultHttpxClient(transport=SchedulerTransport(self, transport))
+
+    def async_http_client(self):
+        """
+        Create a pooled, keep-alive async HTTP client whose requests go through the
+        scheduler, for an AsyncOpenAI client.
+
+        Returns:
+            httpx.AsyncClient: The async HTTP client.
+        """
+
+        from openai import DefaultAsyncHttpxClient
+
+        transport = self.http.AsyncHTTPTransport(limits=connection_limits())
+        return DefaultAsyncHttpxClient(
+            transport=AsyncSchedulerTransport(self, transport)
+        )
+
+    def summary(self):
+        """
+        Describe what the scheduler has done.
+
+        Returns:
+            str: The number of requests, retries and rate-limited responses, and the
+                total seconds requests waited for the bucket.
+        """
+
+        return (
+            f"{self.stats['requests']} requests, {self.stats['retries']} retries, "
+            f"{self.stats['rate_limited']} rate limited, "
+            f"{self.stats['waited']:.1f}s waited in total"
+        )
+
+
+class SchedulerTransport:
+    """
+    An httpx transport that sends every request through a RequestScheduler. It
+    implements the transport interface rather than subclassing httpx.BaseTransport,
+    so it does not import httpx itself.
+    """
+
+    def __init__(self, scheduler, transport):
+        """
+        Wrap a transport.
+
+        Args:
+            scheduler (RequestScheduler): The scheduler.
+            transport (httpx.BaseTransport): The transport that sends the requests.
+        """
+
+        self.scheduler = scheduler
+        self.transport = transport
+
+    def handle_request(self, request):
+        """Send a request through the scheduler."""
+
+        return self.scheduler.send(request, self.transport.handle_request)
+
+    def close(self):
+        """Close the wrapped transport."""
+
+        self.transport.close()
+
+    def __enter__(self):
+        self.transport.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self.transport.__exit__(*args)
+
+
+class AsyncSchedulerTransport:
+    """
+    An async httpx transport that sends every request through a RequestScheduler.
+    """
+
+    def __init__(self, scheduler, transport):
+        """
+        Wrap an async transport.
+
+        Args:
+            scheduler (RequestScheduler): The scheduler.
+            transport (httpx.AsyncBaseTransport): The transport that sends the
+                requests.
+        """
+
+        self.scheduler = scheduler
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        """Send a request through the scheduler."""
+
+        return await self.scheduler.send_async(
+            request, self.transport.handle_async_request
+        )
+
+    async def aclose(self):
+        """Close the wrapped transport."""
+
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.transport.__aexit__(*args)
+
+
+def shared_scheduler(share=None):
+    """
+    Return the scheduler shared by every client of this process.
+
+    Args:
+        share (float, optional): The fraction of the API's rate limits the process
+            uses (see RequestScheduler). If it differs from the current scheduler's,
+            e.g. in a worker process that inherited its parent's scheduler, a new
+            scheduler with this share replaces it.
+
+    Returns:
+        RequestScheduler: The shared scheduler.
+    """
+
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or share not in (None, _scheduler.share):
+            _scheduler = RequestScheduler(share=share or 1.0)
+        return _scheduler
@@ -0,0 +1,267 @@
+"""
+A persistent, opt-in cache of OpenAI responses stored in SQLite.
+Responses are keyed on the whole request (with images replaced by hashes of their
+content, keeping their other fields such as detail), apart from whether it is
+streamed, so re-running a sweep or replaying a session only sends new or edited
+requests to the API.
+
+The cache has two modes:
+    record: return cached responses where possible, and store new ones.
+    replay: only return cached responses, raising KeyError for anything not cached.
+"""
+
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+DEFAULT_MAX_ENTRIES = 10000  # Maximum number of responses kept in the cache
+
+
+class CachedResponse:
+    """
+    A stand-in for a Response object restored from the cache.
+    Provides the attributes used by the scripts (id, model, output_text and usage).
+    """
+
+    def __init__(self, response_id, model, output_text, usage):
+        """
+        Initialise the cached response.
+
+        Args:
+            response_id (str): The ID of the original response.
+            model (str): The model that created the response.
+            output_text (str): The output text of the response.
+            usage (SimpleNamespace): The token usage of the original response.
+        """
+
+        self.id = response_id
+        self.model = model
+        self.output_text = output_text
+        self.usage = usage
+        self.cached = True
+
+
+class ResponseCache:
+    """
+    A SQLite-backed memoization layer for Responses API requests.
+    """
+
+    def __init__(
+        self, db_path, mode="record", max_entries=DEFAULT_MAX_ENTRIES, upload_cache=None
+    ):
+        """
+        Initialise the cache and create the database table if needed.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            mode (str): Either record or replay.
+            max_entries (int): Maximum number of responses kept in the cache.
+            upload_cache (UploadCache, optional): Used to key uploaded images by their
+                content rather than their file ID.
+        """
+
+        self.mode = mode
+        self.max_entries = max_entries
+        self.upload_cache = upload_cache
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response_id TEXT, model TEXT, output_text TEXT, "
+            "usage TEXT, created REAL, used REAL)"
+        )
+        self._db.commit()
+
+    # --- Private helpers ---
+    def _image_key(self, item):
+        """
+        Replace the image of an input_image content item by the hash of its content,
+        keeping the item's other fields (e.g. detail).
+
+        Args:
+            item (dict): The input_image content item.
+
+        Returns:
+            dict: The content item used to build the cache key.
+        """
+
+        fields = {k: v for k, v in item.items() if k not in ("image_url", "file_id")}
+        image_url = item.get("image_url")
+        if image_url and image_url.startswith("data:"):
+            data = base64.b64decode(image_url.split(",", 1)[1])
+            return {**fields, "sha256": hashlib.sha256(data).hexdigest()}
+        file_id = item.get("file_id")
+        if file_id and self.upload_cache is not None:
+            digest = self.upload_cache.digest_for(file_id)
+            if digest is not None:
+                return {**fields, "sha256": digest}
+        return item
+
+    def _normalise(self, value):
+        """
+        Recursively replace the images of a request input by their content hashes.
+
+        Args:
+            value: Any part of the request input.
+
+        Returns:
+            The normalised value.
+        """
+
+        if isinstance(value, dict):
+            if value.get("type") == "input_image":
+                return self._image_key(value)
+            return {k: self._normalise(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._normalise(v) for v in value]
+        return value
+
+    def _evict(self):
+        """Delete the least recently used responses over the size limit."""
+
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    @staticmethod
+    def _usage_json(usage):
+        """
+        Serialise the token usage of a response.
+
+        Args:
+            usage: The usage object of a response (or None).
+
+        Returns:
+            str: The usage as JSON.
+        """
+
+        if usage is None:
+            return "null"
+        if hasattr(usage, "model_dump"):
+            return json.dumps(usage.model_dump())
+        return json.dumps(usage, default=vars)
+
+    # --- Public methods ---
+    def key(self, request):
+        """
+        Compute the cache key of a request: every field except stream, which does
+        not change the response.
+
+        Args:
+            request (dict): The keyword arguments of responses.create.
+
+        Returns:
+            str: The cache key.
+        """
+
+        keyed = self._normalise({k: v for k, v in request.items() if k != "stream"})
+        return hashlib.sha256(json.dumps(keyed, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, request):
+        """
+        Look up the cached response to a request.
+
+        Args:
+            request (dict): The keyword arguments of responses.create.
+
+        Returns:
+            CachedResponse: The cached response.
+            None: If the response is not cached (record mode only).
+
+        Raises:
+            KeyError: If the response is not cached in replay mode.
+        """
+
+        key = self.key(request)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response_id, model, output_text, usage FROM responses "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE responses SET used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._db.commit()
+
+        if row is None:
+            if self.mode == "replay":
+                raise KeyError(f"Response not in cache (replay mode): {key}")
+            return None
+
+        response_id, model, output_text, usage = row
+        usage = json.loads(usage, object_hook=lambda d: SimpleNamespace(**d))
+        return CachedResponse(response_id, model, output_text, usage)
+
+    def store(self, request, response):
+        """
+        Store the response to a request (record mode only).
+
+        Args:
+            request (dict): The keyword arguments of responses.create.
+            response (Response): The response to store.
+        """
+
+        if self.mode != "record":
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.key(request),
+                    response.id,
+                    response.model,
+                    response.output_text,
+                    self._usage_json(getattr(response, "usage", None)),
+                    now,
+                    now,
+                ),
+            )
+            self._evict()
+            self._db.commit()
+
+    def create(self, client, **request):
+        """
+        Memoized client.responses.create.
+
+        Args:
+            client (OpenAI): The OpenAI client instance.
+            **request: The keyword arguments of responses.create.
+
+        Returns:
+            Response: The cached or newly created response.
+        """
+
+        cached = self.lookup(request)
+        if cached is not None:
+            return cached
+        response = client.responses.create(**request)
+        self.store(request, response)
+        return response
+
+    async def create_async(self, client, **request):
+        """
+        Memoized client.responses.create using an async client.
+
+        Args:
+            client (AsyncOpenAI): The async OpenAI client instance.
+            **request: The keyword arguments of responses.create.
+
+        Returns:
+            Response: The cached or newly created response.
+        """
+
+        cached = self.lookup(request)
+        if cached is not None:
+            return cached
+        response = await client.responses.create(**request)
+        self.store(request, response)
+        return response
@@ -0,0 +1,497 @@
+"""
+An event-loop session engine shared by the exploration scripts.
+The original chat loop was fully synchronous: the operator sat idle while GPT was
+thinking, and GPT sat idle while the operator positioned the sensor. The engine runs
+a session on an asyncio event loop instead:
+    - User input is read in the background, so the next command can be typed while
+      a response is still arriving, and each response is printed as it arrives.
+    - A capture (live view, encoding and upload) starts as soon as it is asked for,
+      and runs while the previous request is in flight. Finished turns are queued
+      and sent in order, each chained to the response before it. The live view is
+      shown on the main thread, which OpenCV windows need, and the rest of the
+      capture runs in a worker thread.
+    - The request in flight can be cancelled (e.g. after a bad capture), leaving the
+      chain at the last completed response. A turn that fails (e.g. a request error)
+      is reported and dropped in the same way, and the conversation log is saved
+      however the session ends.
+
+Commands (shared by both scripts):
+    m, r, re    Shortcuts for "MOVE/ROTATE/RESET action successfully executed."
+    c           Capture a frame.
+    #...        Send the message without capturing a frame.
+    f           Ask for the final prediction (from every member of the ensemble,
+                if there is one, see ensemble.py).
+    s           Cancel the request in flight.
+    x           Exit once the queued turns are sent, and save the conversation.
+Any other input is sent as a message, or with a captured frame if capture_default.
+"""
+
+import asyncio
+from ensemble import FINAL_PROMPT
+from session_journal import image_refs
+import shared_functions
+import threading
+import time
+from types import SimpleNamespace
+
+# Shortcut commands and the messages they send
+SHORTCUTS = {
+    "m": "MOVE action successfully executed.",
+    "r": "ROTATE action successfully executed.",
+    "re": "RESET action successfully executed.",
+}
+TEXT_PREFIX = "#"  # Messages starting with this are sent without capturing a frame
+
+
+class SessionEngine:
+    """
+    Runs an exploration session: reads commands, prepares turns (capturing frames
+    where needed) and sends them to GPT in order, without blocking on any of them.
+    """
+
+    def __init__(
+        self,
+        client,
+        model,
+        tracer,
+        journal,
+        output_dir,
+        initial,
+        capture,
+        capture_default=False,
+        auto_capture=False,
+        stream=False,
+        response_cache=None,
+        context=None,
+        live_view=None,
+        view_initial=False,
+        settings=None,
+        ensemble=None,
+        truth=None,
+        on_turn_end=None,
+        read_input=input,
+    ):
+        """
+        Initialise the engine.
+
+        Args:
+            client (OpenAI): The OpenAI client instance (its settings are used for
+                the async client that sends the requests).
+            model (str): The model to use for the responses.
+            tracer (Tracer): Records the stage timings of each turn.
+            journal (SessionJournal): Records each turn so the session can be resumed.
+            output_dir (str): Where the conversation log and usage are saved.
+            initial (callable): Prepares the initial turn. Called in a worker thread
+                with the frame counter and the Turn, it returns the message, the
+                input_image content items, the conversation log entry and whether a
+                frame was captured.
+            capture (callable): Prepares a capture turn. Called in a worker thread
+                with the user input, the frame counter and the Turn, it returns the
+                message and the input_image content items, or None to skip the turn.
+            capture_default (bool): Whether any input that is not a command is sent
+                with a captured frame (otherwise it is sent as a message).
+            auto_capture (bool): Whether to capture straight away when a response
+                ends with CAPTURE.
+            stream (bool): Whether to stream the output text to the console.
+            response_cache (ResponseCache, optional): Reuses responses to identical
+                requests.
+            context (BoundedContext, optional): Keeps the context of the session
+                bounded.
+            live_view (callable, optional): Shows the live view until the user
+                closes it (a coroutine function, e.g. DigitController.show_view_async).
+                It is run on the main thread, which runs the event loop, before each
+                capture is handed to a worker thread.
+            view_initial (bool): Whether the initial turn captures a frame, so the
+                live view is shown before it.
+            settings (dict, optional): The settings recorded with the token usage.
+            ensemble (Ensemble, optional): Answers the final prediction request (f)
+                with every member at once.
+            truth (str, optional): The object being explored, to record whether the
+                final predictions of the ensemble were correct.
+            on_turn_end (callable, optional): Called with the Turn and whether it was
+                sent once a prepared turn is finished (sent, cancelled or failed).
+            read_input (callable): Reads a line of user input.
+        """
+
+        self.client = client
+        self.model = model
+        self.tracer = tracer
+        self.journal = journal
+        self.output_dir = output_dir
+        self.initial = initial
+        self.capture = capture
+        self.capture_default = capture_default
+        self.auto_capture = auto_capture
+        self.stream = stream
+        self.response_cache = response_cache
+        self.context = context
+        self.live_view = live_view
+        self.view_initial = view_initial
+        self.settings = settings
+        self.ensemble = ensemble
+        self.truth = truth
+        self.on_turn_end = on_turn_end
+        self.read_input = read_input
+
+        self.response_id = None
+        self.conversation_list = []
+        self.frame_counter = 1
+
+    # --- Private helpers ---
+    def _read_commands(self):
+        """Read user input in a background thread and pass it to the event loop."""
+
+        while True:
+            try:
+                command = self.read_input()
+            except EOFError:
+                command = "x"
+            try:
+                self._loop.call_soon_threadsafe(self._commands.put_nowait, command)
+            except RuntimeError:
+                # The event loop has already closed
+                return
+            if command.lower() == "x":
+                return
+
+    async def _dispatch(self):
+        """Start a turn for each command as soon as it is entered."""
+
+        while True:
+            command = await self._commands.get()
+            self._submit(command)
+            if command.lower() == "x":
+                return
+
+    def _submit(self, command):
+        """
+        Handle a command: cancel straight away, or start preparing its turn and
+        queue it to be sent.
+
+        Args:
+            command (str): The user input.
+        """
+
+        match command.lower():
+            # Cancel the request in flight
+            case "s":
+                if self._in_flight is not None and not self._in_flight.done():
+                    self._in_flight.cancel()
+                else:
+                    print("No request in flight to cancel.")
+                return
+            # Exit once the queued turns are sent
+            case "x":
+                self._turns.put_nowait(None)
+                return
+            # Shortcuts
+            case "m" | "r" | "re":
+                prepared = self._prepare_text(SHORTCUTS[command.lower()])
+            # Ask for the final prediction
+            case "f":
+                prepared = self._prepare_text(FINAL_PROMPT, kind="final")
+            # Capture a frame
+            case "c":
+                prepared = self._prepare_capture(command)
+            # Any other input is sent as a message, or with a frame if capture_default
+            case _:
+                if self.capture_default and not command.startswith(TEXT_PREFIX):
+                    prepared = self._prepare_capture(command)
+                else:
+                    prepared = self._prepare_text(command)
+        self._turns.put_nowait(asyncio.create_task(prepared))
+
+    async def _show_live_view(self, turn):
+        """
+        Show the live view on the main thread, if there is one, until the user
+        closes it.
+
+        Args:
+            turn (Turn): Records the live_view stage timing.
+        """
+
+        if self.live_view is None:
+            return
+        with turn.span("live_view"):
+            print("Showing live view. Hit ESC to close window.")
+            await self.live_view()
+
+    async def _prepare_initial(self):
+        """
+        Prepare the initial turn.
+
+        Returns:
+            tuple: The Turn, the message, the images, the conversation log entry and
+                the frame counter after the turn.
+        """
+
+        turn = self.tracer.start_turn(kind="initial")
+        async with self._capture_lock:
+            if self.view_initial:
+                await self._show_live_view(turn)
+            message, images, entry, captured = await asyncio.to_thread(
+                self.initial, self.frame_counter, turn
+            )
+            self.frame_counter += captured
+            frame_counter = self.frame_counter
+        print("Sending initial prompt...")
+        return turn, message, images, entry, frame_counter
+
+    async def _prepare_capture(self, user_input):
+        """
+        Prepare a capture turn. Captures are taken one at a time, in order.
+
+        Args:
+            user_input (str): The user input.
+
+        Returns:
+            tuple: The Turn, the message, the images, the conversation log entry and
+                the frame counter after the turn.
+            None: If the capture was skipped.
+        """
+
+        turn = self.tracer.start_turn(kind="capture")
+        async with self._capture_lock:
+            await self._show_live_view(turn)
+            captured = await asyncio.to_thread(
+                self.capture, user_input, self.frame_counter, turn
+            )
+            if captured is None:
+                self.tracer.end_turn(
+                    turn, skipped=True, frame_counter=self.frame_counter
+                )
+                self._end_turn(turn, False)
+                return None
+            self.frame_counter += 1
+            frame_counter = self.frame_counter
+        message, images = captured
+        return turn, message, images, message, frame_counter
+
+    async def _prepare_text(self, message, kind="text"):
+        """
+        Prepare a turn with just a message.
+
+        Args:
+            message (str): The message.
+            kind (str): The kind of turn recorded in the trace.
+
+        Returns:
+            tuple: The Turn, the message, no images, the conversation log entry and
+                no frame counter.
+        """
+
+        return self.tracer.start_turn(kind=kind), message, [], message, None
+
+    async def _ask_ensemble(self, message):
+        """
+        Send a message to every member of the ensemble at once, each continuing the
+        session from the last response, and record each member's answer.
+
+        Args:
+            message (str): The message.
+
+        Returns:
+            SimpleNamespace: Stands in for the response, with the ID of the first
+                member's response (which the session continues from) and the
+                ensemble output text.
+        """
+
+        request = {
+            "input": [
+                {"role": "user", "content": [{"type": "input_text", "text": message}]}
+            ],
+            "previous_response_id": self.response_id,
+        }
+        # Keep the context bounded, as for any other turn
+        if self.context is not None:
+            request = self.context.prepare(request)
+        start = time.perf_counter()
+        results = await self.ensemble.run_async(self._async_client, request)
+        wall_time = time.perf_counter() - start
+        # The session continues from the first member's response
+        if self.context is not None:
+            self.context.update(results[0]["response"])
+
+        # Record the token usage and latency of each member
+        usage_path = f"{self.output_dir}/usage.csv"
+        for result in results:
+            response, latency = result["response"], result["latency"]
+            shared_functions.record_usage(response, usage_path, latency, self.settings)
+            turn = self.tracer.start_turn(kind="final", sample=result["sample"])
+            turn.add("model", latency)
+            turn.add("ttft", latency)
+            self.tracer.end_turn(turn, response)
+        self.ensemble.record(results, wall_time, self.truth, **self.tracer.fields)
+
+        return SimpleNamespace(
+            id=results[0]["response"].id, output_text=self.ensemble.format(results)
+        )
+
+    def _end_turn(self, turn, sent):
+        """
+        Let the script know a turn is finished.
+
+        Args:
+            turn (Turn): The turn.
+            sent (bool): Whether the turn was sent (rather than cancelled or failed).
+        """
+
+        if self.on_turn_end is not None:
+            self.on_turn_end(turn, sent)
+
+    async def _send_turns(self):
+        """Send the queued turns in order, until the exit command is reached."""
+
+        # The frame counter recorded with turns that do not capture
+        frame_counter = self.frame_counter
+        while True:
+            prepared = await self._turns.get()
+            # Exit (the conversation is saved by run)
+            if prepared is None:
+                print("Conversation terminated.")
+                return
+            try:
+                prepared = await prepared
+            except Exception as e:
+                # e.g. an upload failed, carry on from the last completed response
+                print(f"\nCapture failed: {e}. The turn was not sent.")
+                self._prompt()
+                continue
+            # The capture was skipped (and its turn already ended)
+            if prepared is None:
+                self._prompt()
+                continue
+            turn, message, images, entry, turn_frames = prepared
+            frame_counter = turn_frames or frame_counter
+
+            print("GPT is thinking...")
+            start = time.perf_counter()
+            # The final prediction goes to every member of the ensemble, if there is one
+            ensemble_turn = self.ensemble is not None and turn.record["kind"] == "final"
+            if ensemble_turn:
+                request = self._ask_ensemble(message)
+            else:
+                request = shared_functions.create_response_async(
+                    self._async_client,
+                    self.model,
+                    message,
+                    self.response_id,
+                    images=images,
+                    stream=self.stream,
+                    cache=self.response_cache,
+                    trace=turn,
+                    context=self.context,
+                )
+            self._in_flight = asyncio.create_task(request)
+            # Wait without letting a cancelled request cancel the engine
+            await asyncio.wait([self._in_flight])
+            if self._in_flight.cancelled():
+                print("\nRequest cancelled. The turn was not sent.")
+                self.tracer.end_turn(turn, cancelled=True, frame_counter=frame_counter)
+                self._end_turn(turn, False)
+                self._prompt()
+                continue
+            error = self._in_flight.exception()
+            if error is not None:
+                # e.g. the API could not be reached, carry on as if it was cancelled
+                print(f"\nRequest failed: {error}. The turn was not sent.")
+                self.tracer.end_turn(
+                    turn, error=str(error), frame_counter=frame_counter
+                )
+                self._end_turn(turn, False)
+                self._prompt()
+                continue
+            response = self._in_flight.result()
+
+            # Update the current response ID and the conversation log
+            self.response_id = response.id
+            self.conversation_list.extend([entry, response.output_text])
+
+            # Record the turn in the journal so the session can be resumed after a crash
+            self.journal.append(
+                prompt=entry,
+                images=image_refs(images),
+                response_id=response.id,
+                output_text=response.output_text,
+                frame_counter=frame_counter,
+            )
+            self._end_turn(turn, True)
+
+            # Record the latency and token usage of the response (the members of an
+            # ensemble have already been recorded)
+            if not ensemble_turn:
+                latency = time.perf_counter() - start
+                usage_path = f"{self.output_dir}/usage.csv"
+                shared_functions.record_usage(
+                    response, usage_path, latency, self.settings
+                )
+                # Append the stage timings of the turn to the trace
+                self.tracer.end_turn(turn, response, frame_counter=frame_counter)
+
+            # Print the response (already printed as it arrived if streaming)
+            if not self.stream or ensemble_turn:
+                print("GPT: ", response.output_text)
+            self._after_response(response.output_text)
+
+    def _after_response(self, output_text):
+        """
+        Capture straight away if GPT asked for it in auto capture mode, otherwise
+        prompt for input if no turns are queued.
+
+        Args:
+            output_text (str): The output text of the response.
+        """
+
+        last_line = output_text.strip().splitlines()[-1:]
+        if self.auto_capture and last_line == ["CAPTURE"] and self._turns.empty():
+            print("You: c")
+            self._submit("c")
+        else:
+            self._prompt()
+
+    def _prompt(self):
+        """Prompt for input if no turns are queued."""
+
+        if self._turns.empty():
+            print("You: ", end="", flush=True)
+
+    # --- Public methods ---
+    async def run(self, resume=None):
+        """
+        Run the session until the exit command.
+
+        Args:
+            resume (dict, optional): The state of a previous session to continue
+                (see session_journal.resume_state).
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._commands = asyncio.Queue()
+        self._turns = asyncio.Queue()
+        self._capture_lock = asyncio.Lock()
+        self._in_flight = None
+        # Shares the request scheduler (and its rate limits) with the sync client
+        self._async_client = shared_functions.create_async_client(self.client)
+
+        if resume is None:
+            # Start with the initial prompt
+            self._turns.put_nowait(asyncio.create_task(self._prepare_initial()))
+        else:
+            # Continue a previous session where it stopped, without resending anything
+            self.response_id = resume["response_id"]
+            self.conversation_list = resume["conversation_list"]
+            self.frame_counter = resume["frame_counter"]
+            print(f"Resumed session at frame {self.frame_counter}.")
+            print("GPT: ", resume["output_text"])
+            self._after_response(resume["output_text"])
+
+        # Read input in a daemon thread, so a pending read does not block exiting
+        threading.Thread(target=self._read_commands, daemon=True).start()
+        dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await self._send_turns()
+        finally:
+            # Save the conversation however the session ends (e.g. Ctrl+C)
+            shared_functions.save_log(self.conversation_list, self.output_dir)
+            dispatcher.cancel()
+            await self._async_client.close()
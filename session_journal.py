@@ -0,0 +1,143 @@
+"""
+A crash-safe, append-only journal of an exploration session.
+One JSON line is written per turn, recording the prompt, the images sent (file IDs),
+the response ID and output text, and the frame counter. Each line is flushed to the
+OS as soon as it is written, so it survives the script crashing, and fsynced to disk
+in batches, so a power cut loses at most the last few turns.
+
+A session can be resumed from its journal: the previous_response_id chain, the
+frame counter and the conversation log carry on where they stopped, without
+re-sending the initial prompt or any image.
+"""
+
+import json
+import os
+import time
+
+FSYNC_EVERY = 5  # Turns written between fsyncs of the journal
+FSYNC_INTERVAL = 10.0  # Maximum seconds between fsyncs of the journal
+
+
+class SessionJournal:
+    """
+    An append-only JSONL journal of the turns of a session.
+    """
+
+    def __init__(
+        self, path, resume=False, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL
+    ):
+        """
+        Open the journal.
+
+        Args:
+            path (str): The path of the journal file.
+            resume (bool): Whether to append to the existing journal (otherwise a new
+                journal is started).
+            fsync_every (int): Turns written between fsyncs.
+            fsync_interval (float): Maximum seconds between fsyncs.
+        """
+
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "a" if resume else "w")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, **entry):
+        """
+        Append a turn to the journal.
+
+        Args:
+            **entry: The details of the turn.
+        """
+
+        self._file.write(json.dumps({"timestamp": time.time(), **entry}) + "\n")
+        # Hand the line to the OS straight away so it survives a crash
+        self._file.flush()
+        self._unsynced += 1
+        elapsed = time.monotonic() - self._last_sync
+        if self._unsynced >= self.fsync_every or elapsed >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Force the journal to disk."""
+
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """Sync and close the journal."""
+
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def image_refs(images):
+    """
+    Return how each image of a turn was sent, for recording in the journal.
+
+    Args:
+        images (list): The input_image content items (see image_input).
+
+    Returns:
+        list: The file ID of each uploaded image, or "inline" for inline images.
+    """
+
+    return [item.get("file_id", "inline") for item in images or []]
+
+
+def load_journal(path):
+    """
+    Load the turns recorded in a journal.
+    A partly written last line (from a crash mid-write) is ignored.
+
+    Args:
+        path (str): The path of the journal file.
+
+    Returns:
+        list: The recorded turns, oldest first.
+    """
+
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return entries
+
+
+def resume_state(path):
+    """
+    Rebuild the state of a session from its journal.
+
+    Args:
+        path (str): The path of the journal file.
+
+    Returns:
+        dict: The response ID and output text of the last turn, the next frame
+            number and the conversation log.
+        None: If there is no journal or it has no turns.
+    """
+
+    if not os.path.exists(path):
+        return None
+    entries = load_journal(path)
+    if not entries:
+        return None
+
+    conversation_list = []
+    for entry in entries:
+        conversation_list.extend([entry["prompt"], entry["output_text"]])
+    last = entries[-1]
+    return {
+        "response_id": last["response_id"],
+        "output_text": last["output_text"],
+        "frame_counter": last["frame_counter"],
+        "conversation_list": conversation_list,
+    }
@@ -0,0 +1,281 @@
+"""
+Per-turn instrumentation of the scripts, written to a structured JSONL trace.
+Each turn (one model request) records timing spans for its stages, e.g. live view
+wait, frame encode, image upload, model latency and time to first token, along with
+the token usage reported by the response.
+
+The trace can be summarised (p50/p95 per stage, tokens per turn, total cost) with:
+    python3 session_trace.py active/trace.jsonl simple_active/trace.jsonl trace.jsonl
+"""
+
+import argparse
+from contextlib import contextmanager
+import json
+import numpy as np
+import threading
+import time
+
+# USD per million tokens: (input, cached input, output)
+PRICES = {
+    "gpt-5": (1.25, 0.125, 10.00),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+}
+
+
+class Turn:
+    """
+    The timing spans and details of a single turn.
+    """
+
+    def __init__(self, index, **fields):
+        """
+        Start a turn.
+
+        Args:
+            index (int): The turn number within the trace.
+            **fields: Any extra details to record with the turn.
+        """
+
+        self.record = {
+            "turn": index,
+            "timestamp": time.time(),
+            **fields,
+            "spans": {},
+        }
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time a stage of the turn (durations of repeated stages are added up).
+
+        Args:
+            name (str): The name of the stage.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def set(self, **fields):
+        """
+        Record details of the turn.
+
+        Args:
+            **fields: The details to record.
+        """
+
+        self.record.update(fields)
+
+    def add(self, name, seconds):
+        """
+        Add a duration to a stage of the turn.
+
+        Args:
+            name (str): The name of the stage.
+            seconds (float): The duration in seconds.
+        """
+
+        spans = self.record["spans"]
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+class Tracer:
+    """
+    Writes one JSON record per turn to an append-only trace file.
+    """
+
+    def __init__(self, path, **fields):
+        """
+        Initialise the tracer.
+
+        Args:
+            path (str): The path of the JSONL trace file.
+            **fields: Details recorded with every turn (e.g. script name).
+        """
+
+        self.path = path
+        self.fields = fields
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def start_turn(self, **fields):
+        """
+        Start a new turn.
+
+        Args:
+            **fields: Any extra details to record with the turn.
+
+        Returns:
+            Turn: The new turn.
+        """
+
+        with self._lock:
+            self._count += 1
+            index = self._count
+        return Turn(index, **self.fields, **fields)
+
+    def end_turn(self, turn, response=None, **fields):
+        """
+        Finish a turn and append its record to the trace.
+
+        Args:
+            turn (Turn): The turn to finish.
+            response (Response, optional): The response of the turn.
+            **fields: Any extra details to record with the turn.
+        """
+
+        record = turn.record
+        record.update(fields)
+        if response is not None:
+            record["response_id"] = response.id
+            record["model"] = response.model
+            record["cached"] = getattr(response, "cached", False)
+            record["usage"] = usage_dict(getattr(response, "usage", None))
+
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def usage_dict(usage):
+    """
+    Extract the token counts from the usage of a response.
+
+    Args:
+        usage: The usage object of a response (or None).
+
+    Returns:
+        dict: The input, cached, output and reasoning token counts.
+    """
+
+    if usage is None:
+        return {}
+    input_details = getattr(usage, "input_tokens_details", None)
+    output_details = getattr(usage, "output_tokens_details", None)
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "cached_tokens": getattr(input_details, "cached_tokens", 0) or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "reasoning_tokens": getattr(output_details, "reasoning_tokens", 0) or 0,
+    }
+
+
+def model_prices(model):
+    """
+    Look up the prices of a model. The API reports dated snapshot names (e.g.
+    gpt-5-mini-2025-08-07), so the longest name in PRICES that the model starts with
+    is used.
+
+    Args:
+        model (str): The model name.
+
+    Returns:
+        tuple: The input, cached input and output prices per million tokens.
+        None: If the model has no prices.
+    """
+
+    names = [name for name in PRICES if model and model.startswith(name)]
+    return PRICES[max(names, key=len)] if names else None
+
+
+def turn_cost(record):
+    """
+    Estimate the cost of a turn from its token usage.
+
+    Args:
+        record (dict): The turn record.
+
+    Returns:
+        float: The cost in USD (zero for cached responses or unknown models).
+    """
+
+    usage = record.get("usage") or {}
+    prices = model_prices(record.get("model"))
+    if prices is None or record.get("cached"):
+        return 0.0
+    input_price, cached_price, output_price = prices
+    uncached = usage.get("input_tokens", 0) - usage.get("cached_tokens", 0)
+    return (
+        uncached * input_price
+        + usage.get("cached_tokens", 0) * cached_price
+        + usage.get("output_tokens", 0) * output_price
+    ) / 1e6
+
+
+def load_trace(path):
+    """
+    Load the turn records of a trace file.
+
+    Args:
+        path (str): The path of the JSONL trace file.
+
+    Returns:
+        list: The turn records.
+    """
+
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    Summarise turn records.
+
+    Args:
+        records (list): The turn records.
+
+    Returns:
+        dict: The p50/p95 of each stage, mean tokens per turn and total cost.
+    """
+
+    stages = {}
+    for record in records:
+        for name, seconds in record["spans"].items():
+            stages.setdefault(name, []).append(seconds)
+
+    tokens = {}
+    for key in ("input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens"):
+        tokens[key] = np.mean([(r.get("usage") or {}).get(key, 0) for r in records])
+
+    return {
+        "turns": len(records),
+        "stages": {
+            name: dict(zip(("p50", "p95"), np.percentile(values, [50, 95])))
+            for name, values in stages.items()
+        },
+        "tokens_per_turn": tokens,
+        "total_cost": sum(turn_cost(r) for r in records),
+    }
+
+
+def print_summary(path, summary):
+    """
+    Print the summary of a trace file.
+
+    Args:
+        path (str): The path of the trace file.
+        summary (dict): The summary from summarize.
+    """
+
+    print(f"{path}: {summary['turns']} turns, ${summary['total_cost']:.4f} total")
+    print(f"    {'stage':<12}{'p50':>10}{'p95':>10}")
+    for name, stats in summary["stages"].items():
+        p50, p95 = stats["p50"] * 1000, stats["p95"] * 1000
+        print(f"    {name:<12}{p50:>8.1f}ms{p95:>8.1f}ms")
+    tokens = ", ".join(
+        f"{key.replace('_tokens', '')} {value:.0f}"
+        for key, value in summary["tokens_per_turn"].items()
+    )
+    print(f"    Tokens per turn: {tokens}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise trace files.")
+    parser.add_argument("traces", nargs="+", help="Trace file paths")
+    args = parser.parse_args()
+
+    for trace_path in args.traces:
+        print_summary(trace_path, summarize(load_trace(trace_path)))
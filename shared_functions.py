@@ -5,84 +5,911 @@ Author: Gemma McLean
 Date: August 2025
 """
 
+import base64
+from contextlib import nullcontext
+import csv
+import cv2
+import json
+import mimetypes
+import numpy as np
+import os
+import threading
+import time
 
-def capture(dc, frame_counter, save_dir):
+from upload_cache import hash_bytes
+
+INLINE_MAX_BYTES = 256 * 1024  # Largest image sent inline, larger images are uploaded
+CAPTURE_BEST_OF = 10  # Number of recent frames to pick the best capture from
+JPEG_QUALITY = 90  # Default JPEG quality of preprocessed images
+HASH_SIZE = 16  # Perceptual hashes compare a HASH_SIZE x HASH_SIZE grid of gradients
+DUPLICATE_THRESHOLD = 0.05  # Max fraction of differing hash bits of near-duplicates
+
+
+def connect_sensor(multi=False):
+    """
+    Connect to the DIGIT sensor, set it to QVGA 30fps and start the frame grabber.
+    The DIGIT libraries are imported here so that they load in parallel with the
+    OpenAI SDK when startup runs in threads.
+
+    Args:
+        multi (bool, optional): Whether to connect every DIGIT as a DigitPool.
+
+    Returns:
+        DigitController or DigitPool: The controller or pool (its digit is None if
+            not connected).
+    """
+
+    if multi:
+        from digit_pool import DigitPool
+
+        # Setup every DIGIT sensor
+        pool = DigitPool()
+        if pool.digit is not None:
+            pool.set_qvga_30fps()
+            pool.start_grabbers()
+        return pool
+
+    from digit_controller import DigitController
+
+    # Setup DIGIT sensor
+    dc = DigitController()
+    # If the DIGIT sensor is connected
+    if dc.digit is not None:
+        # Set the stream to QVGA 30fps
+        dc.set_qvga_30fps()
+        # Keep recent frames in the background so captures are instant
+        dc.start_grabber()
+    return dc
+
+
+def create_client(warm_up=True):
+    """
+    Create the OpenAI client and optionally open its HTTP connection in advance.
+    Its requests are paced and retried by the shared request scheduler (see
+    request_scheduler.py) instead of the SDK.
+    The OpenAI SDK is imported here because it is slow to import.
+
+    Args:
+        warm_up (bool, optional): Whether to make a cheap request so the connection
+            (and TLS handshake) is ready before the first real request.
+
+    Returns:
+        OpenAI: The OpenAI client instance.
+    """
+
+    from openai import APIStatusError, OpenAI
+    from request_scheduler import shared_scheduler
+
+    client = OpenAI(http_client=shared_scheduler().http_client(), max_retries=0)
+    if warm_up:
+        try:
+            client.models.list()
+        except APIStatusError:
+            # Any response means the connection is open
+            pass
+        except Exception as e:
+            # The connection is only warmed up, so carry on without it
+            print(f"Failed to warm up the OpenAI connection: {e}")
+    return client
+
+
+def create_async_client(client=None):
+    """
+    Create the async OpenAI client, sharing the request scheduler with the other
+    clients so that all of their requests are paced and prioritised together.
+
+    Args:
+        client (OpenAI, optional): A client whose base URL and API key to use
+            (defaults to those of the environment).
+
+    Returns:
+        AsyncOpenAI: The async OpenAI client instance.
+    """
+
+    from openai import AsyncOpenAI
+    from request_scheduler import shared_scheduler
+
+    settings = {}
+    if client is not None:
+        settings = {"base_url": client.base_url, "api_key": client.api_key}
+    return AsyncOpenAI(
+        http_client=shared_scheduler().async_http_client(), max_retries=0, **settings
+    )
+
+
+def capture(dc, frame_counter, save_dir=None, auto=False, view=True, trace=None):
     """
-    Show the DIGIT live view and then capture and save a frame.
+    Show the DIGIT live view and then capture a frame as an in-memory jpg.
+
+    If the controller's background grabber is running, the sharpest of the last
+    CAPTURE_BEST_OF frames is captured rather than whatever frame happens to be current.
+    In auto mode there is no live view: the frame is captured as soon as the sensor
+    makes stable contact with the object.
+    If a save directory is given, the frame is also written to disk in the background
+    so that saving does not delay uploading it.
 
     Args:
         dc (DigitController): The DIGIT controller instance.
         frame_counter (int): The current frame counter.
-        save_dir (str): The directory to save the captured frame.
+        save_dir (str, optional): The directory to save the captured frame.
+        auto (bool, optional): Whether to capture automatically on contact.
+        view (bool, optional): Whether to show the live view first. The session
+            engine shows it on the main thread itself, before capturing in a worker
+            thread, so its captures pass False.
+        trace (Turn, optional): Records the live_view and encode stage timings.
+
+    Returns:
+        tuple: The path (or file name if not saved) and the bytes of the captured frame.
+
+    Raises:
+        RuntimeError: If the frame could not be encoded (or no device is connected).
+    """
+
+    with _span(trace, "live_view"):
+        if auto:
+            # Wait for the user to press the sensor onto the object
+            print("Waiting for contact...")
+            frame = dc.wait_for_contact()
+        else:
+            if view:
+                # Show live view to help user position sensor
+                print("Showing live view. Hit ESC to close window.")
+                dc.show_view()
+            # User hits ESC...
+            frame = dc.best_frame(CAPTURE_BEST_OF) if dc.is_grabbing() else None
+    with _span(trace, "encode"):
+        image_bytes = dc.get_frame_bytes(".jpg", frame=frame)
+    if image_bytes is None:
+        raise RuntimeError("Could not encode the captured frame.")
+    frame_path = f"frame_{frame_counter}.jpg"
+    # Optionally save the frame off the critical path
+    if save_dir is not None:
+        frame_path = f"{save_dir}/{frame_path}"
+        save_bytes_in_background(frame_path, image_bytes)
+    # Return the path and bytes of the captured frame
+    return frame_path, image_bytes
+
+
+def _span(trace, name):
+    """
+    Time a stage of a traced turn, or do nothing if the turn is not traced.
+
+    Args:
+        trace (Turn or None): The turn being traced.
+        name (str): The name of the stage.
+
+    Returns:
+        The context manager timing the stage.
+    """
+
+    return trace.span(name) if trace is not None else nullcontext()
+
+
+def capture_set(pool, frame_counter, save_dir=None, auto=False, view=True, trace=None):
+    """
+    Capture a time-aligned set of frames, one from each sensor of a DigitPool.
+
+    In manual mode the live views of every sensor are shown side by side and the set
+    is captured when ESC is pressed. In auto mode the set is captured as soon as any
+    sensor makes stable contact, aligned at the time of its best contact frame (which
+    is part of the set).
+
+    Args:
+        pool (DigitPool): The pool of DIGIT sensors.
+        frame_counter (int): The current frame counter.
+        save_dir (str, optional): The directory to save the captured frames.
+        auto (bool, optional): Whether to capture automatically on contact.
+        view (bool, optional): Whether to show the live views first (see capture).
+        trace (Turn, optional): Records the live_view and encode stage timings.
+
+    Returns:
+        list: The path (or file name if not saved) and bytes of each captured frame,
+            named frame_<counter>_<sensor>.jpg.
+
+    Raises:
+        RuntimeError: If a frame could not be encoded.
+    """
+
+    with _span(trace, "live_view"):
+        target = None
+        if auto:
+            print("Waiting for contact...")
+            _, _, target = pool.wait_for_contact()
+        elif view:
+            print("Showing live views. Hit ESC to close window.")
+            pool.show_view()
+        frames, skew = pool.aligned_frames(target)
+    print(f"Captured {len(frames)} frames within {skew * 1000:.1f}ms.")
+
+    captured = []
+    for sensor, (dc, frame) in enumerate(zip(pool.controllers, frames), start=1):
+        with _span(trace, "encode"):
+            image_bytes = dc.get_frame_bytes(".jpg", frame=frame)
+        if image_bytes is None:
+            raise RuntimeError(f"Could not encode the frame of sensor {sensor}.")
+        frame_path = f"frame_{frame_counter}_{sensor}.jpg"
+        if save_dir is not None:
+            frame_path = f"{save_dir}/{frame_path}"
+            save_bytes_in_background(frame_path, image_bytes)
+        captured.append((frame_path, image_bytes))
+    return captured
+
+
+def save_bytes_in_background(path, data):
+    """
+    Write bytes to a file in a background thread.
+
+    Args:
+        path (str): The path of the file to write.
+        data (bytes): The bytes to write.
 
     Returns:
-        str: The path of the captured frame.
+        Thread: The started writer thread.
     """
 
-    # Show live view to help user position sensor
-    print("Showing live view. Hit ESC to close window.")
-    dc.digit.show_view()
-    # User hits ESC...
-    dc.save_frame(save_dir, frame_counter)
-    # Return the path of the captured frame
-    return f"{save_dir}/frame_{frame_counter}.jpg"
+    def write():
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"Saved {path}")
+
+    # Non-daemon so pending writes finish before the interpreter exits
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
 
 
-def create_file(client, file_path):
+def create_file(client, file, cache=None, filename=None):
     """
     Create a file with the OpenAI Files API.
     Taken from https://platform.openai.com/docs/
 
+    If an upload cache is given, files whose bytes have already been uploaded are
+    not uploaded again and the cached file ID is returned instead.
+
     Args:
         client (OpenAI): The OpenAI client instance.
-        file_path (str): The path to the file to be created.
+        file (str or bytes): The path to the file to be created, or its content.
+        cache (UploadCache, optional): The content-addressed upload cache.
+        filename (str, optional): The name to upload the file as (defaults to the
+            base name of the path, or image.jpg for bytes).
+
+    Returns:
+        str: The ID of the created file.
+    """
+
+    filename, data = _read_file(file, filename)
+
+    # Reuse a previous upload of identical bytes if there is one
+    digest = hash_bytes(data)
+    if cache is not None:
+        file_id = cache.get(client, digest)
+        if file_id is not None:
+            return file_id
+
+    result = client.files.create(
+        file=(filename, data),
+        purpose="vision",
+    )
+
+    # Remember the upload for next time
+    if cache is not None:
+        cache.put(digest, result.id)
+    return result.id
+
+
+def _read_file(file, filename=None):
+    """
+    Return the upload name and content of a file given as a path or as bytes.
+
+    Args:
+        file (str or bytes): The path to the file, or its content.
+        filename (str, optional): The name to upload the file as.
+
+    Returns:
+        tuple: The file name and the file content.
+    """
+
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return filename or "image.jpg", bytes(file)
+    with open(file, "rb") as f:
+        return filename or os.path.basename(file), f.read()
+
+
+async def create_file_async(client, file, cache=None, filename=None):
+    """
+    Create a file with the OpenAI Files API using an async client.
+    Behaves the same as create_file.
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        file (str or bytes): The path to the file to be created, or its content.
+        cache (UploadCache, optional): The content-addressed upload cache.
+        filename (str, optional): The name to upload the file as.
 
     Returns:
         str: The ID of the created file.
     """
-    with open(file_path, "rb") as file_content:
-        result = client.files.create(
-            file=file_content,
-            purpose="vision",
+
+    filename, data = _read_file(file, filename)
+
+    # Reuse a previous upload of identical bytes if there is one
+    digest = hash_bytes(data)
+    if cache is not None:
+        file_id = await cache.get_async(client, digest)
+        if file_id is not None:
+            return file_id
+
+    result = await client.files.create(
+        file=(filename, data),
+        purpose="vision",
+    )
+
+    # Remember the upload for next time
+    if cache is not None:
+        cache.put(digest, result.id)
+    return result.id
+
+
+def image_input(
+    client,
+    image,
+    inline=False,
+    cache=None,
+    filename=None,
+    max_inline_bytes=None,
+    trace=None,
+):
+    """
+    Build an input_image content item for an image.
+
+    Inline images are sent as base64 data URLs in the request itself, which saves
+    the Files API round trip. Images larger than max_inline_bytes are uploaded with
+    create_file instead.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        image (str or bytes): The path to the image, or its content.
+        inline (bool, optional): Whether to send the image inline.
+        cache (UploadCache, optional): The content-addressed upload cache.
+        filename (str, optional): The name of the image.
+        max_inline_bytes (int, optional): The largest image sent inline
+            (defaults to INLINE_MAX_BYTES).
+        trace (Turn, optional): Records the upload stage timing.
+
+    Returns:
+        dict: The input_image content item.
+    """
+
+    filename, data = _read_file(image, filename)
+    if max_inline_bytes is None:
+        max_inline_bytes = INLINE_MAX_BYTES
+
+    with _span(trace, "upload"):
+        # Send small images inline
+        if inline and len(data) <= max_inline_bytes:
+            return {"type": "input_image", "image_url": _data_url(data, filename)}
+
+        # Otherwise upload them with the Files API
+        file_id = create_file(client, data, cache=cache, filename=filename)
+    return {"type": "input_image", "file_id": file_id}
+
+
+async def image_input_async(
+    client,
+    image,
+    inline=False,
+    cache=None,
+    filename=None,
+    max_inline_bytes=None,
+    trace=None,
+):
+    """
+    Build an input_image content item for an image using an async client.
+    Behaves the same as image_input.
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        image (str or bytes): The path to the image, or its content.
+        inline (bool, optional): Whether to send the image inline.
+        cache (UploadCache, optional): The content-addressed upload cache.
+        filename (str, optional): The name of the image.
+        max_inline_bytes (int, optional): The largest image sent inline
+            (defaults to INLINE_MAX_BYTES).
+        trace (Turn, optional): Records the upload stage timing.
+
+    Returns:
+        dict: The input_image content item.
+    """
+
+    filename, data = _read_file(image, filename)
+    if max_inline_bytes is None:
+        max_inline_bytes = INLINE_MAX_BYTES
+
+    with _span(trace, "upload"):
+        # Send small images inline
+        if inline and len(data) <= max_inline_bytes:
+            return {"type": "input_image", "image_url": _data_url(data, filename)}
+
+        # Otherwise upload them with the Files API
+        file_id = await create_file_async(
+            client, data, cache=cache, filename=filename
         )
-        return result.id
+    return {"type": "input_image", "file_id": file_id}
 
 
-def create_response(client, model, message, current_response_id, image_id=None):
+def _data_url(data, filename):
+    """
+    Encode image bytes as a base64 data URL.
+
+    Args:
+        data (bytes): The image content.
+        filename (str): The name of the image, used to determine its MIME type.
+
+    Returns:
+        str: The data URL.
+    """
+
+    mime_type = mimetypes.guess_type(filename)[0] or "image/jpeg"
+    encoded = base64.b64encode(data).decode("ascii")
+    return f"data:{mime_type};base64,{encoded}"
+
+
+def create_response(
+    client,
+    model,
+    message,
+    current_response_id,
+    image_id=None,
+    stream=False,
+    images=None,
+    cache=None,
+    trace=None,
+    context=None,
+):
     """
     Create an OpenAI response for the user message with optional image file.
 
+    If stream is True, the output text is printed as it arrives (prefixed with "GPT: ")
+    and the completed response is returned once the stream ends.
+    If a trace is given, the model latency and time to first token are recorded (the
+    same time for responses that are not streamed).
+    If a bounded context is given, it may rewrite the request to keep the size of
+    the conversation the model processes bounded.
+
     Args:
         client (OpenAI): The OpenAI client instance.
         model (str): The model to use for the response.
         message (str): The user message.
         current_response_id (str): The ID of the current response.
         image_id (str, optional): The ID of the image file.
+        stream (bool, optional): Whether to stream the output text to the console.
+        images (list, optional): input_image content items (see image_input) to
+            attach instead of (or as well as) image_id.
+        cache (ResponseCache, optional): Returns cached responses to identical
+            requests and stores new ones.
+        trace (Turn, optional): Records the model and ttft stage timings.
+        context (BoundedContext, optional): Restarts the previous_response_id chain
+            from a compact summary of the session when it gets long.
 
     Returns:
         Response: The created response object.
     """
 
-    # If no image is provided
-    if image_id is None:
-        # Create a text-only response
-        content = [{"type": "input_text", "text": message}]
-    # If an image is provided
-    else:
-        # Create a response with both text and image
-        content = [
-            {"type": "input_text", "text": message},
-            {"type": "input_image", "file_id": image_id},
-        ]
-    # Build and return the response
-    response = client.responses.create(
-        model=model,
-        input=[{"role": "user", "content": content}],
-        previous_response_id=current_response_id,
-    )
+    # Build the request, keep the conversation bounded, then send it
+    request = _build_request(model, message, current_response_id, image_id, images)
+    if context is not None:
+        request = context.prepare(request)
+    response = _send_request(client, request, stream, cache, trace)
+    if context is not None:
+        context.update(response)
     return response
 
 
+async def create_response_async(
+    client,
+    model,
+    message,
+    current_response_id,
+    image_id=None,
+    stream=False,
+    images=None,
+    cache=None,
+    trace=None,
+    context=None,
+):
+    """
+    Create an OpenAI response for the user message using an async client.
+    Behaves the same as create_response, and can be cancelled while in flight (the
+    request or stream is closed). The context only records responses that arrive,
+    so a restart of the chain that is cancelled or fails is retried on the next turn.
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        model (str): The model to use for the response.
+        message (str): The user message.
+        current_response_id (str): The ID of the current response.
+        image_id (str, optional): The ID of the image file.
+        stream (bool, optional): Whether to stream the output text to the console.
+        images (list, optional): input_image content items (see image_input) to
+            attach instead of (or as well as) image_id.
+        cache (ResponseCache, optional): Returns cached responses to identical
+            requests and stores new ones.
+        trace (Turn, optional): Records the model and ttft stage timings.
+        context (BoundedContext, optional): Restarts the previous_response_id chain
+            from a compact summary of the session when it gets long.
+
+    Returns:
+        Response: The created response object.
+    """
+
+    # Build the request, keep the conversation bounded, then send it
+    request = _build_request(model, message, current_response_id, image_id, images)
+    if context is not None:
+        request = context.prepare(request)
+    response = await _send_request_async(client, request, stream, cache, trace)
+    if context is not None:
+        context.update(response)
+    return response
+
+
+def _build_request(model, message, current_response_id, image_id, images):
+    """
+    Build a Responses API request (see create_response).
+
+    Args:
+        model (str): The model to use for the response.
+        message (str): The user message.
+        current_response_id (str): The ID of the current response.
+        image_id (str or None): The ID of the image file.
+        images (list or None): input_image content items to attach.
+
+    Returns:
+        dict: The keyword arguments of responses.create.
+    """
+
+    # Start with the text of the message
+    content = [{"type": "input_text", "text": message}]
+    # If an image file is provided, attach it
+    if image_id is not None:
+        content.append({"type": "input_image", "file_id": image_id})
+    # If image content items are provided, attach them
+    if images:
+        content.extend(images)
+
+    # Build the request
+    return {
+        "model": model,
+        "input": [{"role": "user", "content": content}],
+        "previous_response_id": current_response_id,
+    }
+
+
+def _send_request(client, request, stream, cache, trace):
+    """
+    Send a Responses API request (see create_response).
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        request (dict): The keyword arguments of responses.create.
+        stream (bool): Whether to stream the output text to the console.
+        cache (ResponseCache or None): The cache of previous responses.
+        trace (Turn or None): Records the model and ttft stage timings.
+
+    Returns:
+        Response: The created response object.
+    """
+
+    start = time.perf_counter()
+
+    # Return a cached response to an identical request if there is one
+    if cache is not None:
+        cached = cache.lookup(request)
+        if cached is not None:
+            if stream:
+                print("GPT: ", cached.output_text)
+            _add_model_time(trace, start)
+            return cached
+
+    # Create the response
+    response = client.responses.create(**request, stream=stream)
+
+    # Return the response directly if not streaming
+    if not stream:
+        _add_model_time(trace, start)
+        if cache is not None:
+            cache.store(request, response)
+        return response
+
+    # Otherwise print the output text as it arrives and return the completed response
+    print("GPT: ", end="", flush=True)
+    completed = None
+    first_token = None
+    for event in response:
+        if first_token is None and event.type == "response.output_text.delta":
+            first_token = time.perf_counter()
+        completed = _handle_event(event) or completed
+    print()
+    if completed is None:
+        raise RuntimeError("Stream ended before the response completed.")
+    _add_model_time(trace, start, first_token)
+    if cache is not None:
+        cache.store(request, completed)
+    return completed
+
+
+async def _send_request_async(client, request, stream, cache, trace):
+    """
+    Send a Responses API request using an async client (see _send_request).
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        request (dict): The keyword arguments of responses.create.
+        stream (bool): Whether to stream the output text to the console.
+        cache (ResponseCache or None): The cache of previous responses.
+        trace (Turn or None): Records the model and ttft stage timings.
+
+    Returns:
+        Response: The created response object.
+    """
+
+    start = time.perf_counter()
+
+    # Return a cached response to an identical request if there is one
+    if cache is not None:
+        cached = cache.lookup(request)
+        if cached is not None:
+            if stream:
+                print("GPT: ", cached.output_text)
+            _add_model_time(trace, start)
+            return cached
+
+    # Create the response
+    response = await client.responses.create(**request, stream=stream)
+
+    # Return the response directly if not streaming
+    if not stream:
+        _add_model_time(trace, start)
+        if cache is not None:
+            cache.store(request, response)
+        return response
+
+    # Otherwise print the output text as it arrives and return the completed response
+    print("GPT: ", end="", flush=True)
+    completed = None
+    first_token = None
+    # Closing the stream on the way out aborts it if the request is cancelled
+    async with response:
+        async for event in response:
+            if first_token is None and event.type == "response.output_text.delta":
+                first_token = time.perf_counter()
+            completed = _handle_event(event) or completed
+    print()
+    if completed is None:
+        raise RuntimeError("Stream ended before the response completed.")
+    _add_model_time(trace, start, first_token)
+    if cache is not None:
+        cache.store(request, completed)
+    return completed
+
+
+def _handle_event(event):
+    """
+    Handle an event of a streamed response, printing any output text.
+
+    Args:
+        event: The streamed event.
+
+    Returns:
+        Response: The completed response, if this is the completed event.
+        None: For any other event.
+    """
+
+    if event.type == "response.output_text.delta":
+        print(event.delta, end="", flush=True)
+    elif event.type == "response.completed":
+        return event.response
+    elif event.type in ("response.failed", "response.incomplete", "error"):
+        print()
+        raise RuntimeError(f"Streamed response did not complete: {event.type}")
+    return None
+
+
+def _add_model_time(trace, start, first_token=None):
+    """
+    Record the model latency and time to first token of a traced turn.
+
+    Args:
+        trace (Turn or None): The turn being traced.
+        start (float): The perf_counter time the request started.
+        first_token (float, optional): The perf_counter time the first output text
+            arrived (defaults to now, i.e. the whole response at once).
+    """
+
+    if trace is None:
+        return
+    end = time.perf_counter()
+    trace.add("model", end - start)
+    trace.add("ttft", (first_token or end) - start)
+
+
+def preprocess_image(image, crop=None, scale=1.0, quality=JPEG_QUALITY):
+    """
+    Crop, downscale and re-encode an image to reduce the image tokens it costs.
+
+    Args:
+        image (str or bytes): The path to the image, or its encoded content.
+        crop (tuple, optional): The (x, y, width, height) region to keep, e.g. the
+            gel region of the DIGIT frame.
+        scale (float, optional): The factor to resize the image by.
+        quality (int, optional): The JPEG quality (0-100) to encode with.
+
+    Returns:
+        bytes: The preprocessed image encoded as a jpg.
+    """
+
+    frame = _decode_image(image)
+    # Crop to the region of interest
+    if crop is not None:
+        x, y, width, height = crop
+        frame = frame[y : y + height, x : x + width]
+    # Downscale (area interpolation avoids aliasing)
+    if scale != 1.0:
+        frame = cv2.resize(
+            frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+    return _encode_jpg(frame, quality)
+
+
+def make_mosaic(images, labels=None, columns=3, quality=JPEG_QUALITY):
+    """
+    Tile several images into a single labelled mosaic image.
+
+    Args:
+        images (list): The images, as paths or encoded bytes. Images are resized to
+            the size of the first image.
+        labels (list, optional): A label drawn in the corner of each tile
+            (defaults to 1, 2, 3, ...).
+        columns (int, optional): The number of tiles per row.
+        quality (int, optional): The JPEG quality (0-100) to encode with.
+
+    Returns:
+        bytes: The mosaic encoded as a jpg.
+    """
+
+    frames = [_decode_image(image) for image in images]
+    height, width = frames[0].shape[:2]
+    if labels is None:
+        labels = [str(i) for i in range(1, len(frames) + 1)]
+
+    # Preallocate the mosaic (unused tiles stay black)
+    rows = -(-len(frames) // columns)
+    mosaic = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for i, (frame, label) in enumerate(zip(frames, labels)):
+        if frame.shape[:2] != (height, width):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        row, column = divmod(i, columns)
+        y, x = row * height, column * width
+        tile = mosaic[y : y + height, x : x + width]
+        tile[:] = frame
+        # Draw the label with an outline so it is readable on any background
+        for colour, thickness in (((0, 0, 0), 4), ((255, 255, 255), 2)):
+            cv2.putText(
+                tile, label, (8, 32), cv2.FONT_HERSHEY_SIMPLEX, 1.0, colour, thickness
+            )
+    return _encode_jpg(mosaic, quality)
+
+
+def _decode_image(image):
+    """
+    Decode an image given as a path or encoded bytes.
+
+    Args:
+        image (str or bytes): The path to the image, or its encoded content.
+
+    Returns:
+        np.ndarray: The decoded BGR image.
+    """
+
+    _, data = _read_file(image)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _encode_jpg(frame, quality):
+    """
+    Encode an image as a jpg.
+
+    Args:
+        frame (np.ndarray): The BGR image.
+        quality (int): The JPEG quality (0-100).
+
+    Returns:
+        bytes: The encoded image.
+    """
+
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def perceptual_hash(image):
+    """
+    Compute the perceptual difference hash (dHash) of an image.
+    Each bit records whether a cell of the downsampled greyscale image is brighter
+    than its right-hand neighbour, so the hash ignores compression artefacts and
+    sensor noise but changes when the contact changes.
+
+    Args:
+        image (str or bytes): The path to the image, or its encoded content.
+
+    Returns:
+        np.ndarray: The hash, packed into HASH_SIZE * HASH_SIZE / 8 bytes.
+    """
+
+    grey = cv2.cvtColor(_decode_image(image), cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(
+        grey, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA
+    ).astype(np.int16)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def find_duplicate(image_hash, hashes, threshold=DUPLICATE_THRESHOLD):
+    """
+    Find the closest near-duplicate of an image among previously hashed images.
+
+    Args:
+        image_hash (np.ndarray): The perceptual hash of the image.
+        hashes (list): The perceptual hashes of the previous images.
+        threshold (float): The max fraction of differing bits of a near-duplicate.
+
+    Returns:
+        int: The index of the closest near-duplicate.
+        None: If there is no near-duplicate.
+    """
+
+    if not hashes:
+        return None
+    # Hamming distance to every previous hash at once
+    differing = np.unpackbits(np.stack(hashes) ^ image_hash, axis=1).mean(axis=1)
+    closest = int(np.argmin(differing))
+    return closest if differing[closest] <= threshold else None
+
+
+def record_usage(response, log_path, latency, settings=None):
+    """
+    Append the token usage reported by a response to a CSV log.
+
+    Args:
+        response (Response): The response object.
+        log_path (str): The path of the CSV log.
+        latency (float): The seconds taken to get the response.
+        settings (dict, optional): The settings used for the request (e.g. image
+            preprocessing), stored as JSON so results can be compared per setting.
+    """
+
+    usage = response.usage
+    input_details = getattr(usage, "input_tokens_details", None)
+    output_details = getattr(usage, "output_tokens_details", None)
+    row = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model": response.model,
+        "response_id": response.id,
+        "latency": f"{latency:.3f}",
+        "cached": getattr(response, "cached", False),
+        "input_tokens": usage.input_tokens if usage else "",
+        "cached_tokens": getattr(input_details, "cached_tokens", ""),
+        "output_tokens": usage.output_tokens if usage else "",
+        "reasoning_tokens": getattr(output_details, "reasoning_tokens", ""),
+        "settings": json.dumps(settings or {}, sort_keys=True),
+    }
+
+    # Write the header if the log is new
+    write_header = not os.path.exists(log_path)
+    with open(log_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(row))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+
+
 def save_log(conversation_list, save_dir):
     """
     Save the conversation log list to a text file.
@@ -11,141 +11,288 @@ Author: Gemma McLean
 Date: August 2025
 """
 
-from digit_controller import DigitController
+import argparse
+import asyncio
+from bounded_context import BoundedContext
+from concurrent.futures import ThreadPoolExecutor
+from ensemble import Ensemble, parse_choices, true_label
 import os
-from openai import OpenAI
+from response_cache import ResponseCache
+from session_engine import SessionEngine
+from session_journal import resume_state, SessionJournal
+from session_trace import Tracer
 import shared_functions
+from upload_cache import UploadCache
 
 MODEL = "gpt-5-mini"
 PROMPT_TYPE = "multi-choice"  # Can be multi-choice or open-ended
+STREAM = True  # Print GPT output as it arrives rather than when it is complete
+SAVE_CAPTURES = True  # Save captured frames to the captures folder (in the background)
+IMAGE_MODE = "inline"  # Can be inline (base64 in the request) or file (Files API)
+CAPTURE_MODE = "manual"  # Can be manual (ESC in live view) or auto (on contact)
+# Capture preprocessing settings, e.g. {"crop": (0, 40, 240, 240), "scale": 0.5}
+PREPROCESS = None
+RESPONSE_CACHE = None  # Can be None (off), record or replay
+# Bounded context settings for long sessions, e.g.
+# {"max_images": 4, "restart_every": 6, "old_images": "low", "max_turns": 12}
+# (None chains every turn)
+CONTEXT = None
+MULTI_SENSOR = False  # Connect every DIGIT and capture a frame from each per probe
+# What to do with captures that nearly duplicate one already sent this session.
+# Can be None (send anyway), warn (send with a warning) or skip (not sent)
+DUPLICATE_MODE = "warn"
+# Ensemble asked for the final prediction (command f), e.g.
+# {"models": ["gpt-5-mini", "gpt-5"], "samples": 3, "aggregate": "vote"}
+ENSEMBLE = None
 
 
-def chat_loop():
-    """Main loop for handling user input and generating responses."""
+def load_initial():
+    """
+    Load the initial prompt.
 
-    # Initialise previous_response_id to None for the first interaction
-    current_response_id = None
+    Returns:
+        str: The initial prompt.
+    """
 
-    # Initialise variables
-    conversation_list = []
-    first_time = True
-    capture_response = False
-    frame_counter = 1
+    # Determine the prompt file based on the prompt type
+    if PROMPT_TYPE == "open-ended":
+        prompt_file = f"{current_dir}/simple_active/initial/prompt.txt"
+    else:
+        prompt_file = f"{current_dir}/simple_active/initial/prompt_multi_choice.txt"
 
-    # Run until user exits
-    while True:
-        # When running for the first time, send the initial prompt
-        if first_time:
-            # Determine the prompt file based on the prompt type
-            if PROMPT_TYPE == "open-ended":
-                prompt_file = f"{current_dir}/simple_active/initial/prompt.txt"
-            else:
-                prompt_file = f"{current_dir}/simple_active/initial/prompt_multi_choice.txt"
+    # Get initial prompt as a string from the txt file
+    with open(prompt_file, "r") as f:
+        return f.read()
 
-            # Get initial prompt as a string from the txt file
-            with open(prompt_file, "r") as f:
-                initial_prompt = f.read()
 
-            # Create initial capture
-            save_dir = f"{current_dir}/simple_active/captures"
-            frame_path = shared_functions.capture(dc, frame_counter, save_dir)
-            file_id = shared_functions.create_file(client, frame_path)
+def capture_images(frame_counter, turn, sent_frames):
+    """
+    Capture a frame with the DIGIT sensor (or a time-aligned frame from each sensor
+    if MULTI_SENSOR is set) and build the image inputs (inline or uploaded).
 
-            # Instead of appending entire initial prompt, just append a summary
-            conversation_list.append(
-                f"Initial {PROMPT_TYPE} prompt and initial tactile image sent."
-            )
-            print("Sending initial prompt...")
-            print("GPT is thinking...")
+    Before anything is uploaded, the capture is compared with every frame already
+    sent this session by perceptual hash, and near-duplicates are handled according
+    to DUPLICATE_MODE.
+
+    Args:
+        frame_counter (int): The current frame counter.
+        turn (Turn): Records the stage timings of the turn.
+        sent_frames (list): The (name, perceptual hash) of each frame sent this
+            session.
 
-            # Create the response
-            response = shared_functions.create_response(
-                client, MODEL, initial_prompt, current_response_id, image_id=file_id
+    Returns:
+        tuple: The input_image content items, a line naming the captured files and
+            the (name, perceptual hash) of each captured frame, to add to sent_frames
+            once the turn is sent.
+        None: If the capture was a near-duplicate and skipped.
+    """
+
+    save_dir = None
+    if SAVE_CAPTURES:
+        save_dir = f"{output_dir}/captures"
+    auto = CAPTURE_MODE == "auto"
+    # The session engine has already shown the live view on the main thread
+    if MULTI_SENSOR:
+        frames = shared_functions.capture_set(
+            dc, frame_counter, save_dir, auto=auto, view=False, trace=turn
+        )
+    else:
+        frames = [
+            shared_functions.capture(
+                dc, frame_counter, save_dir, auto=auto, view=False, trace=turn
             )
+        ]
+    names = [f"captures/{os.path.basename(p)}" for p, _ in frames]
 
-            # Increment frame counter and set capture flag
-            frame_counter += 1
-            capture_response = True
-
-            # Set the first_time flag to False
-            first_time = False
-        else:
-            # Get user input
-            user_input = input("You: ")
-
-            # Respond to user input
-            if user_input.lower() == "x":
-                # Exit the loop and terminate and save the conversation
-                print("Conversation terminated.")
-                save_dir = f"{current_dir}/simple_active"
-                shared_functions.save_log(conversation_list, save_dir)
-                break
-            elif user_input.lower().startswith("#"):
-                # Send message without image
-                user_prompt = user_input
-            else:
-                # Capture an image with the DIGIT sensor
-                save_dir = f"{current_dir}/simple_active/captures"
-                frame_path = shared_functions.capture(dc, frame_counter, save_dir)
-                # Set file_id
-                file_id = shared_functions.create_file(client, frame_path)
-                # Extract filename from path
-                frame_filename = os.path.basename(frame_path)
-                # Append user input with image path
-                user_prompt = user_input + "\n" + f"captures/{frame_filename} attached."
-                # Increment frame counter and set capture flag
-                frame_counter += 1
-                capture_response = True
-
-            # Append user prompt to conversation list
-            conversation_list.append(user_prompt)
-
-            print("GPT is thinking...")
-
-            # If it was a capture action
-            if capture_response:
-                # Create the response with the image file
-                response = shared_functions.create_response(
-                    client, MODEL, user_prompt, current_response_id, image_id=file_id
-                )
-                # Reset the flag
-                capture_response = False
-            # If it was any other input
-            else:
-                # Create the response with just text
-                response = shared_functions.create_response(
-                    client, MODEL, user_prompt, current_response_id
+    # Look for earlier frames of the same spot (all sensors must match for a set)
+    with turn.span("dedupe"):
+        hashes = [shared_functions.perceptual_hash(b) for _, b in frames]
+        sent_hashes = [h for _, h in sent_frames]
+        matches = [shared_functions.find_duplicate(h, sent_hashes) for h in hashes]
+    if DUPLICATE_MODE is not None and sent_frames and None not in matches:
+        earlier = ", ".join(sent_frames[m][0] for m in matches)
+        print(f"{', '.join(names)} nearly duplicates {earlier}.")
+        if DUPLICATE_MODE == "skip":
+            print("Capture skipped. Reposition the sensor and try again.")
+            return None
+
+    images = []
+    for frame_path, frame_bytes in frames:
+        # Shrink the frame to reduce image tokens
+        if PREPROCESS is not None:
+            with turn.span("encode"):
+                frame_bytes = shared_functions.preprocess_image(
+                    frame_bytes, **PREPROCESS
                 )
+        # Build the image input (inline or uploaded)
+        images.append(
+            shared_functions.image_input(
+                client,
+                frame_bytes,
+                inline=IMAGE_MODE == "inline",
+                cache=upload_cache,
+                filename=os.path.basename(frame_path),
+                trace=turn,
+            )
+        )
+
+    # Name the captured files (e.g. captures/frame_1.jpg attached.)
+    return images, f"{', '.join(names)} attached.", list(zip(names, hashes))
+
+
+def chat_loop(resume=None, initial=None):
+    """
+    Run the session on the session engine until the user exits.
+
+    Args:
+        resume (dict, optional): The state of a previous session to continue
+            (see session_journal.resume_state).
+        initial (str, optional): The initial prompt, if already loaded
+            (see load_initial).
+    """
+
+    # The (name, perceptual hash) of each frame sent, to spot near-duplicates
+    sent_frames = []
+    # The frames of each turn not sent yet, added to sent_frames once it is sent
+    # (frames of cancelled or failed turns were never seen by GPT)
+    pending_frames = {}
 
-        # Update the current_response_id
-        current_response_id = response.id
+    def initial_turn(frame_counter, turn):
+        # Load the initial prompt unless done during startup
+        initial_prompt = initial if initial is not None else load_initial()
+        # Create initial capture
+        images, _, frames = capture_images(frame_counter, turn, sent_frames)
+        pending_frames[turn] = frames
+        # Instead of logging the entire initial prompt, just log a summary
+        summary = f"Initial {PROMPT_TYPE} prompt and initial tactile image sent."
+        return initial_prompt, images, summary, True
 
-        # Print the response
-        print("GPT: ", response.output_text)
-        # Append the response to the conversation list
-        conversation_list.append(response.output_text)
+    def capture_turn(user_input, frame_counter, turn):
+        # Capture an image with the DIGIT sensor
+        captured = capture_images(frame_counter, turn, sent_frames)
+        # Skip the turn if the capture nearly duplicates an earlier one
+        if captured is None:
+            return None
+        images, attached, frames = captured
+        pending_frames[turn] = frames
+        # Append user input with image path
+        return user_input + "\n" + attached, images
 
+    def turn_end(turn, sent):
+        frames = pending_frames.pop(turn, [])
+        if sent:
+            sent_frames.extend(frames)
 
-# Setup DIGIT sensor
-dc = DigitController()
+    # Optionally keep the context the model processes bounded
+    context = None
+    # The images of resumed turns are not kept, so a resumed session chains every turn
+    if CONTEXT is not None and resume is None:
+        context = BoundedContext(**CONTEXT)
 
-# If the DIGIT sensor is connected
-if dc.digit is not None:
-    # Set the stream to QVGA 30fps
-    dc.set_qvga_30fps()
+    engine = SessionEngine(
+        client,
+        MODEL,
+        tracer,
+        journal,
+        output_dir,
+        initial_turn,
+        capture_turn,
+        # Any input other than a command is sent with a captured frame
+        capture_default=True,
+        stream=STREAM,
+        response_cache=response_cache,
+        context=context,
+        # Shown on the main thread before each capture in manual capture mode
+        live_view=None if CAPTURE_MODE == "auto" else dc.show_view_async,
+        view_initial=True,
+        settings={"image_mode": IMAGE_MODE, "preprocess": PREPROCESS},
+        ensemble=ensemble,
+        truth=truth,
+        on_turn_end=turn_end,
+        read_input=input,
+    )
+    asyncio.run(engine.run(resume))
 
-    # Initialise OpenAI client
-    client = OpenAI()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simple active exploration with GPT.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous session from its journal",
+    )
+    parser.add_argument(
+        "--object",
+        help="The object being explored, to score the final predictions",
+    )
+    args = parser.parse_args()
 
     # Get current directory of this script
     current_dir = os.path.dirname(os.path.abspath(__file__))
+    # Captures, the conversation log, usage and trace are saved here
+    output_dir = f"{current_dir}/simple_active"
+
+    # Each turn is journalled as it happens, so a crashed session can be resumed
+    journal_path = f"{output_dir}/journal.jsonl"
+    resume = resume_state(journal_path) if args.resume else None
+    if args.resume and resume is None:
+        print("No previous session to resume. Starting a new session.")
+
+    # Start up in parallel: connect the sensor while the OpenAI client is created,
+    # its connection warmed up and the initial prompt loaded
+    with ThreadPoolExecutor() as executor:
+        sensor = executor.submit(shared_functions.connect_sensor, MULTI_SENSOR)
+        openai_client = executor.submit(shared_functions.create_client)
+
+        # Load the upload cache so identical images are not uploaded again
+        upload_cache = UploadCache(f"{current_dir}/upload_cache.json")
+
+        # A resumed session has already sent the initial prompt
+        initial = None
+        if resume is None:
+            initial = executor.submit(load_initial)
+        dc = sensor.result()
+        client = openai_client.result()
+
+    # If the DIGIT sensor is connected
+    if dc.digit is not None:
+        # The stage timings of each turn are appended to trace.jsonl
+        tracer = Tracer(f"{output_dir}/trace.jsonl", script="simple_active")
 
-    # Create captures folder if it doesn't exist
-    if not os.path.exists(f"{current_dir}/simple_active/captures"):
-        os.makedirs(f"{current_dir}/simple_active/captures")
+        # Optionally reuse responses to identical requests from previous sessions
+        response_cache = None
+        if RESPONSE_CACHE is not None:
+            response_cache = ResponseCache(
+                f"{current_dir}/response_cache.sqlite",
+                mode=RESPONSE_CACHE,
+                upload_cache=upload_cache,
+            )
+
+        # Create captures folder if it doesn't exist
+        if SAVE_CAPTURES and not os.path.exists(f"{output_dir}/captures"):
+            os.makedirs(f"{output_dir}/captures")
+
+        # Optionally ask an ensemble for the final prediction, reading the possible
+        # objects from the multi-choice prompt
+        ensemble, truth = None, None
+        if ENSEMBLE is not None:
+            prompt_file = f"{current_dir}/simple_active/initial/prompt_multi_choice.txt"
+            with open(prompt_file, "r") as f:
+                choices = parse_choices(f.read())
+            ensemble = Ensemble(
+                **ENSEMBLE, choices=choices, log_path=f"{output_dir}/ensemble.csv"
+            )
+            if args.object is not None:
+                truth = true_label(args.object, choices)
 
-    # Enter main loop
-    chat_loop()
+        # Start the journal (appending to it if resuming)
+        journal = SessionJournal(journal_path, resume=resume is not None)
 
-    # Disconnect the DIGIT sensor
-    dc.disconnect()
+        try:
+            # Enter main loop
+            chat_loop(resume, initial.result() if initial is not None else None)
+        finally:
+            # Make sure the journal is on disk, even after a crash
+            journal.close()
+            # Disconnect the DIGIT sensor
+            dc.disconnect()
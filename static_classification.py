@@ -4,6 +4,16 @@ It sends GPT a collection of 6 tactile images for each object (images folder).
 It will do this for both prompt types (multi-choice and open-ended).
 It will store the classification predictions in a list and save them to a text file.
 
+The requests can be made one after another (serial mode) or concurrently with the
+async OpenAI client (async mode). In async mode all uploads and all
+(prompt, object, repetition) cells run at once, up to MAX_CONCURRENCY requests in
+flight, and the outputs are still written in the same order as in serial mode.
+In batch mode the requests are submitted as a single Batch API job instead. The job
+is recorded in batch_job.json, so if the script is stopped while the batch is running
+it picks up the same job (rather than submitting a new one) when it is run again.
+In serial and async modes, each cell can instead be classified by an ensemble of
+models and/or samples (see ensemble.py), all sent at once.
+
 Note: the results folder contains collected outputs and a csv file summary.
 This folder was manually populated after each execution of the script.
 
@@ -11,17 +21,49 @@ Author: Gemma McLean
 Date: August 2025
 """
 
-from openai import OpenAI
+import asyncio
+import batch_runner
+from ensemble import Ensemble, parse_choices, true_label
+import json
 import os
+from request_scheduler import shared_scheduler
+from response_cache import ResponseCache
+from session_trace import Tracer
 import shared_functions
+from tactile_index import format_shortlist, INDEX_NAME, MIN_ACCURACY, TactileIndex
+import time
+from upload_cache import UploadCache
 
 MODEL = "gpt-5-mini"
+MODE = "serial"  # Can be serial, async or batch
+REPETITIONS = 1  # Number of times each (prompt, object) cell is classified
+MAX_CONCURRENCY = 8  # Maximum number of requests in flight in async mode
+IMAGE_MODE = "file"  # Can be inline (base64 in the request) or file (Files API)
+RESPONSE_CACHE = None  # Can be None (off), record or replay
+# Image preprocessing settings, e.g. {"crop": (0, 40, 240, 240), "scale": 0.5}
+PREPROCESS = None
+MOSAIC = False  # Tile the 6 images of each object into one labelled mosaic image
+MOSAIC_NOTE = (
+    "The 6 images have been tiled into a single mosaic image, labelled 1 to 6."
+)
+# Local k-NN pre-classification with the index built by tactile_index.py, e.g.
+# {"confidence": 0.8, "shortlist": 3} (None always asks GPT). Only used if the index
+# was validated with at least tactile_index.MIN_ACCURACY
+LOCAL_INDEX = None
+LOCAL_NOTE = (
+    "Hint from a local tactile classifier ({:.0%} accurate in validation, so it "
+    "may be wrong): {}."
+)
+# Ensemble of models and/or samples per cell in serial and async modes, e.g.
+# {"models": ["gpt-5-mini", "gpt-5-nano"], "samples": 3, "aggregate": "vote"}
+# (aggregate can be vote or confidence, None sends each cell to MODEL once)
+ENSEMBLE = None
 
 
 def get_file_paths(dir, exts):
     """
-    Return a list of paths of all files within the given directory with the given
-    extensions.
+    Return a sorted list of paths of all files within the given directory with the
+    given extensions.
 
     Args:
         dir (str): The directory to search for files.
@@ -37,73 +79,602 @@ def get_file_paths(dir, exts):
     # Filter the list to include only files with the given extensions
     matching_files = [f for f in all_files if f.endswith(exts)]
 
-    # Return the full paths of the matching files
-    return [os.path.join(dir, f) for f in matching_files]
+    # Return the full paths of the matching files (sorted for a deterministic order)
+    return sorted(os.path.join(dir, f) for f in matching_files)
 
 
-# Initialise OpenAI client
-client = OpenAI()
+def get_cells(current_dir, repetitions):
+    """
+    Build the list of (prompt, object, repetition) cells to classify.
 
-# Empty list to store outputs
-outputs = []
+    Args:
+        current_dir (str): The directory of this script.
+        repetitions (int): The number of repetitions of each cell.
 
-# Get current directory of this script
-current_dir = os.path.dirname(os.path.abspath(__file__))
+    Returns:
+        list: A list of dictionaries, one per cell, in output order.
+    """
 
-# Get all directory paths from inside images folder
-image_dirs = []
-for img_dir in os.listdir(f"{current_dir}/static/images"):
-    if os.path.isdir(os.path.join(f"{current_dir}/static/images", img_dir)):
-        image_dirs.append(os.path.join(f"{current_dir}/static/images", img_dir))
-# Sort alphabetically
-image_dirs.sort()
+    # Get all directory paths from inside images folder
+    image_dirs = []
+    for img_dir in os.listdir(f"{current_dir}/static/images"):
+        if os.path.isdir(os.path.join(f"{current_dir}/static/images", img_dir)):
+            image_dirs.append(os.path.join(f"{current_dir}/static/images", img_dir))
+    # Sort alphabetically
+    image_dirs.sort()
 
-# Get all txt files from inside prompts folder
-prompts_txt_files = get_file_paths(f"{current_dir}/static/initial", (".txt"))
+    # Get all txt files from inside prompts folder
+    prompts_txt_files = get_file_paths(f"{current_dir}/static/initial", (".txt"))
 
-# For each prompt type
-for prompt_type in prompts_txt_files:
-    # For each image directory (i.e. for each object)
-    for image_dir in image_dirs:
+    cells = []
+    # For each prompt type
+    for prompt_type in prompts_txt_files:
         # Get prompt as a string from the txt file
         with open(prompt_type, "r") as f:
             prompt = f.read()
+        # Explain the mosaic if the images are tiled
+        if MOSAIC:
+            prompt += f"\n\n{MOSAIC_NOTE}"
+        # For each image directory (i.e. for each object)
+        for image_dir in image_dirs:
+            # Get all object image paths
+            object_img_paths = get_file_paths(image_dir, (".jpg", ".jpeg", ".png"))
+            # For each repetition
+            for repetition in range(1, repetitions + 1):
+                cells.append(
+                    {
+                        "prompt_type": prompt_type,
+                        "prompt": prompt,
+                        "image_dir": image_dir,
+                        "image_paths": tuple(object_img_paths),
+                        "repetition": repetition,
+                    }
+                )
+    return cells
+
+
+def load_images(image_paths):
+    """
+    Load the images of a cell, applying any preprocessing and mosaic tiling.
+
+    Args:
+        image_paths (list): The paths of the images.
+
+    Returns:
+        list: A list of (filename, bytes) tuples, one per image to attach.
+    """
+
+    images = []
+    for img_path in image_paths:
+        if PREPROCESS is not None:
+            data = shared_functions.preprocess_image(img_path, **PREPROCESS)
+        else:
+            with open(img_path, "rb") as f:
+                data = f.read()
+        images.append((os.path.basename(img_path), data))
+
+    # Tile all the images into one
+    if MOSAIC:
+        quality = (PREPROCESS or {}).get("quality", shared_functions.JPEG_QUALITY)
+        mosaic = shared_functions.make_mosaic([d for _, d in images], quality=quality)
+        images = [("mosaic.jpg", mosaic)]
+    return images
+
+
+def prepare_images(client, image_paths, upload_cache, trace=None):
+    """
+    Load the images of a cell and build their image inputs (inline or uploaded).
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        image_paths (list): The paths of the images.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        trace (Turn, optional): Records the upload stage timing.
+
+    Returns:
+        list: The input_image content items.
+    """
+
+    return [
+        shared_functions.image_input(
+            client,
+            data,
+            inline=IMAGE_MODE == "inline",
+            cache=upload_cache,
+            filename=filename,
+            trace=trace,
+        )
+        for filename, data in load_images(image_paths)
+    ]
+
 
-        # Get all object image paths
-        object_img_paths = get_file_paths(image_dir, (".jpg", ".jpeg", ".png"))
-        content = [
-            {"type": "input_text", "text": prompt},
-        ]
-
-        # Create a file for each object image and append to content
-        for img_path in object_img_paths:
-            file_id = shared_functions.create_file(client, img_path)
-            content.append(
-                {
-                    "type": "input_image",
-                    "file_id": file_id,
-                }
+async def prepare_images_async(client, image_paths, upload_cache):
+    """
+    Load the images of a cell and build their image inputs using an async client.
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        image_paths (list): The paths of the images.
+        upload_cache (UploadCache): The content-addressed upload cache.
+
+    Returns:
+        list: The input_image content items.
+    """
+
+    return await asyncio.gather(
+        *(
+            shared_functions.image_input_async(
+                client,
+                data,
+                inline=IMAGE_MODE == "inline",
+                cache=upload_cache,
+                filename=filename,
             )
+            for filename, data in load_images(image_paths)
+        )
+    )
+
+
+def get_settings():
+    """
+    Return the image settings of this run, recorded with the token usage.
+
+    Returns:
+        dict: The image settings.
+    """
+
+    return {"image_mode": IMAGE_MODE, "preprocess": PREPROCESS, "mosaic": MOSAIC}
+
+
+def build_input(prompt, images):
+    """
+    Build the response input for a prompt and a list of images.
+
+    Args:
+        prompt (str): The prompt text.
+        images (list): The input_image content items of the images.
+
+    Returns:
+        list: The input list for the Responses API.
+    """
+
+    content = [
+        {"type": "input_text", "text": prompt},
+    ]
+    # Append each image to content
+    content.extend(images)
+    return [
+        {
+            "role": "user",
+            "content": content,
+        }
+    ]
+
+
+def get_trace_fields(cell):
+    """
+    Return the details of a cell recorded with its turn in the trace.
+
+    Args:
+        cell (dict): The cell.
+
+    Returns:
+        dict: The prompt type, object and repetition of the cell.
+    """
+
+    return {
+        "prompt_type": os.path.basename(cell["prompt_type"]),
+        "object": os.path.basename(cell["image_dir"]),
+        "repetition": cell["repetition"],
+    }
+
+
+def get_custom_id(cell):
+    """
+    Return the batch custom_id of a cell.
+
+    Args:
+        cell (dict): The cell.
+
+    Returns:
+        str: The custom_id, unique to the (prompt, object, repetition) cell.
+    """
+
+    prompt_name = os.path.basename(cell["prompt_type"])
+    object_name = os.path.basename(cell["image_dir"])
+    return f"{prompt_name}|{object_name}|{cell['repetition']}"
+
+
+def format_output(cell, output_text, repetitions):
+    """
+    Format the output text of a cell for printing and saving.
+
+    Args:
+        cell (dict): The cell that was classified.
+        output_text (str): The text output by GPT.
+        repetitions (int): The number of repetitions of each cell.
+
+    Returns:
+        str: The formatted output.
+    """
 
-        # Create a response with the prompt and image files
-        response = client.responses.create(
-            model=MODEL,
-            input=[
-                {
-                    "role": "user",
-                    "content": content,
-                }
-            ],
+    output = f"Prompt type: {os.path.basename(cell['prompt_type'])} \n"
+    output += f"Image directory: {os.path.basename(cell['image_dir'])} \n"
+    # Only label repetitions when there is more than one
+    if repetitions > 1:
+        output += f"Repetition: {cell['repetition']} \n"
+    output += f"GPT: {output_text} \n"
+    output += "\n---\n"
+    return output
+
+
+def classify_locally(cells, index, choices):
+    """
+    Classify cells with the local tactile index first. Cells predicted with enough
+    confidence are answered locally. The rest are sent to GPT, with the local
+    shortlist added to multi-choice prompts as a hint. Objects are only classified
+    locally if the index has examples of every possible object (other than the
+    object's own images), so the right answer can be among its predictions.
+
+    Args:
+        cells (list): The cells to classify.
+        index (TactileIndex): The local tactile index (validated).
+        choices (list): The possible objects.
+
+    Returns:
+        tuple: The local output text of each cell (None for cells left to GPT), and
+            the cells to send to GPT.
+    """
+
+    # Predict each object once, leaving its own images out of the search
+    predictions = {}
+    for paths in {cell["image_paths"] for cell in cells}:
+        predictions[paths] = index.predict(paths, exclude=set(paths))
+
+    local_texts, gpt_cells = [], []
+    for cell in cells:
+        # Without examples of every possible object, leave the cell to GPT as it is
+        if index.missing_choices(choices, exclude=set(cell["image_paths"])):
+            local_texts.append(None)
+            gpt_cells.append(cell)
+            continue
+        prediction = predictions[cell["image_paths"]]
+        label, confidence = prediction[0]
+        if confidence >= LOCAL_INDEX["confidence"]:
+            local_texts.append(f"LOCAL: {label} (confidence {confidence:.2f})")
+            print(format_output(cell, local_texts[-1], REPETITIONS))
+            continue
+        local_texts.append(None)
+        if "multi_choice" in os.path.basename(cell["prompt_type"]):
+            shortlist = format_shortlist(prediction, LOCAL_INDEX["shortlist"])
+            note = LOCAL_NOTE.format(index.accuracy, shortlist)
+            prompt = cell["prompt"] + "\n\n" + note
+            cell = {**cell, "prompt": prompt}
+        gpt_cells.append(cell)
+    print(f"{len(cells) - len(gpt_cells)} of {len(cells)} cells classified locally.")
+    return local_texts, gpt_cells
+
+
+def record_ensemble(ensemble, cell, results, wall_time, usage_path, tracer=None):
+    """
+    Record the token usage, timings and predictions of every member of an ensemble
+    that classified a cell.
+
+    Args:
+        ensemble (Ensemble): The ensemble.
+        cell (dict): The cell that was classified.
+        results (list): The member results (see Ensemble.run).
+        wall_time (float): The seconds taken by the whole ensemble.
+        usage_path (str): The path of the CSV log of token usage.
+        tracer (Tracer, optional): Records the model stage timing of each member.
+
+    Returns:
+        str: The ensemble output text of the cell.
+    """
+
+    for result in results:
+        response, latency = result["response"], result["latency"]
+        shared_functions.record_usage(response, usage_path, latency, get_settings())
+        if tracer is not None:
+            turn = tracer.start_turn(**get_trace_fields(cell), sample=result["sample"])
+            turn.add("model", latency)
+            turn.add("ttft", latency)
+            tracer.end_turn(turn, response)
+    truth = true_label(os.path.basename(cell["image_dir"]), ensemble.choices)
+    ensemble.record(results, wall_time, truth, **get_trace_fields(cell))
+    return ensemble.format(results)
+
+
+def run_serial(
+    client,
+    cells,
+    upload_cache,
+    usage_path,
+    response_cache=None,
+    tracer=None,
+    ensemble=None,
+):
+    """
+    Classify each cell one after another.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        cells (list): The cells to classify.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        usage_path (str): The path of the CSV log of token usage.
+        response_cache (ResponseCache, optional): The cache of previous responses.
+        tracer (Tracer, optional): Records the stage timings of each cell.
+        ensemble (Ensemble, optional): Classifies each cell with every member at
+            once instead of with MODEL (the response cache is not used, since
+            repeated samples of the same request should differ).
+
+    Returns:
+        list: The output text of each cell, in the same order as the cells.
+    """
+
+    output_texts = []
+    for cell in cells:
+        # An ensemble traces each member instead (uploads are shared between them)
+        turn = None
+        if tracer is not None and ensemble is None:
+            turn = tracer.start_turn(**get_trace_fields(cell))
+
+        # Create an image input (inline or uploaded) for each object image
+        images = prepare_images(client, cell["image_paths"], upload_cache, turn)
+
+        # Create a response with the prompt and images
+        request = {"model": MODEL, "input": build_input(cell["prompt"], images)}
+        start = time.perf_counter()
+        if ensemble is not None:
+            # Send the request to every member at once
+            results = ensemble.run(client, request)
+            wall_time = time.perf_counter() - start
+            output_text = record_ensemble(
+                ensemble, cell, results, wall_time, usage_path, tracer
+            )
+            print(format_output(cell, output_text, REPETITIONS))
+            output_texts.append(output_text)
+            continue
+        if response_cache is not None:
+            response = response_cache.create(client, **request)
+        else:
+            response = client.responses.create(**request)
+        latency = time.perf_counter() - start
+        shared_functions.record_usage(response, usage_path, latency, get_settings())
+        if turn is not None:
+            # Responses are not streamed, so the first token arrives with the rest
+            turn.add("model", latency)
+            turn.add("ttft", latency)
+            tracer.end_turn(turn, response)
+
+        # Print the output as it arrives
+        print(format_output(cell, response.output_text, REPETITIONS))
+        output_texts.append(response.output_text)
+    return output_texts
+
+
+async def run_async(
+    client,
+    cells,
+    upload_cache,
+    max_concurrency,
+    usage_path,
+    response_cache=None,
+    tracer=None,
+    ensemble=None,
+):
+    """
+    Classify all cells concurrently, uploading each unique image only once.
+
+    Args:
+        client (AsyncOpenAI): The async OpenAI client instance.
+        cells (list): The cells to classify.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        max_concurrency (int): The maximum number of requests in flight.
+        usage_path (str): The path of the CSV log of token usage.
+        response_cache (ResponseCache, optional): The cache of previous responses.
+        tracer (Tracer, optional): Records the stage timings of each cell (uploads
+            are shared between cells, so only the model stages are recorded).
+        ensemble (Ensemble, optional): Classifies each cell with every member at
+            once instead of with MODEL (without the response cache).
+
+    Returns:
+        list: The output text of each cell, in the same order as the cells.
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def upload(image_paths):
+        async with semaphore:
+            return await prepare_images_async(client, image_paths, upload_cache)
+
+    async def classify(cell):
+        request = {
+            "model": MODEL,
+            "input": build_input(cell["prompt"], images[cell["image_paths"]]),
+        }
+        # The members of an ensemble share one slot, as they are sent together
+        if ensemble is not None:
+            async with semaphore:
+                start = time.perf_counter()
+                results = await ensemble.run_async(client, request)
+                wall_time = time.perf_counter() - start
+            output_text = record_ensemble(
+                ensemble, cell, results, wall_time, usage_path, tracer
+            )
+            print(format_output(cell, output_text, REPETITIONS))
+            return output_text
+
+        async with semaphore:
+            start = time.perf_counter()
+            if response_cache is not None:
+                response = await response_cache.create_async(client, **request)
+            else:
+                response = await client.responses.create(**request)
+            latency = time.perf_counter() - start
+        shared_functions.record_usage(response, usage_path, latency, get_settings())
+        if tracer is not None:
+            turn = tracer.start_turn(**get_trace_fields(cell))
+            turn.add("model", latency)
+            turn.add("ttft", latency)
+            tracer.end_turn(turn, response)
+        # Print the output as it arrives
+        print(format_output(cell, response.output_text, REPETITIONS))
+        return response.output_text
+
+    # Prepare (upload) the images of every unique object concurrently
+    unique_paths = sorted({cell["image_paths"] for cell in cells})
+    prepared = await asyncio.gather(*(upload(p) for p in unique_paths))
+    images = dict(zip(unique_paths, prepared))
+
+    # Classify every cell concurrently (gather keeps the cell order)
+    return await asyncio.gather(*(classify(cell) for cell in cells))
+
+
+def run_batch(client, cells, upload_cache, job_path):
+    """
+    Classify all cells with a single Batch API job.
+    If a job is already recorded at job_path it is resumed instead of resubmitted.
+
+    Args:
+        client (OpenAI): The OpenAI client instance.
+        cells (list): The cells to classify.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        job_path (str): The path of the file recording the submitted job.
+
+    Returns:
+        list: The output text of each cell, in the same order as the cells.
+    """
+
+    if os.path.exists(job_path):
+        # Resume the previously submitted job
+        with open(job_path, "r") as f:
+            batch_id = json.load(f)["batch_id"]
+        print(f"Resuming batch {batch_id}.")
+    else:
+        # Build one request per cell
+        requests = []
+        for cell in cells:
+            images = prepare_images(client, cell["image_paths"], upload_cache)
+            body = {"model": MODEL, "input": build_input(cell["prompt"], images)}
+            requests.append((get_custom_id(cell), body))
+
+        # Submit the job and record it in case the script is stopped
+        batch_id = batch_runner.submit_batch(client, requests).id
+        with open(job_path, "w") as f:
+            json.dump({"batch_id": batch_id}, f)
+        print(f"Submitted batch {batch_id} with {len(requests)} requests.")
+
+    # Wait for the job to finish and collect its results
+    batch = batch_runner.wait_for_batch(client, batch_id)
+    results = batch_runner.get_batch_results(client, batch)
+    os.remove(job_path)
+
+    output_texts = []
+    for cell in cells:
+        output_text = results.get(get_custom_id(cell), f"ERROR: batch {batch.status}")
+        print(format_output(cell, output_text, REPETITIONS))
+        output_texts.append(output_text)
+    return output_texts
+
+
+if __name__ == "__main__":
+    # Get current directory of this script
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Load the upload cache so identical images are not uploaded again
+    upload_cache = UploadCache(f"{current_dir}/upload_cache.json")
+
+    # Get every cell to classify
+    cells = get_cells(current_dir, REPETITIONS)
+
+    # Optionally answer confident cells locally and only send the rest to GPT
+    local_texts = [None] * len(cells)
+    gpt_cells = cells
+    if LOCAL_INDEX is not None:
+        index = TactileIndex.load(f"{current_dir}/{INDEX_NAME}")
+        with open(f"{current_dir}/static/initial/prompt_multi_choice.txt", "r") as f:
+            choices = parse_choices(f.read())
+        missing = index.missing_choices(choices)
+        # A shortlist that cannot include the right object would mislead GPT
+        if not index.validated():
+            print(f"Local index not used: not validated to {MIN_ACCURACY:.0%}.")
+        elif missing:
+            print(f"Local index not used: no examples of {', '.join(missing)}.")
+        else:
+            local_texts, gpt_cells = classify_locally(cells, index, choices)
+
+    # Token usage of each response is appended to usage.csv
+    usage_path = f"{current_dir}/usage.csv"
+    # The stage timings of each cell are appended to trace.jsonl
+    tracer = Tracer(f"{current_dir}/trace.jsonl", script="static", mode=MODE)
+
+    # Optionally reuse responses to identical requests from previous runs
+    response_cache = None
+    if RESPONSE_CACHE is not None:
+        response_cache = ResponseCache(
+            f"{current_dir}/response_cache.sqlite",
+            mode=RESPONSE_CACHE,
+            upload_cache=upload_cache,
         )
 
-        # Print and store the output
-        output = f"Prompt type: {os.path.basename(prompt_type)} \n"
-        output += f"Image directory: {os.path.basename(image_dir)} \n"
-        output += f"GPT: {response.output_text} \n"
-        output += "\n---\n"
-        print(output)
-        outputs.append(output)
-
-# Save outputs to outputs.txt locally
-with open(f"{current_dir}/outputs.txt", "w") as f:
-    f.writelines(outputs)
+    # Optionally classify each cell with an ensemble of models and/or samples
+    ensemble = None
+    if ENSEMBLE is not None and MODE == "batch":
+        print("ENSEMBLE is not supported in batch mode, so it is ignored.")
+    elif ENSEMBLE is not None:
+        # Predictions are read against the objects listed in the multi-choice prompt
+        choices = next(filter(None, (parse_choices(c["prompt"]) for c in cells)), [])
+        ensemble = Ensemble(
+            **ENSEMBLE, choices=choices, log_path=f"{current_dir}/ensemble.csv"
+        )
+
+    if MODE == "async":
+        # Initialise async OpenAI client and run all cells concurrently
+        client = shared_functions.create_async_client()
+        output_texts = asyncio.run(
+            run_async(
+                client,
+                gpt_cells,
+                upload_cache,
+                MAX_CONCURRENCY,
+                usage_path,
+                response_cache=response_cache,
+                tracer=tracer,
+                ensemble=ensemble,
+            )
+        )
+    elif MODE == "batch":
+        # Initialise OpenAI client and run all cells as one batch job
+        client = shared_functions.create_client(warm_up=False)
+        job_path = f"{current_dir}/batch_job.json"
+        output_texts = run_batch(client, gpt_cells, upload_cache, job_path)
+    else:
+        # Initialise OpenAI client and run each cell in turn
+        client = shared_functions.create_client(warm_up=False)
+        output_texts = run_serial(
+            client,
+            gpt_cells,
+            upload_cache,
+            usage_path,
+            response_cache=response_cache,
+            tracer=tracer,
+            ensemble=ensemble,
+        )
+
+    # Report any requests the scheduler had to hold back or retry
+    print(f"Requests: {shared_scheduler().summary()}")
+
+    # Merge the local and GPT outputs back into cell order
+    gpt_texts = iter(output_texts)
+    output_texts = [t if t is not None else next(gpt_texts) for t in local_texts]
+
+    # Store the outputs in cell order
+    outputs = [
+        format_output(cell, output_text, REPETITIONS)
+        for cell, output_text in zip(cells, output_texts)
+    ]
+
+    # Save outputs to outputs.txt locally
+    with open(f"{current_dir}/outputs.txt", "w") as f:
+        f.writelines(outputs)
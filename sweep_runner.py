@@ -0,0 +1,471 @@
+"""
+A resumable sweep of static classification experiments.
+The static script classifies every object once per prompt. This runs the whole grid
+of (prompt variant, choice count, object, repetition, model) cells instead, e.g. to
+reproduce static/results/static_results.csv without filling it in by hand:
+    - The choice count rewrites the list of possible objects in the prompt (0 removes
+      it, making the prompt open-ended). The true object is always one of the choices.
+    - Each cell asks for a structured output (JSON with the object and a
+      confidence), so the predicted label is read without parsing free text.
+    - The cells are spread across worker processes, each of which paces its requests
+      to an equal share of the rate limits. The images of each object are prepared
+      (uploaded) once, before the workers start.
+    - Every finished cell is appended to a CSV results store straight away. Cells
+      already in the store are skipped, so an interrupted sweep resumes where it
+      stopped when run again.
+
+The accuracy and confusion tables are computed from the store with numpy, and can be
+printed without running anything:
+    python3 sweep_runner.py --tables
+"""
+
+import argparse
+import csv
+from ensemble import extract_label, parse_choices, true_label
+import json
+import multiprocessing
+import numpy as np
+import os
+import re
+from request_scheduler import shared_scheduler
+import shared_functions
+import signal
+import static_classification
+import time
+from upload_cache import UploadCache
+
+MODELS = ["gpt-5-mini"]
+# Prompt files in static/initial, e.g. ["prompt.txt", "prompt_multi_choice.txt"]
+PROMPT_VARIANTS = ["prompt_multi_choice.txt"]
+# Numbers of possible objects listed in the prompt, e.g. [0, 5, 10]
+# (None keeps the prompt's own list, 0 makes it open-ended)
+CHOICE_COUNTS = [0, 10]
+REPETITIONS = 5  # Number of times each cell is classified
+WORKERS = 4  # Number of worker processes
+CHOICES_PROMPT = "prompt_multi_choice.txt"  # The prompt listing every possible object
+CHOICES_LINE = "The possible objects are: {}."
+STRUCTURED_NOTE = "Reply with the object you predict and your confidence (0 to 1)."
+# The columns identifying a cell in the results store
+KEY_COLUMNS = ["prompt", "choices", "object", "repetition", "model"]
+
+# The OpenAI client of each worker process
+_client = None
+
+
+def with_choices(prompt, choices, truth, count):
+    """
+    Rewrite the list of possible objects in a prompt.
+
+    Args:
+        prompt (str): The prompt text.
+        choices (list): Every possible object, in the order they are listed.
+        truth (str): The true object, which is always kept.
+        count (int): The number of possible objects to list (0 removes the list).
+
+    Returns:
+        tuple: The prompt text and the possible objects it lists.
+    """
+
+    # Remove the prompt's own list
+    prompt = re.sub(r"\n*The possible objects are:.*", "", prompt).rstrip()
+    if count == 0:
+        return prompt, []
+
+    # Keep the true object and the first of the others, in the listed order
+    others = [c for c in choices if c != truth][: count - 1]
+    listed = [c for c in choices if c == truth or c in others]
+    return f"{prompt}\n\n{CHOICES_LINE.format(', '.join(listed))}", listed
+
+
+def prediction_format(choices):
+    """
+    Return the structured output format of a cell.
+
+    Args:
+        choices (list): The possible objects listed in the prompt (empty if open-ended).
+
+    Returns:
+        dict: The text format of the Responses API request.
+    """
+
+    label = {"type": "string"}
+    if choices:
+        label["enum"] = list(choices)
+    return {
+        "format": {
+            "type": "json_schema",
+            "name": "prediction",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {"object": label, "confidence": {"type": "number"}},
+                "required": ["object", "confidence"],
+                "additionalProperties": False,
+            },
+        }
+    }
+
+
+def get_cells(current_dir, variants, counts, repetitions, models):
+    """
+    Build the grid of cells to classify.
+
+    Args:
+        current_dir (str): The directory of this script.
+        variants (list): The prompt files in static/initial.
+        counts (list): The numbers of possible objects listed in the prompt.
+        repetitions (int): The number of repetitions of each cell.
+        models (list): The models.
+
+    Returns:
+        list: A list of dictionaries, one per cell, in grid order.
+    """
+
+    with open(f"{current_dir}/static/initial/{CHOICES_PROMPT}", "r") as f:
+        all_choices = parse_choices(f.read())
+
+    # The static script's cells give the prompt and image paths of each object
+    base_cells = static_classification.get_cells(current_dir, 1)
+    cells = []
+    for variant in variants:
+        for count in counts:
+            for base in base_cells:
+                if os.path.basename(base["prompt_type"]) != variant:
+                    continue
+                name = os.path.basename(base["image_dir"])
+                truth = true_label(name, all_choices)
+                prompt, choices = base["prompt"], parse_choices(base["prompt"])
+                if count is not None:
+                    prompt, choices = with_choices(prompt, all_choices, truth, count)
+                for repetition in range(1, repetitions + 1):
+                    for model in models:
+                        cells.append(
+                            {
+                                "prompt": variant,
+                                "choices": len(choices),
+                                "object": name,
+                                "repetition": repetition,
+                                "model": model,
+                                "text": f"{prompt}\n\n{STRUCTURED_NOTE}",
+                                "options": choices,
+                                "truth": truth,
+                                "image_paths": base["image_paths"],
+                            }
+                        )
+    return cells
+
+
+def cell_key(cell):
+    """
+    Return the key of a cell in the results store.
+
+    Args:
+        cell (dict): The cell (or a row of the store).
+
+    Returns:
+        tuple: The values of the key columns, as strings.
+    """
+
+    return tuple(str(cell[column]) for column in KEY_COLUMNS)
+
+
+def load_store(path):
+    """
+    Load the results store.
+
+    Args:
+        path (str): The path of the CSV results store.
+
+    Returns:
+        list: The rows of the store (empty if it does not exist yet).
+    """
+
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def append_row(path, row):
+    """
+    Append a finished cell to the results store.
+
+    Args:
+        path (str): The path of the CSV results store.
+        row (dict): The row to append.
+    """
+
+    # Write the header if the store is new
+    write_header = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(row))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def read_prediction(output_text, choices):
+    """
+    Read the predicted object and confidence from a structured output.
+
+    Args:
+        output_text (str): The output text of the response.
+        choices (list): The possible objects listed in the prompt.
+
+    Returns:
+        tuple: The predicted object and its confidence (None if not given).
+    """
+
+    try:
+        prediction = json.loads(output_text)
+        return str(prediction["object"]).strip(), prediction.get("confidence")
+    except (ValueError, KeyError, TypeError):
+        # Not valid JSON (e.g. a refusal), so read the label from the text instead
+        return extract_label(output_text, choices) or output_text.strip(), None
+
+
+def _init_worker(workers):
+    """
+    Create the OpenAI client of a worker process.
+
+    Args:
+        workers (int): The number of worker processes, which share the rate limits.
+    """
+
+    global _client
+    # Ctrl+C is handled by the main process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Each worker paces its requests to its share of the rate limits
+    shared_scheduler(share=1 / workers)
+    _client = shared_functions.create_client(warm_up=False)
+
+
+def _run_cell(cell):
+    """
+    Classify a cell in a worker process.
+
+    Args:
+        cell (dict): The cell, with its request.
+
+    Returns:
+        tuple: The cell and its row of the results store (None if it failed), and
+            the error message if it failed.
+    """
+
+    from openai import OpenAIError
+
+    start = time.perf_counter()
+    try:
+        response = _client.responses.create(**cell["request"])
+    except OpenAIError as e:
+        return cell, None, str(e)
+    latency = time.perf_counter() - start
+
+    label, confidence = read_prediction(response.output_text, cell["options"])
+    # Open-ended predictions are correct if they name the true object
+    correct = extract_label(label, [cell["truth"]]) == cell["truth"]
+    usage = response.usage
+    row = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        **{column: cell[column] for column in KEY_COLUMNS},
+        "truth": cell["truth"],
+        "label": label,
+        "confidence": "" if confidence is None else confidence,
+        "correct": int(correct),
+        "latency": f"{latency:.3f}",
+        "input_tokens": usage.input_tokens if usage else "",
+        "output_tokens": usage.output_tokens if usage else "",
+        "response_id": response.id,
+    }
+    return cell, row, None
+
+
+def run_sweep(client, cells, upload_cache, store_path, workers):
+    """
+    Classify every cell not already in the results store.
+
+    Args:
+        client (OpenAI): The OpenAI client instance (used to upload the images).
+        cells (list): The cells of the grid.
+        upload_cache (UploadCache): The content-addressed upload cache.
+        store_path (str): The path of the CSV results store.
+        workers (int): The number of worker processes.
+
+    Returns:
+        int: The number of cells classified.
+    """
+
+    # Skip the cells finished by previous runs
+    done = {cell_key(row) for row in load_store(store_path)}
+    pending = [cell for cell in cells if cell_key(cell) not in done]
+    print(f"{len(cells) - len(pending)} of {len(cells)} cells already done.")
+    if not pending:
+        return 0
+
+    # Prepare the images of each object once, so the workers only send requests
+    images = {}
+    for paths in sorted({cell["image_paths"] for cell in pending}):
+        images[paths] = static_classification.prepare_images(
+            client, paths, upload_cache
+        )
+    for cell in pending:
+        cell["request"] = {
+            "model": cell["model"],
+            "input": static_classification.build_input(
+                cell["text"], images[cell["image_paths"]]
+            ),
+            "text": prediction_format(cell["options"]),
+        }
+
+    # Append each cell as soon as any worker finishes it
+    finished = 0
+    with multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(workers,)
+    ) as pool:
+        for cell, row, error in pool.imap_unordered(_run_cell, pending):
+            if row is None:
+                print(f"Cell {cell_key(cell)} failed, it will be retried: {error}")
+                continue
+            append_row(store_path, row)
+            finished += 1
+            print(
+                f"[{finished}/{len(pending)}] {' '.join(cell_key(cell))}: "
+                f"{row['label']} ({'correct' if row['correct'] else 'wrong'})"
+            )
+    return finished
+
+
+def group_rows(rows, columns):
+    """
+    Number the distinct values of some columns of the store.
+
+    Args:
+        rows (list): The rows of the store.
+        columns (list): The columns to group by.
+
+    Returns:
+        tuple: The distinct groups (as an array of their column values) and the
+            group number of each row.
+    """
+
+    values = np.array([[row[c] for c in columns] for row in rows], dtype=str)
+    return np.unique(values, axis=0, return_inverse=True)
+
+
+def accuracy_table(rows):
+    """
+    Compute the accuracy of each (prompt, choices, model) per object.
+
+    Args:
+        rows (list): The rows of the store.
+
+    Returns:
+        tuple: The groups, the objects and the accuracy of each group (rows) per
+            object (columns), NaN where a group has no results for an object.
+    """
+
+    groups, group_index = group_rows(rows, ["prompt", "choices", "model"])
+    objects, object_index = np.unique([r["object"] for r in rows], return_inverse=True)
+    correct = np.array([int(r["correct"]) for r in rows])
+
+    # Count the results and the correct ones in each cell of the table
+    flat = group_index.ravel() * len(objects) + object_index
+    size = len(groups) * len(objects)
+    totals = np.bincount(flat, minlength=size).reshape(len(groups), len(objects))
+    hits = np.bincount(flat, weights=correct, minlength=size)
+    with np.errstate(invalid="ignore"):
+        accuracy = hits.reshape(totals.shape) / totals
+    # Order the choice counts as numbers, not as strings (5 before 10)
+    order = np.lexsort((groups[:, 2], groups[:, 1].astype(int), groups[:, 0]))
+    return groups[order], objects, accuracy[order]
+
+
+def confusion_table(rows, choices):
+    """
+    Compute the confusion matrix of true and predicted objects.
+
+    Args:
+        rows (list): The rows of the store.
+        choices (list): Every possible object (other predictions count as other).
+
+    Returns:
+        tuple: The labels and the number of results with each true (rows) and
+            predicted (columns) label.
+    """
+
+    labels = list(choices) + ["other"]
+    index = {label: i for i, label in enumerate(labels)}
+    # Read each distinct prediction once, then map every row through it
+    predicted, inverse = np.unique([r["label"] for r in rows], return_inverse=True)
+    mapped = np.array([index.get(extract_label(p, choices), -1) for p in predicted])
+    truth = np.array([index.get(r["truth"], -1) for r in rows])
+
+    matrix = np.zeros((len(labels), len(labels)), dtype=int)
+    np.add.at(matrix, (truth, mapped[inverse.ravel()]), 1)
+    return labels, matrix
+
+
+def print_tables(rows, choices):
+    """
+    Print the accuracy table and a confusion matrix per (choices, model).
+
+    Args:
+        rows (list): The rows of the store.
+        choices (list): Every possible object.
+    """
+
+    if not rows:
+        print("No results yet.")
+        return
+
+    groups, objects, accuracy = accuracy_table(rows)
+    print(f"{'prompt':<28}{'choices':>8}  {'model':<14}", end="")
+    print("".join(f"{o[:10]:>11}" for o in objects) + f"{'overall':>11}")
+    totals = np.nanmean(accuracy, axis=1)
+    for (prompt, count, model), row, total in zip(groups, accuracy, totals):
+        print(f"{prompt:<28}{count:>8}  {model:<14}", end="")
+        print("".join(f"{a:>11.2f}" for a in row) + f"{total:>11.2f}")
+
+    pairs = np.unique(groups[:, 1:], axis=0).tolist()
+    for count, model in sorted(pairs, key=lambda pair: (int(pair[0]), pair[1])):
+        subset = [r for r in rows if r["choices"] == count and r["model"] == model]
+        labels, matrix = confusion_table(subset, choices)
+        # Only show the labels that were true or predicted
+        shown = np.flatnonzero(matrix.sum(axis=0) + matrix.sum(axis=1))
+        print(f"\nConfusion ({count} choices, {model}), true rows, predicted columns:")
+        print(" " * 16 + "".join(f"{labels[i][:9]:>10}" for i in shown))
+        for i in shown:
+            counts = "".join(f"{n:>10}" for n in matrix[i, shown])
+            print(f"{labels[i][:15]:<16}{counts}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a static classification sweep.")
+    parser.add_argument("--store", help="Path of the CSV results store")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument(
+        "--tables",
+        action="store_true",
+        help="Only print the tables of the results so far",
+    )
+    args = parser.parse_args()
+
+    # Get current directory of this script
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    store_path = args.store or f"{current_dir}/sweep_results.csv"
+    with open(f"{current_dir}/static/initial/{CHOICES_PROMPT}", "r") as f:
+        choices = parse_choices(f.read())
+
+    if not args.tables:
+        cells = get_cells(
+            current_dir, PROMPT_VARIANTS, CHOICE_COUNTS, REPETITIONS, MODELS
+        )
+        # Load the upload cache so identical images are not uploaded again
+        upload_cache = UploadCache(f"{current_dir}/upload_cache.json")
+        client = shared_functions.create_client(warm_up=False)
+        try:
+            run_sweep(client, cells, upload_cache, store_path, args.workers)
+        except KeyboardInterrupt:
+            print("Sweep stopped. Run again to resume.")
+
+    print_tables(load_store(store_path), choices)
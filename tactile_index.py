@@ -0,0 +1,371 @@
+"""
+A local index of labelled tactile images for fast k-nearest-neighbour classification.
+Each image is described by cheap, vectorised features:
+    - Downsampled greyscale intensity (the shape of the contact).
+    - A histogram of gradient orientations weighted by magnitude (the texture).
+    - Contact-area statistics (how much of the gel is deformed, and how strongly).
+
+The features of every labelled image (static/images/<object>/ and the captures of
+the results folders) are stored in a float32 NumPy array that is memory-mapped when
+loaded, and queried in batches with a single matrix product. The scripts use it to
+get a shortlist or prediction in milliseconds, and only ask GPT when the local
+prediction is not confident.
+
+Building the index also validates it (leave-one-object-folder-out accuracy on the
+static images). The scripts only use an index whose validation accuracy reaches
+MIN_ACCURACY and which has examples of every possible object, as a shortlist that
+leaves out the right answer would steer GPT towards a wrong one.
+
+Build the index with:
+    python3 tactile_index.py
+"""
+
+import argparse
+import cv2
+from ensemble import true_label
+import glob
+import json
+import numpy as np
+import os
+
+POOL_SIZE = (16, 12)  # (height, width) of the downsampled intensity feature
+GRADIENT_BINS = 8  # Orientation bins of the gradient histogram
+CONTACT_THRESHOLD = 20.0  # Intensity difference from the background meaning contact
+DEFAULT_K = 5  # Neighbours that vote on each query image
+INDEX_NAME = "tactile_index"  # Index files: tactile_index.npy and tactile_index.json
+MIN_ACCURACY = 0.8  # Validation accuracy an index needs before the scripts use it
+
+
+def extract_features(frames):
+    """
+    Compute the feature vectors of a batch of frames.
+
+    Args:
+        frames (np.ndarray): The BGR frames, shaped (n, height, width, 3).
+
+    Returns:
+        np.ndarray: The unit-length float32 feature vectors, shaped (n, dims).
+    """
+
+    grey = frames.mean(axis=3, dtype=np.float32)
+    n, height, width = grey.shape
+
+    # Downsampled intensity: mean of each block, centred on the image mean
+    rows, columns = POOL_SIZE
+    blocks = grey[:, : height // rows * rows, : width // columns * columns]
+    pooled = blocks.reshape(n, rows, height // rows, columns, width // columns)
+    pooled = pooled.mean(axis=(2, 4)).reshape(n, -1)
+    pooled -= pooled.mean(axis=1, keepdims=True)
+
+    # Gradient orientation histogram weighted by gradient magnitude
+    dx = grey[:, 1:-1, 2:] - grey[:, 1:-1, :-2]
+    dy = grey[:, 2:, 1:-1] - grey[:, :-2, 1:-1]
+    magnitude = np.hypot(dx, dy).reshape(n, -1)
+    # Orientation modulo 180 degrees, so opposite gradients share a bin
+    orientation = np.arctan2(dy, dx).reshape(n, -1) % np.pi
+    bins = (orientation / np.pi * GRADIENT_BINS).astype(np.int64)
+    bins = np.minimum(bins, GRADIENT_BINS - 1)
+    histogram = np.zeros((n, GRADIENT_BINS), dtype=np.float32)
+    np.add.at(histogram, (np.arange(n)[:, None], bins), magnitude)
+
+    # Contact statistics relative to each frame's background (median) intensity
+    difference = np.abs(grey - np.median(grey, axis=(1, 2), keepdims=True))
+    contact = difference > CONTACT_THRESHOLD
+    stats = np.stack(
+        [
+            contact.mean(axis=(1, 2)),
+            difference.mean(axis=(1, 2)) / 255,
+            difference.std(axis=(1, 2)) / 255,
+        ],
+        axis=1,
+    )
+
+    # Normalise each feature group so they contribute equally
+    groups = [pooled, histogram, stats]
+    features = np.concatenate([_unit(g) for g in groups], axis=1)
+    return _unit(features)
+
+
+def _unit(vectors):
+    """
+    Scale vectors to unit length.
+
+    Args:
+        vectors (np.ndarray): The vectors, shaped (n, dims).
+
+    Returns:
+        np.ndarray: The unit-length vectors as float32.
+    """
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-8)).astype(np.float32)
+
+
+def load_frames(images):
+    """
+    Decode images into a batch of frames.
+
+    Args:
+        images (list): The images, as paths or encoded bytes.
+
+    Returns:
+        np.ndarray: The frames, shaped (n, height, width, 3).
+    """
+
+    frames = []
+    for image in images:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            data = np.frombuffer(image, dtype=np.uint8)
+            frames.append(cv2.imdecode(data, cv2.IMREAD_COLOR))
+        else:
+            frames.append(cv2.imread(image))
+    return np.stack(frames)
+
+
+def find_labelled_images(current_dir):
+    """
+    Find the labelled tactile images of the repository.
+
+    Args:
+        current_dir (str): The directory of the scripts.
+
+    Returns:
+        list: The (path, label) of each image, labelled by its object folder.
+    """
+
+    patterns = [
+        "static/images/*/*.jpg",
+        "active/results/*/captures/*.jpg",
+        "simple_active/results/*/captures/*.jpg",
+    ]
+    labelled = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(current_dir, pattern))):
+            # The object folder is the parent (or grandparent for captures)
+            folder = os.path.dirname(path)
+            if os.path.basename(folder) == "captures":
+                folder = os.path.dirname(folder)
+            labelled.append((path, os.path.basename(folder)))
+    return labelled
+
+
+class TactileIndex:
+    """
+    A k-nearest-neighbour index of labelled tactile image features.
+    """
+
+    def __init__(self, features, labels, paths, accuracy=None):
+        """
+        Initialise the index.
+
+        Args:
+            features (np.ndarray): The unit-length feature vectors, shaped (n, dims).
+            labels (list): The label of each vector.
+            paths (list): The image path of each vector.
+            accuracy (float, optional): The validation accuracy (None if the index
+                has not been validated).
+        """
+
+        self.features = features
+        self.accuracy = accuracy
+        self.labels = list(labels)
+        self.paths = list(paths)
+        self.classes = sorted(set(self.labels))
+        # The class of each vector as an index into classes, for vectorised voting
+        self._label_ids = np.array([self.classes.index(l) for l in self.labels])
+
+    @classmethod
+    def build(cls, labelled, batch_size=64):
+        """
+        Build an index from labelled images.
+
+        Args:
+            labelled (list): The (path, label) of each image.
+            batch_size (int): The number of images decoded at once.
+
+        Returns:
+            TactileIndex: The index.
+        """
+
+        paths = [p for p, _ in labelled]
+        batches = [
+            extract_features(load_frames(paths[i : i + batch_size]))
+            for i in range(0, len(paths), batch_size)
+        ]
+        return cls(np.concatenate(batches), [l for _, l in labelled], paths)
+
+    def save(self, prefix):
+        """
+        Save the index as prefix.npy (features) and prefix.json (labels and paths).
+
+        Args:
+            prefix (str): The path of the index files without extension.
+        """
+
+        np.save(f"{prefix}.npy", self.features)
+        with open(f"{prefix}.json", "w") as f:
+            meta = {"labels": self.labels, "paths": self.paths}
+            json.dump({**meta, "accuracy": self.accuracy}, f)
+
+    @classmethod
+    def load(cls, prefix):
+        """
+        Load a saved index, memory-mapping its features.
+
+        Args:
+            prefix (str): The path of the index files without extension.
+
+        Returns:
+            TactileIndex: The index.
+        """
+
+        features = np.load(f"{prefix}.npy", mmap_mode="r")
+        with open(f"{prefix}.json", "r") as f:
+            meta = json.load(f)
+        return cls(features, meta["labels"], meta["paths"], meta.get("accuracy"))
+
+    def validate(self, k=DEFAULT_K):
+        """
+        Measure the accuracy of the index on the static images, predicting each
+        object folder with its own images left out of the search.
+
+        Args:
+            k (int): The number of neighbours of each image.
+
+        Returns:
+            dict: The prediction of each object folder, by folder name.
+        """
+
+        predictions = {}
+        folders = sorted({os.path.dirname(p) for p in self.paths if "/static/" in p})
+        for folder in folders:
+            paths = [p for p in self.paths if os.path.dirname(p) == folder]
+            predictions[os.path.basename(folder)] = self.predict(
+                paths, k, exclude=set(paths)
+            )
+        correct = sum(p[0][0] == name for name, p in predictions.items())
+        self.accuracy = correct / max(len(predictions), 1)
+        return predictions
+
+    def validated(self, min_accuracy=MIN_ACCURACY):
+        """
+        Check whether the index has been validated with enough accuracy.
+
+        Args:
+            min_accuracy (float): The validation accuracy needed.
+
+        Returns:
+            bool: Whether the index can be used.
+        """
+
+        return self.accuracy is not None and self.accuracy >= min_accuracy
+
+    def missing_choices(self, choices, exclude=None):
+        """
+        Find the possible objects the index has no examples of.
+
+        Args:
+            choices (list): The possible objects (e.g. tennis ball), matched to the
+                labels (object folder names, e.g. ball).
+            exclude (set, optional): Image paths left out of the search.
+
+        Returns:
+            list: The possible objects without examples.
+        """
+
+        exclude = exclude or set()
+        labels = {l for l, p in zip(self.labels, self.paths) if p not in exclude}
+        covered = {true_label(label, choices) for label in labels}
+        return [choice for choice in choices if choice not in covered]
+
+    def query(self, features, k=DEFAULT_K, exclude=None):
+        """
+        Find the nearest neighbours of a batch of feature vectors.
+
+        Args:
+            features (np.ndarray): The query feature vectors, shaped (m, dims).
+            k (int): The number of neighbours of each query.
+            exclude (set, optional): Image paths left out of the search, e.g. the
+                query images themselves.
+
+        Returns:
+            tuple: The neighbour indices and cosine similarities, both shaped (m, k),
+                most similar first.
+        """
+
+        similarity = features @ np.asarray(self.features).T
+        if exclude:
+            mask = np.array([p in exclude for p in self.paths])
+            similarity[:, mask] = -np.inf
+        k = min(k, similarity.shape[1])
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(similarity, nearest, axis=1)
+        order = np.argsort(-scores, axis=1)
+        return (
+            np.take_along_axis(nearest, order, axis=1),
+            np.take_along_axis(scores, order, axis=1),
+        )
+
+    def predict(self, images, k=DEFAULT_K, exclude=None):
+        """
+        Classify a set of images of the same object by similarity-weighted voting of
+        the nearest neighbours of every image.
+
+        Args:
+            images (list): The images, as paths or encoded bytes.
+            k (int): The number of neighbours of each image.
+            exclude (set, optional): Image paths left out of the search.
+
+        Returns:
+            list: The (label, confidence) of each class, most likely first. The
+                confidences sum to 1.
+        """
+
+        nearest, scores = self.query(
+            extract_features(load_frames(images)), k, exclude
+        )
+        # Excluded neighbours have -inf similarity and get no vote
+        weights = np.clip(scores, 0, None)
+        votes = np.bincount(
+            self._label_ids[nearest].ravel(),
+            weights=weights.ravel(),
+            minlength=len(self.classes),
+        )
+        votes /= max(votes.sum(), 1e-8)
+        ranking = np.argsort(-votes)
+        return [(self.classes[i], float(votes[i])) for i in ranking]
+
+
+def format_shortlist(prediction, size):
+    """
+    Describe the most likely classes of a local prediction.
+
+    Args:
+        prediction (list): The (label, confidence) of each class (see predict).
+        size (int): The number of classes to list.
+
+    Returns:
+        str: The shortlist, e.g. "banana (0.72), ball (0.18)".
+    """
+
+    return ", ".join(f"{label} ({conf:.2f})" for label, conf in prediction[:size])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local tactile index.")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    labelled = find_labelled_images(current_dir)
+    index = TactileIndex.build(labelled)
+    print(f"Indexed {len(labelled)} images of {len(index.classes)} objects.")
+
+    # Leave-one-object-folder-out accuracy on the static images, saved with the index
+    predictions = index.validate(args.k)
+    for name, prediction in predictions.items():
+        print(f"{name}: {format_shortlist(prediction, 3)}")
+    index.save(os.path.join(current_dir, INDEX_NAME))
+    print(f"Static accuracy (own images excluded): {index.accuracy:.0%}")
+    if not index.validated():
+        print(f"Below {MIN_ACCURACY:.0%}, so the scripts will not use the index.")
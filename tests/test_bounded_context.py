@@ -0,0 +1,47 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bounded_context import BoundedContext  # noqa: E402
+
+
+def request(text, previous_response_id="resp_prev"):
+    content = [{"type": "input_text", "text": text}]
+    return {
+        "model": "gpt-5-mini",
+        "input": [{"role": "user", "content": content}],
+        "previous_response_id": previous_response_id,
+    }
+
+
+def send(context, text):
+    prepared = context.prepare(request(text))
+    context.update(SimpleNamespace(output_text=f"answer to {text}"))
+    return prepared
+
+
+def test_restart_is_retried_after_a_failed_send():
+    context = BoundedContext(restart_every=2)
+    for i in range(2):
+        assert send(context, f"turn {i}")["previous_response_id"] == "resp_prev"
+
+    # The restart is due, but its request fails (no update)
+    failed = context.prepare(request("turn 2"))
+    assert failed["previous_response_id"] is None
+
+    # So the next request restarts the chain instead of chaining past the cap
+    retried = send(context, "turn 2 again")
+    assert retried["previous_response_id"] is None
+    assert send(context, "turn 3")["previous_response_id"] == "resp_prev"
+
+
+def test_restart_keeps_only_the_most_recent_turns():
+    context = BoundedContext(restart_every=1, max_turns=2)
+    for i in range(6):
+        prepared = send(context, f"turn {i}")
+    # The initial turn, the summary and the last two turns with their answers,
+    # followed by the new message
+    assert len(prepared["input"]) == 2 + 1 + 4 + 1
+    assert "turn 1" in prepared["input"][2]["content"]
@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ensemble import extract_confidence, extract_label, parse_choices  # noqa: E402
+
+CHOICES = parse_choices(
+    "The possible objects are: tin of beans, tennis ball, banana, brick, sponge, "
+    "human fingertip, pringles tube, hammer, scissors, apple."
+)
+
+
+def test_parse_choices():
+    assert len(CHOICES) == 10
+    assert CHOICES[0] == "tin of beans" and CHOICES[-1] == "apple"
+
+
+def test_label_from_prediction_line():
+    text = "Smooth, curved surface.\nPREDICTION: tennis ball, CONFIDENCE: 85%"
+    assert extract_label(text, CHOICES) == "tennis ball"
+
+
+def test_label_from_alias():
+    assert extract_label("I think it is a ball.", CHOICES) == "tennis ball"
+    assert extract_label("Probably beans.", CHOICES) == "tin of beans"
+    assert extract_label("pringles", CHOICES) == "pringles tube"
+
+
+def test_negated_label_is_ignored():
+    text = "It is not a banana; it is an apple."
+    assert extract_label(text, CHOICES) == "apple"
+    assert extract_label("It isn't the hammer.", CHOICES) is None
+
+
+def test_open_ended_answer_matches_truth():
+    # sweep_runner scores open-ended answers against the true object alone
+    assert extract_label("ball", ["tennis ball"]) == "tennis ball"
+
+
+def test_confidence_formats():
+    assert extract_confidence("PREDICTION: tennis ball, CONFIDENCE: 85%") == 0.85
+    assert extract_confidence("PREDICTION: apple, CONFIDENCE: 0.7") == 0.7
+    assert extract_confidence("PREDICTION: apple, CONFIDENCE: 60") == 0.6
+    assert extract_confidence("I am about 40 % sure.") == 0.4
+    assert extract_confidence("PREDICTION: apple, CONFIDENCE: high") == 0.85
+    assert extract_confidence("PREDICTION: apple") is None
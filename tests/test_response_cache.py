@@ -0,0 +1,37 @@
+import base64
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache  # noqa: E402
+
+IMAGE_URL = "data:image/jpeg;base64," + base64.b64encode(b"frame").decode()
+
+
+def request(detail="high", **fields):
+    image = {"type": "input_image", "image_url": IMAGE_URL, "detail": detail}
+    content = [{"type": "input_text", "text": "CAPTURE"}, image]
+    return {
+        "model": "gpt-5-mini",
+        "input": [{"role": "user", "content": content}],
+        "previous_response_id": None,
+        **fields,
+    }
+
+
+def test_image_detail_is_part_of_the_key():
+    cache = ResponseCache(":memory:")
+    assert cache.key(request("low")) != cache.key(request("high"))
+
+
+def test_request_options_are_part_of_the_key():
+    cache = ResponseCache(":memory:")
+    text = {"format": {"type": "json_schema", "name": "prediction"}}
+    assert cache.key(request(text=text)) != cache.key(request())
+    assert cache.key(request(reasoning={"effort": "low"})) != cache.key(request())
+
+
+def test_stream_is_not_part_of_the_key():
+    cache = ResponseCache(":memory:")
+    assert cache.key(request(stream=True)) == cache.key(request())
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_trace import PRICES, model_prices, turn_cost  # noqa: E402
+
+USAGE = {"input_tokens": 1_000_000, "cached_tokens": 0, "output_tokens": 1_000_000}
+
+
+def test_dated_model_uses_longest_prefix():
+    assert model_prices("gpt-5-mini-2025-08-07") == PRICES["gpt-5-mini"]
+    assert model_prices("gpt-5-2025-08-07") == PRICES["gpt-5"]
+
+
+def test_turn_cost_of_dated_model():
+    record = {"model": "gpt-5-mini-2025-08-07", "usage": USAGE}
+    input_price, _, output_price = PRICES["gpt-5-mini"]
+    assert turn_cost(record) == input_price + output_price
+
+
+def test_unknown_or_cached_turn_costs_nothing():
+    assert turn_cost({"model": "o3-2025-04-16", "usage": USAGE}) == 0.0
+    assert turn_cost({"model": None, "usage": USAGE}) == 0.0
+    assert turn_cost({"model": "gpt-5", "usage": USAGE, "cached": True}) == 0.0
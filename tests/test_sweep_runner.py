@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sweep_runner import accuracy_table  # noqa: E402
+
+
+def test_choice_counts_are_ordered_as_numbers():
+    rows = [
+        {
+            "prompt": "p",
+            "choices": str(count),
+            "model": "m",
+            "object": "ball",
+            "correct": True,
+        }
+        for count in (10, 5, 3)
+    ]
+    groups, _, _ = accuracy_table(rows)
+    assert groups[:, 1].tolist() == ["3", "5", "10"]
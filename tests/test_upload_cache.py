@@ -0,0 +1,32 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_cache import UploadCache  # noqa: E402
+
+
+def test_processes_sharing_the_index_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "upload_cache.json")
+    first, second = UploadCache(path), UploadCache(path)
+    first.put("a", "file-a")
+    second.put("b", "file-b")
+    with open(path) as f:
+        assert set(json.load(f)) == {"a", "b"}
+    assert os.listdir(tmp_path) == ["upload_cache.json"]
+
+
+def test_removed_entries_are_not_merged_back(tmp_path):
+    path = str(tmp_path / "upload_cache.json")
+    cache = UploadCache(path)
+    cache.put("a", "file-a")
+    other = UploadCache(path)
+    # Expire the entry in this process only
+    ttl, cache.ttl = cache.ttl, -1
+    assert cache.get(None, "a") is None
+    cache.ttl = ttl
+    other.put("b", "file-b")
+    cache.put("c", "file-c")
+    with open(path) as f:
+        assert set(json.load(f)) == {"b", "c"}
@@ -0,0 +1,310 @@
+"""
+A persistent, content-addressed index of files uploaded with the OpenAI Files API.
+It maps the SHA-256 hash of a file's bytes to the file ID returned by the API, so
+identical images are only uploaded once across runs of the scripts.
+
+The index is a small JSON file stored next to the scripts. Entries expire after a
+time-to-live and the least recently used entries are evicted once the index grows
+beyond its maximum size. The remote file is periodically checked to make sure it
+still exists before its ID is reused. The index is written when entries are added
+or removed; cache hits only update it in memory, and are written with the next
+change or when the interpreter exits. Several scripts can share the index: each
+write merges in the entries other processes have written since, so none are lost.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_TTL = 7 * 24 * 60 * 60  # Seconds before an entry expires (one week)
+DEFAULT_MAX_ENTRIES = 1000  # Maximum number of entries kept in the index
+DEFAULT_VERIFY_INTERVAL = 60 * 60  # Seconds between remote existence checks
+
+
+def hash_bytes(data):
+    """
+    Return the SHA-256 hex digest of the given bytes.
+
+    Args:
+        data (bytes): The bytes to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadCache:
+    """
+    A disk-backed content hash to file ID index with TTL and LRU eviction.
+    """
+
+    def __init__(
+        self,
+        index_path,
+        ttl=DEFAULT_TTL,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        verify_interval=DEFAULT_VERIFY_INTERVAL,
+    ):
+        """
+        Initialise the cache and load any existing index from disk.
+
+        Args:
+            index_path (str): The path of the JSON index file.
+            ttl (float): Seconds before an entry expires.
+            max_entries (int): Maximum number of entries kept in the index.
+            verify_interval (float): Seconds between remote existence checks of a file.
+        """
+
+        self.index_path = index_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.verify_interval = verify_interval
+        self.entries = self._load()
+        # Whether the entries have changed since they were last written
+        self.dirty = False
+        # The file IDs of entries removed by this process, kept out of merges
+        self._removed = {}
+        atexit.register(self.flush)
+
+    # --- Private helpers ---
+    def _load(self):
+        """
+        Load the index from disk.
+
+        Returns:
+            dict: The cache entries keyed by content hash (empty if none are stored).
+        """
+
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing or corrupt index, start from scratch
+            return {}
+
+    def _merge(self, stored):
+        """
+        Merge in the entries written to disk by other processes.
+
+        Args:
+            stored (dict): The entries on disk, keyed by content hash.
+        """
+
+        for digest, entry in stored.items():
+            # Do not bring back entries this process removed
+            if self._removed.get(digest) == entry["file_id"]:
+                continue
+            ours = self.entries.get(digest)
+            if ours is None or (
+                ours["file_id"] != entry["file_id"]
+                and entry["created"] > ours["created"]
+            ):
+                self.entries[digest] = entry
+            elif ours["file_id"] == entry["file_id"]:
+                ours["used"] = max(ours["used"], entry["used"])
+                ours["verified"] = max(ours["verified"], entry["verified"])
+
+    def _save(self):
+        """
+        Merge the index with the one on disk and write it back atomically. Each write
+        goes through its own temporary file, so processes do not clobber each other.
+        """
+
+        self._merge(self._load())
+        self._evict(time.time())
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        prefix = os.path.basename(self.index_path) + "."
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=prefix, dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.dirty = False
+
+    def _remove(self, digest):
+        """
+        Remove an entry and write the index.
+
+        Args:
+            digest (str): The content hash of the entry.
+        """
+
+        entry = self.entries.pop(digest, None)
+        if entry is not None:
+            self._removed[digest] = entry["file_id"]
+        self._save()
+
+    def _evict(self, now):
+        """
+        Drop expired entries and then the least recently used entries over the limit.
+
+        Args:
+            now (float): The current time in seconds since the epoch.
+        """
+
+        # Remove expired entries
+        for digest in list(self.entries):
+            if now - self.entries[digest]["created"] > self.ttl:
+                del self.entries[digest]
+
+        # Remove least recently used entries until under the size limit
+        excess = len(self.entries) - self.max_entries
+        if excess > 0:
+            by_use = sorted(self.entries, key=lambda d: self.entries[d]["used"])
+            for digest in by_use[:excess]:
+                del self.entries[digest]
+
+    def _lookup(self, digest, now):
+        """
+        Find the unexpired entry for the given content hash.
+
+        Args:
+            digest (str): The content hash.
+            now (float): The current time in seconds since the epoch.
+
+        Returns:
+            dict: The cache entry.
+            None: If there is no unexpired entry for the hash.
+        """
+
+        entry = self.entries.get(digest)
+        if entry is None:
+            return None
+
+        # Expired entries are treated as misses
+        if now - entry["created"] > self.ttl:
+            self._remove(digest)
+            return None
+        return entry
+
+    def _touch(self, entry, now, verified=False):
+        """
+        Mark an entry as recently used (and optionally as recently verified). The
+        change is written later (see flush).
+
+        Args:
+            entry (dict): The cache entry.
+            now (float): The current time in seconds since the epoch.
+            verified (bool): Whether the remote file was just verified.
+
+        Returns:
+            str: The file ID of the entry.
+        """
+
+        entry["used"] = now
+        if verified:
+            entry["verified"] = now
+        self.dirty = True
+        return entry["file_id"]
+
+    # --- Public methods ---
+    def get(self, client, digest):
+        """
+        Look up the file ID for the given content hash.
+
+        Args:
+            client (OpenAI): The OpenAI client instance, used to verify the file exists.
+            digest (str): The content hash.
+
+        Returns:
+            str: The cached file ID.
+            None: If there is no valid entry for the hash.
+        """
+
+        now = time.time()
+        entry = self._lookup(digest, now)
+        if entry is None:
+            return None
+
+        # Occasionally confirm the remote file still exists
+        verify = now - entry["verified"] > self.verify_interval
+        if verify:
+            # Imported here so loading the cache does not wait for the SDK to import
+            from openai import NotFoundError
+
+            try:
+                client.files.retrieve(entry["file_id"])
+            except NotFoundError:
+                self._remove(digest)
+                return None
+        return self._touch(entry, now, verified=verify)
+
+    async def get_async(self, client, digest):
+        """
+        Look up the file ID for the given content hash using an async client.
+
+        Args:
+            client (AsyncOpenAI): The async OpenAI client instance.
+            digest (str): The content hash.
+
+        Returns:
+            str: The cached file ID.
+            None: If there is no valid entry for the hash.
+        """
+
+        now = time.time()
+        entry = self._lookup(digest, now)
+        if entry is None:
+            return None
+
+        # Occasionally confirm the remote file still exists
+        verify = now - entry["verified"] > self.verify_interval
+        if verify:
+            from openai import NotFoundError
+
+            try:
+                await client.files.retrieve(entry["file_id"])
+            except NotFoundError:
+                self._remove(digest)
+                return None
+        return self._touch(entry, now, verified=verify)
+
+    def digest_for(self, file_id):
+        """
+        Find the content hash of an uploaded file.
+
+        Args:
+            file_id (str): The ID of the uploaded file.
+
+        Returns:
+            str: The content hash.
+            None: If the file is not in the cache.
+        """
+
+        for digest, entry in self.entries.items():
+            if entry["file_id"] == file_id:
+                return digest
+        return None
+
+    def flush(self):
+        """Write the index to disk if it has changed since it was last written."""
+
+        if self.dirty:
+            self._save()
+
+    def put(self, digest, file_id):
+        """
+        Store the file ID for the given content hash.
+
+        Args:
+            digest (str): The content hash.
+            file_id (str): The ID of the uploaded file.
+        """
+
+        now = time.time()
+        self.entries[digest] = {
+            "file_id": file_id,
+            "created": now,
+            "used": now,
+            "verified": now,
+        }
+        self._removed.pop(digest, None)
+        self._save()